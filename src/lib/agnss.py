@@ -0,0 +1,142 @@
+"""
+Assisted GNSS for the L76 receiver of the Pytrack.
+
+The receiver is given hints with PMTK commands (see L76GNSS.write) to shorten the time to first fix:
+  - the UTC time from the board RTC (PMTK740)
+  - the reference position of the last fix (PMTK741)
+  - the predicted orbits of the satellites (EPO) for the current 6 hour period from an EPO file on
+    the SD card (PMTK721, one sentence per satellite)
+EPO files (e.g. MTK14.EPO for 14 days) consist of segments of 6 hours with 32 records of 72 bytes, the
+first 3 bytes of each record (little endian) are the GPS hour of the segment start, the 4th byte is the
+satellite id. The file has to be replaced before its last segment ends, its age is printed.
+"""
+import struct
+
+EPO_FILE = "/sd/MTK14.EPO"
+
+EPO_RECORD_SIZE = 72
+EPO_SATELLITES = 32
+EPO_SEGMENT_SIZE = EPO_RECORD_SIZE * EPO_SATELLITES
+EPO_SEGMENT_HOURS = 6
+
+_GPS_EPOCH = 315964800  # 1980-01-06 in seconds since 1970-01-01
+_LEAP_SECONDS = 18  # GPS - UTC
+
+_MAGIC = 0xA6
+_STATE = ">BI"  # magic, GPS hour of the injected EPO segment
+
+
+def gps_hour(now: int) -> int:
+    """
+    Get the GPS hour (hours since the GPS epoch) of a UTC time in seconds since 1970-01-01.
+    """
+    return (now - _GPS_EPOCH + _LEAP_SECONDS) // 3600
+
+
+class AssistedGNSS:
+
+    def __init__(self, location, epo_file: str = EPO_FILE, state: bytes = None):
+        """
+        :param location: the L76GNSS driver, the hints are sent with its write method
+        :param epo_file: the EPO file
+        :param state: the state from a previous cycle (see get_state), e.g. from the RTC memory
+        """
+        self.location = location
+        self.epo_file = epo_file
+        self.injected_segment = 0  # GPS hour of the segment which was injected last, 0 if none
+        self.sentences = 0  # number of PMTK sentences written by the last inject
+        if state and len(state) == 5:
+            magic, injected_segment = struct.unpack(_STATE, state)
+            if magic == _MAGIC:
+                self.injected_segment = injected_segment
+
+    def get_state(self) -> bytes:
+        return struct.pack(_STATE, _MAGIC, self.injected_segment)
+
+    def _write(self, data: str):
+        self.location.write(data)
+        self.sentences += 1
+
+    def inject_time(self, now: tuple):
+        """
+        :param now: the UTC time as (year, month, day, hours, minutes, seconds, ...)
+        """
+        self._write("PMTK740,{:04d},{:02d},{:02d},{:02d},{:02d},{:02d}".format(*now[:6]))
+
+    def inject_position(self, latitude: float, longitude: float, altitude: float, now: tuple):
+        """
+        :param latitude: the latitude in decimal degrees
+        :param longitude: the longitude in decimal degrees
+        :param altitude: the altitude in m
+        :param now: the UTC time as (year, month, day, hours, minutes, seconds, ...)
+        """
+        self._write("PMTK741,{:.6f},{:.6f},{:.1f},{:04d},{:02d},{:02d},{:02d},{:02d},{:02d}".format(
+            latitude, longitude, altitude, *now[:6]))
+
+    def epo_range(self) -> tuple or None:
+        """
+        Get the period covered by the EPO file.
+        :return: the GPS hours of the start of the first and the end of the last segment, None if there
+                 is no valid EPO file
+        """
+        try:
+            with open(self.epo_file, 'rb') as f:
+                first = f.read(4)
+                size = f.seek(0, 2)
+                f.seek(size - size % EPO_SEGMENT_SIZE - EPO_SEGMENT_SIZE)
+                last = f.read(4)
+        except OSError:
+            return None
+        if size < EPO_SEGMENT_SIZE or len(first) < 4 or len(last) < 4:
+            return None
+        start = first[0] | first[1] << 8 | first[2] << 16
+        end = (last[0] | last[1] << 8 | last[2] << 16) + EPO_SEGMENT_HOURS
+        return start, end
+
+    def inject_epo(self, hour: int) -> bool:
+        """
+        Send the EPO segment covering the given GPS hour, the segment is read record by record.
+        :return: whether the file contains the segment
+        """
+        epo_range = self.epo_range()
+        if epo_range is None or not epo_range[0] <= hour < epo_range[1]:
+            return False
+        segment = (hour - epo_range[0]) // EPO_SEGMENT_HOURS
+        record = bytearray(EPO_RECORD_SIZE)
+        with open(self.epo_file, 'rb') as f:
+            f.seek(segment * EPO_SEGMENT_SIZE)
+            for _ in range(EPO_SATELLITES):
+                if f.readinto(record) != EPO_RECORD_SIZE:
+                    return False
+                words = struct.unpack("<18I", record)
+                self._write("PMTK721,{:X},{}".format(record[3], ",".join("{:X}".format(w) for w in words)))
+        self.injected_segment = epo_range[0] + segment * EPO_SEGMENT_HOURS
+        return True
+
+    def inject(self, now: int, utc: tuple, last_fix: tuple = None, hints: bool = True) -> int:
+        """
+        Send the assistance data the receiver does not have yet.
+        :param now: the current time in seconds since 1970-01-01
+        :param utc: the current UTC time as (year, month, day, hours, minutes, seconds, ...)
+        :param last_fix: the last fix as (time, latitude, longitude, ...), see GNSSManager.last_fix
+        :param hints: whether to send the time and position hints, e.g. not if the receiver kept them in standby
+        :return: the number of sent PMTK sentences
+        """
+        self.sentences = 0
+        if hints:
+            self.inject_time(utc)
+            if last_fix is not None:
+                self.inject_position(last_fix[1], last_fix[2], 0.0, utc)
+
+        hour = gps_hour(now)
+        if hints or not self.injected_segment <= hour < self.injected_segment + EPO_SEGMENT_HOURS:
+            if not self.inject_epo(hour):
+                print("\tno EPO data for the current time in {}".format(self.epo_file))
+        return self.sentences
+
+    def epo_age(self, now: int) -> int or None:
+        """
+        Get the age of the EPO data in hours (since the start of the first segment), None if there is none.
+        """
+        epo_range = self.epo_range()
+        return None if epo_range is None else gps_hour(now) - epo_range[0]
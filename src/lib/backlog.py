@@ -0,0 +1,214 @@
+"""
+Durable store-and-forward queue for data messages and UPPs which have not been accepted by the backend yet.
+
+The records are appended to a data file, each with a header and a commit marker, which is written after the
+record. A record without commit marker (e.g. after a reset while writing) is discarded when the queue is opened.
+The offset of the oldest pending record (head) is appended to an index file whenever records are removed.
+Sent records are only removed from the data file when it is compacted, which rewrites the pending records to a
+new file generation. Files are replaced by writing a temporary file first, so a reset at any time leaves either
+the old or the new file.
+"""
+import os
+import struct
+
+from fileutils import file_exists, recover_file, replace_file
+
+# record kinds
+KIND_DATA_JSON = 1
+KIND_DATA_MSGPACK = 2
+KIND_UPP = 3
+
+_FILE_MAGIC = b"UBQ1"
+_FILE_HEADER = ">4sH"  # magic, generation
+_FILE_HEADER_SIZE = 6
+_RECORD_MAGIC = 0xB1
+_RECORD_HEADER = ">BBI"  # magic, kind, length
+_RECORD_HEADER_SIZE = 6
+_COMMIT = b"\xc3"
+_INDEX_ENTRY = ">HI"  # generation, head offset
+_INDEX_ENTRY_SIZE = 6
+_MAX_INDEX_SIZE = 600  # rewrite the index file when it gets larger
+
+
+def _file_size(path: str) -> int:
+    return os.stat(path)[6]
+
+
+class Backlog:
+
+    def __init__(self, directory: str = "", max_size_kb: int = 1024):
+        """
+        Open the queue, recovering from an interrupted write or compaction.
+        :param directory: the directory of the queue files, e.g. "/sd/", "" for the internal flash
+        :param max_size_kb: the maximal size of the data file, the oldest records are dropped if it is full
+        """
+        self.path = directory + "backlog.dat"
+        self.index_path = directory + "backlog.idx"
+        self.max_size = max_size_kb * 1000
+        self.records = []  # (offset, kind, length) of the pending records, oldest first
+        self.generation = 0
+        self.size = _FILE_HEADER_SIZE  # size of the data file
+        self.index_size = 0  # size of the index file
+        self.dropped = 0  # number of records dropped because the queue was full
+
+        recover_file(self.path)
+        recover_file(self.index_path)
+        if not file_exists(self.path) or not self._load():
+            self._compact()
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def _read_head(self) -> int:
+        """
+        Get the offset of the oldest pending record from the last complete entry of the index file.
+        """
+        if not file_exists(self.index_path):
+            return _FILE_HEADER_SIZE
+        self.index_size = _file_size(self.index_path)
+        entries = self.index_size // _INDEX_ENTRY_SIZE
+        if entries == 0:
+            return _FILE_HEADER_SIZE
+        with open(self.index_path, "rb") as f:
+            f.seek((entries - 1) * _INDEX_ENTRY_SIZE)
+            generation, head = struct.unpack(_INDEX_ENTRY, f.read(_INDEX_ENTRY_SIZE))
+        if generation != self.generation or head < _FILE_HEADER_SIZE:
+            return _FILE_HEADER_SIZE  # the index belongs to the previous generation of the data file
+        return head
+
+    def _load(self) -> bool:
+        """
+        Build the index of the pending records from the data file.
+        :return: whether the data file is intact, if not it needs to be compacted
+        """
+        self.size = _file_size(self.path)
+        with open(self.path, "rb") as f:
+            header = f.read(_FILE_HEADER_SIZE)
+            if len(header) != _FILE_HEADER_SIZE or header[:4] != _FILE_MAGIC:
+                print("!! backlog file {} is corrupt, discarding it".format(self.path))
+                return False
+            self.generation = struct.unpack(_FILE_HEADER, header)[1]
+
+            offset = self._read_head()
+            while offset < self.size:
+                f.seek(offset)
+                header = f.read(_RECORD_HEADER_SIZE)
+                if len(header) != _RECORD_HEADER_SIZE:
+                    return False
+                magic, kind, length = struct.unpack(_RECORD_HEADER, header)
+                end = offset + _RECORD_HEADER_SIZE + length
+                if magic != _RECORD_MAGIC or end >= self.size:
+                    return False
+                f.seek(end)
+                if f.read(1) != _COMMIT:
+                    return False
+                self.records.append((offset, kind, length))
+                offset = end + 1
+        return True
+
+    def _write_index(self):
+        head = self.records[0][0] if self.records else self.size
+        entry = struct.pack(_INDEX_ENTRY, self.generation, head)
+        if self.index_size + _INDEX_ENTRY_SIZE > _MAX_INDEX_SIZE:
+            tmp = self.index_path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(entry)
+            replace_file(tmp, self.index_path)
+            self.index_size = _INDEX_ENTRY_SIZE
+        else:
+            with open(self.index_path, "ab") as f:
+                f.write(entry)
+            self.index_size += _INDEX_ENTRY_SIZE
+
+    def _compact(self):
+        """
+        Rewrite the pending records to a new generation of the data file.
+        """
+        tmp = self.path + ".tmp"
+        generation = (self.generation + 1) & 0xFFFF
+        records = []
+        offset = _FILE_HEADER_SIZE
+        with open(tmp, "wb") as out:
+            out.write(struct.pack(_FILE_HEADER, _FILE_MAGIC, generation))
+            if self.records:
+                with open(self.path, "rb") as f:
+                    for old_offset, kind, length in self.records:
+                        record_size = _RECORD_HEADER_SIZE + length + 1
+                        f.seek(old_offset)
+                        out.write(f.read(record_size))
+                        records.append((offset, kind, length))
+                        offset += record_size
+        replace_file(tmp, self.path)
+        self.generation = generation
+        self.records = records
+        self.size = offset
+        self.index_size = _MAX_INDEX_SIZE  # start a new index file
+        self._write_index()
+
+    def count(self, kind: int) -> int:
+        """
+        Get the number of pending records of a kind.
+        """
+        return sum(1 for _, k, _ in self.records if k == kind)
+
+    def pending_size(self) -> int:
+        """
+        Get the number of bytes the pending records take in the data file.
+        """
+        return sum(_RECORD_HEADER_SIZE + length + 1 for _, _, length in self.records)
+
+    def put(self, kind: int, data: bytes):
+        """
+        Append a record to the queue. It is committed when this returns.
+        :param kind: the record kind (KIND_*)
+        :param data: the record data
+        """
+        record_size = _RECORD_HEADER_SIZE + len(data) + 1
+        if record_size > self.max_size - _FILE_HEADER_SIZE:
+            raise Exception("record of {} bytes does not fit into the backlog".format(len(data)))
+        if self.size + record_size > self.max_size:
+            # drop the oldest records if the pending records do not leave enough space
+            pending = self.pending_size()
+            while pending + record_size > self.max_size - _FILE_HEADER_SIZE:
+                pending -= _RECORD_HEADER_SIZE + self.records.pop(0)[2] + 1
+                self.dropped += 1
+            self._compact()
+
+        try:
+            with open(self.path, "ab") as f:
+                f.write(struct.pack(_RECORD_HEADER, _RECORD_MAGIC, kind, len(data)))
+                f.write(data)
+                f.flush()
+                f.write(_COMMIT)
+        except Exception:
+            self._compact()  # remove the partially written record
+            raise
+        self.records.append((self.size, kind, len(data)))
+        self.size += record_size
+
+    def peek(self, n: int = 1) -> list:
+        """
+        Read the oldest pending records.
+        :param n: the maximal number of records
+        :return: a list of (kind, data) tuples, oldest first
+        """
+        result = []
+        if not self.records:
+            return result
+        with open(self.path, "rb") as f:
+            for offset, kind, length in self.records[:n]:
+                f.seek(offset + _RECORD_HEADER_SIZE)
+                result.append((kind, f.read(length)))
+        return result
+
+    def pop(self, n: int = 1):
+        """
+        Remove the oldest pending records after they were sent.
+        :param n: the number of records to remove
+        """
+        del self.records[:n]
+        head = self.records[0][0] if self.records else self.size
+        if head > self.max_size // 2:
+            self._compact()
+        else:
+            self._write_index()
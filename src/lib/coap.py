@@ -0,0 +1,377 @@
+"""
+Minimal CoAP (RFC 7252) client over UDP with confirmable messages and
+block-wise transfers (RFC 7959) for constrained uplinks such as NB-IoT.
+"""
+import os
+import time
+
+try:
+    import usocket as socket
+except ImportError:
+    import socket
+
+try:
+    from time import ticks_add, ticks_diff, ticks_ms
+except ImportError:  # CPython, e.g. the tools
+    def ticks_ms():
+        return int(time.monotonic() * 1000)
+
+    def ticks_add(ticks, delta):
+        return ticks + delta
+
+    def ticks_diff(a, b):
+        return a - b
+
+
+DEFAULT_PORT = 5683
+
+# message types
+TYPE_CON = 0
+TYPE_NON = 1
+TYPE_ACK = 2
+TYPE_RST = 3
+
+# method and response codes (class << 5 | detail)
+CODE_EMPTY = 0
+CODE_GET = 1
+CODE_POST = 2
+CODE_CONTINUE = (2 << 5) | 31  # 2.31
+
+# option numbers
+OPTION_URI_HOST = 3
+OPTION_URI_PATH = 11
+OPTION_CONTENT_FORMAT = 12
+OPTION_BLOCK2 = 23
+OPTION_BLOCK1 = 27
+OPTION_SIZE1 = 60
+
+# content formats
+FORMAT_OCTET_STREAM = 42
+FORMAT_JSON = 50
+
+PAYLOAD_MARKER = 0xFF
+
+# transmission parameters (RFC 7252, 4.8)
+ACK_TIMEOUT = 2.0
+ACK_RANDOM_FACTOR = 1.5
+MAX_RETRANSMIT = 4
+RESPONSE_TIMEOUT = 30.0  # wait for a separate response after an empty ACK
+
+DEFAULT_BLOCK_SIZE = 512
+MAX_DATAGRAM_SIZE = 1280
+
+
+def code_to_str(code: int) -> str:
+    return "{}.{:02d}".format(code >> 5, code & 0x1F)
+
+
+def encode_uint(value: int) -> bytes:
+    """
+    Encode an unsigned integer option value with the minimal number of bytes.
+    """
+    encoded = bytearray()
+    while value > 0:
+        encoded.insert(0, value & 0xFF)
+        value >>= 8
+    return bytes(encoded)
+
+
+def decode_uint(value: bytes) -> int:
+    result = 0
+    for b in value:
+        result = (result << 8) | b
+    return result
+
+
+def encode_block(num: int, more: bool, size: int) -> bytes:
+    """
+    Encode a Block1/Block2 option value.
+    :param num: the block number
+    :param more: whether more blocks follow
+    :param size: the block size (power of two between 16 and 1024)
+    """
+    szx = 0
+    while (16 << szx) < size:
+        szx += 1
+    return encode_uint((num << 4) | (0x08 if more else 0) | szx)
+
+
+def decode_block(value: bytes) -> (int, bool, int):
+    """
+    Decode a Block1/Block2 option value.
+    :return: (block number, more flag, block size)
+    """
+    v = decode_uint(value)
+    return v >> 4, bool(v & 0x08), 16 << (v & 0x07)
+
+
+def _option_nibble(value: int) -> (int, bytes):
+    if value < 13:
+        return value, b""
+    if value < 269:
+        return 13, bytes([value - 13])
+    value -= 269
+    return 14, bytes([value >> 8, value & 0xFF])
+
+
+def encode_message(msg_type: int, code: int, message_id: int, token: bytes = b"", options: list = (),
+                   payload: bytes = b"") -> bytes:
+    """
+    Encode a CoAP message.
+    :param options: a list of (option number, value bytes), options with the same number keep their order
+                    (e.g. the segments of the Uri-Path)
+    :return: the encoded message
+    """
+    msg = bytearray(4)
+    msg[0] = 0x40 | (msg_type << 4) | len(token)
+    msg[1] = code
+    msg[2] = (message_id >> 8) & 0xFF
+    msg[3] = message_id & 0xFF
+    msg.extend(token)
+
+    # the sort of MicroPython is not stable, the index keeps the order of options with the same number
+    last_number = 0
+    for i in sorted(range(len(options)), key=lambda i: (options[i][0], i)):
+        number, value = options[i]
+        delta, delta_ext = _option_nibble(number - last_number)
+        length, length_ext = _option_nibble(len(value))
+        msg.append((delta << 4) | length)
+        msg.extend(delta_ext)
+        msg.extend(length_ext)
+        msg.extend(value)
+        last_number = number
+
+    if payload:
+        msg.append(PAYLOAD_MARKER)
+        msg.extend(payload)
+    return bytes(msg)
+
+
+def _read_nibble(data, nibble: int, idx: int) -> (int, int):
+    if nibble < 13:
+        return nibble, idx
+    if nibble == 13:
+        return data[idx] + 13, idx + 1
+    if nibble == 14:
+        return ((data[idx] << 8) | data[idx + 1]) + 269, idx + 2
+    raise ValueError("invalid option nibble")
+
+
+def decode_message(data: bytes) -> (int, int, int, bytes, list, bytes):
+    """
+    Decode a CoAP message.
+    Throws ValueError if the message is malformed.
+    :return: (type, code, message id, token, options, payload)
+    """
+    if len(data) < 4 or data[0] >> 6 != 1:
+        raise ValueError("not a CoAP message")
+    msg_type = (data[0] >> 4) & 0x03
+    token_len = data[0] & 0x0F
+    if token_len > 8:
+        raise ValueError("invalid token length")
+    code = data[1]
+    message_id = (data[2] << 8) | data[3]
+    idx = 4 + token_len
+    token = bytes(data[4:idx])
+
+    options = []
+    number = 0
+    payload = b""
+    while idx < len(data):
+        if data[idx] == PAYLOAD_MARKER:
+            payload = bytes(data[idx + 1:])
+            if not payload:
+                raise ValueError("payload marker without payload")
+            break
+        header = data[idx]
+        delta, idx = _read_nibble(data, header >> 4, idx + 1)
+        length, idx = _read_nibble(data, header & 0x0F, idx)
+        number += delta
+        options.append((number, bytes(data[idx:idx + length])))
+        idx += length
+    return msg_type, code, message_id, token, options, payload
+
+
+def get_option(options: list, number: int) -> bytes or None:
+    for n, value in options:
+        if n == number:
+            return value
+    return None
+
+
+class Client:
+    """
+    CoAP client sending confirmable requests to one server.
+    """
+
+    def __init__(self, host: str, port: int = DEFAULT_PORT, secure: bool = False,
+                 block_size: int = DEFAULT_BLOCK_SIZE, ack_timeout: float = ACK_TIMEOUT,
+                 max_retransmit: int = MAX_RETRANSMIT):
+        self.host = host
+        self.port = port
+        self.secure = secure
+        self.block_size = block_size
+        self.ack_timeout = ack_timeout
+        self.max_retransmit = max_retransmit
+        self.sock = None
+        self.message_id = (os.urandom(1)[0] << 8) | os.urandom(1)[0]
+
+        # statistics
+        self.datagrams_sent = 0
+        self.datagrams_received = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.retransmissions = 0
+
+    def _connect(self):
+        if self.sock is not None:
+            return
+        addr = socket.getaddrinfo(self.host, self.port)[0][-1]
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if self.secure:
+            import ussl
+            s = ussl.wrap_socket(s, server_hostname=self.host, dtls=True)
+        s.connect(addr)
+        self.sock = s
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def _next_message_id(self) -> int:
+        self.message_id = (self.message_id + 1) & 0xFFFF
+        return self.message_id
+
+    def _send(self, data: bytes):
+        self.sock.send(data)
+        self.datagrams_sent += 1
+        self.bytes_sent += len(data)
+
+    def _recv(self, timeout: float) -> (int, int, int, bytes, list, bytes):
+        self.sock.settimeout(timeout)
+        data = self.sock.recv(MAX_DATAGRAM_SIZE)
+        self.datagrams_received += 1
+        self.bytes_received += len(data)
+        return decode_message(data)
+
+    def _wait_response(self, message_id: int, token: bytes, timeout: float):
+        """
+        Wait for the response to a confirmable request, either piggybacked in the ACK
+        or as a separate response after an empty ACK.
+        Throws OSError if nothing matching arrives before the timeout, Exception if the request is rejected.
+        Unrelated or malformed datagrams do not extend the timeout.
+        """
+        acked = False
+        deadline = ticks_add(ticks_ms(), int(timeout * 1000))
+        while True:
+            remaining = ticks_diff(deadline, ticks_ms())
+            if remaining <= 0:
+                raise OSError("no CoAP response before the timeout")
+            try:
+                msg_type, code, mid, tok, options, payload = self._recv(remaining / 1000)
+            except ValueError:
+                continue  # ignore malformed datagrams
+
+            if msg_type == TYPE_RST and mid == message_id:
+                raise Exception("CoAP request rejected by server (RST)")
+            if msg_type == TYPE_ACK and mid == message_id:
+                if code == CODE_EMPTY:
+                    if not acked:
+                        # the response follows separately
+                        acked = True
+                        deadline = ticks_add(ticks_ms(), int(RESPONSE_TIMEOUT * 1000))
+                    continue
+                if tok == token:
+                    return code, options, payload
+            elif msg_type in (TYPE_CON, TYPE_NON) and tok == token and code != CODE_EMPTY:
+                if msg_type == TYPE_CON:
+                    self._send(encode_message(TYPE_ACK, CODE_EMPTY, mid))
+                return code, options, payload
+            elif msg_type == TYPE_CON:
+                # unknown confirmable message, reject it
+                self._send(encode_message(TYPE_RST, CODE_EMPTY, mid))
+
+    def _exchange(self, code: int, token: bytes, options: list, payload: bytes) -> (int, list, bytes):
+        """
+        Send a confirmable request and return the response, retransmitting with exponential backoff.
+        """
+        message_id = self._next_message_id()
+        data = encode_message(TYPE_CON, code, message_id, token, options, payload)
+        timeout = self.ack_timeout * (1 + (ACK_RANDOM_FACTOR - 1) * os.urandom(1)[0] / 255)
+        for attempt in range(self.max_retransmit + 1):
+            if attempt > 0:
+                self.retransmissions += 1
+            self._send(data)
+            try:
+                return self._wait_response(message_id, token, timeout)
+            except OSError:
+                pass  # no response before timeout
+            timeout *= 2
+        raise OSError("CoAP request timed out after {} transmissions".format(self.max_retransmit + 1))
+
+    def request(self, code: int, path: str, payload: bytes = b"", options: list = (),
+                content_format: int = None) -> (int, bytes):
+        """
+        Send a request, using block-wise transfer for payloads and responses larger than the block size.
+        :param code: the request method code (CODE_GET, CODE_POST)
+        :param path: the resource path, e.g. "data/json"
+        :param payload: the request payload
+        :param options: additional (option number, value bytes) tuples
+        :param content_format: the content format of the payload
+        :return: the response code, the response payload
+        """
+        self._connect()
+        token = os.urandom(4)
+
+        base_options = [(OPTION_URI_PATH, segment.encode()) for segment in path.split("/") if segment]
+        base_options.extend(options)
+        if content_format is not None:
+            base_options.append((OPTION_CONTENT_FORMAT, encode_uint(content_format)))
+
+        # send the request, block-wise if the payload does not fit into one block
+        bs = self.block_size
+        if len(payload) <= bs:
+            code_resp, resp_options, resp_payload = self._exchange(code, token, base_options, payload)
+        else:
+            num = 0
+            while True:
+                block = payload[num * bs:(num + 1) * bs]
+                more = (num + 1) * bs < len(payload)
+                block_options = base_options + [(OPTION_BLOCK1, encode_block(num, more, bs))]
+                if num == 0:
+                    block_options.append((OPTION_SIZE1, encode_uint(len(payload))))
+                code_resp, resp_options, resp_payload = self._exchange(code, token, block_options, block)
+                if not more or code_resp != CODE_CONTINUE:
+                    break
+                # the server may ask for a smaller block size
+                block1 = get_option(resp_options, OPTION_BLOCK1)
+                if block1 is not None:
+                    _, _, server_bs = decode_block(block1)
+                    if server_bs < bs:
+                        num = (num + 1) * bs // server_bs - 1
+                        bs = server_bs
+                num += 1
+
+        # receive the rest of the response if it is sent block-wise
+        block2 = get_option(resp_options, OPTION_BLOCK2)
+        if block2 is not None:
+            content = bytearray(resp_payload)
+            num, more, size = decode_block(block2)
+            while more:
+                block_options = base_options + [(OPTION_BLOCK2, encode_block(num + 1, False, size))]
+                code_resp, resp_options, resp_payload = self._exchange(code, token, block_options, b"")
+                block2 = get_option(resp_options, OPTION_BLOCK2)
+                if block2 is None:
+                    raise OSError("CoAP block-wise response incomplete")
+                num, more, size = decode_block(block2)
+                content.extend(resp_payload)
+            resp_payload = bytes(content)
+
+        return code_resp, resp_payload
+
+    def get(self, path: str, options: list = ()) -> (int, bytes):
+        return self.request(CODE_GET, path, options=options)
+
+    def post(self, path: str, payload: bytes, options: list = (), content_format: int = None) -> (int, bytes):
+        return self.request(CODE_POST, path, payload, options, content_format)
@@ -1,17 +1,71 @@
 import os
+import time
 import ujson as json
 
+from fileutils import file_exists, replace_file
+
 NIOMON_SERVICE = "https://niomon.{}.ubirch.com"
 DATA_SERVICE = "https://data.{}.ubirch.com/v1"
 BOOTSTRAP_SERVICE = "https://api.console.{}.ubirch.com/ubirch-web-ui/api/v1/devices/bootstrap"
 IDENTITY_SERVICE = "https://identity.{}.ubirch.com/api/certs/v1/csr/register"
 
+DEFAULT_CONFIG = "default_config.json"
+USER_CONFIG = "config.json"
+SD_CONFIG = "/sd/config.txt"
+CONFIG_CACHE = "config.cache"
+
+# schema of the configuration: key -> (type(s), allowed values or (min, max) range or None, may be null)
+CONFIG_SCHEMA = {
+    "connection": (str, ("wifi", "nbiot"), False),
+    "apn": (str, None, False),
+    "band": (int, (1, 85), True),
+    "nbiot_attach_timeout": (int, (1, 3600), False),
+    "nbiot_connect_timeout": (int, (1, 3600), False),
+    "nbiot_extended_attach_timeout": (int, (1, 3600), False),
+    "nbiot_extended_connect_timeout": (int, (1, 3600), False),
+    "watchdog_timeout": (int, (10, 86400), False),
+    "watchdog_extended_timeout": (int, (10, 86400), False),
+    "networks": (dict, None, False),
+    "board": (str, ("pysense", "pytrack"), False),
+    "password": (str, None, False),
+    "env": (str, None, False),
+    "niomon": (str, None, False),
+    "data": (str, None, False),
+    "bootstrap": (str, None, False),
+    "identity": (str, None, False),
+    "CSR_country": (str, None, False),
+    "CSR_organization": (str, None, False),
+    "interval": (int, (1, 31 * 86400), False),
+    "sample_interval": (int, (1, 31 * 86400), True),
+    "data_format": (str, ("json", "msgpack"), False),
+    "send_on_delta": (dict, None, True),
+    "max_silence": (int, (1, 31 * 86400), False),
+    "wake_on_motion": (bool, None, False),
+    "motion_threshold": (int, (63, 4000), False),  # resolution and full scale of the accelerometer (4g)
+    "motion_duration": (int, (160, 40800), False),  # resolution and maximum at 50 Hz
+    "motion_rate_limit": (int, (0, 86400), False),
+    "gnss_timeout": (int, (1, 600), False),
+    "gnss_fix_quality": (int, (1, 8), False),  # GGA fix quality: 1 GPS, 2 DGPS, ...
+    "gnss_max_hdop": ((int, float), (0.5, 50), False),
+    "gnss_standby": (bool, None, False),
+    "agnss": (bool, None, False),
+    "time_sync_max_error": (int, (0, 3600), False),
+    "backlog_size_kb": (int, (1, 1000000), False),
+    "backlog_batch_size": (int, (1, 1000), False),
+    "transport": (str, ("http", "coap"), False),
+    "coap_gateway": (str, None, False),
+    "debug": (bool, None, False)
+}
 
-def load_config(sd_card_mounted: bool = False) -> dict:
+
+def load_config(sd_card_mounted: bool = False, use_cache: bool = True) -> dict:
     """
     Load available configurations. First set default configuration (see "default_config.json"),
     then overwrite defaults with configuration from user config file ("config.json")
-    the config file should be placed in the same directory as this file
+    the config file should be placed in the same directory as this file, and then with the
+    configuration from the SD card ("config.txt").
+    The merged and validated configuration is compiled into a cache file ("config.cache"), which is
+    loaded instead as long as the sizes and modification times of the config files do not change
     {
         "connection": "<'wifi' or 'nbiot'>",
         "apn": "<APN for NB IoT connection",
@@ -34,36 +88,128 @@ def load_config(sd_card_mounted: bool = False) -> dict:
         "bootstrap": "<URL of bootstrap service>",
         "CSR_country": "DE",
         "CSR_organization": "ubirch GmbH",
-        "interval": <measure interval in seconds>,
+        "interval": <measure and send interval in seconds>,
+        "sample_interval": <measure interval in seconds for batching mode (only sending every 'interval'), or null>,
+        "data_format": "<'json' or 'msgpack', format of the data messages>",
+        "send_on_delta": {"<channel, e.g. 'T'>": <deadband>, ...} or null, only send measurements which changed,
+        "max_silence": <int in seconds, maximal time without sending a measurement in send-on-delta mode>,
+        "wake_on_motion": <true or false, also wake up for a measurement on accelerometer activity>,
+        "motion_threshold": <int in mg, acceleration threshold of the activity detection>,
+        "motion_duration": <int in ms, duration above the threshold to detect activity>,
+        "motion_rate_limit": <int in seconds, minimal time between measurements triggered by motion>,
+        "gnss_timeout": <int in seconds, maximal time to wait for a GNSS fix (pytrack)>,
+        "gnss_fix_quality": <int, GGA fix quality at which the GNSS acquisition ends, 1 (GPS) or 2 (DGPS)>,
+        "gnss_max_hdop": <number, HDOP at which the GNSS acquisition ends>,
+        "gnss_standby": <true or false, keep the GNSS receiver in standby during deepsleep>,
+        "agnss": <true or false, send assistance data (time, last position, EPO file from the SD card) to the GNSS receiver>,
+        "time_sync_max_error": <int in seconds, only sync the time if the predicted error of the board time is larger, 0 to always sync>,
+        "backlog_size_kb": <int in KB, maximal size of the backlog of unsent data messages and UPPs (64 KB on flash)>,
+        "backlog_batch_size": <int, maximal number of backlog records sent per interval>,
+        "transport": "<'http' or 'coap'>",
+        "coap_gateway": "<URL of the CoAP gateway, 'coap://<host>[:<port>]' or 'coaps://<host>[:<port>]' for DTLS>",
         "debug": <true or false>
     }
-    :param user_config: the user config file
+    :param sd_card_mounted: whether to load the config file from the SD card
+    :param use_cache: whether to use the compiled configuration, if false it is compiled again
     :return: a dict with the available configurations
     """
 
+    # use the compiled configuration if the config files did not change since it was compiled
+    t_start = time.ticks_ms()
+    sources = [DEFAULT_CONFIG, USER_CONFIG] + ([SD_CONFIG] if sd_card_mounted else [])
+    fingerprint = _fingerprint(sources)
+    if use_cache:
+        cached = _load_cache(fingerprint)
+        if cached is not None:
+            cfg, compile_ms = cached
+            load_ms = time.ticks_diff(time.ticks_ms(), t_start)
+            print("\tconfig loaded from cache in {} ms (compiling took {} ms)".format(load_ms, compile_ms))
+            return cfg
+
+    cfg = compile_config(sources)
+    compile_ms = time.ticks_diff(time.ticks_ms(), t_start)
+    try:
+        _store_cache(fingerprint, cfg, compile_ms)
+    except OSError as e:
+        print("\tcould not write config cache: {}".format(repr(e)))
+    print("\tconfig compiled in {} ms".format(compile_ms))
+    return cfg
+
+
+def _file_stat(path: str) -> tuple or None:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat[6], stat[8]  # size, modification time
+
+
+def _fingerprint(sources: list) -> str:
+    """
+    Fingerprint of the config files from their sizes and modification times, without reading them.
+    """
+    parts = []
+    for path in sources:
+        stat = _file_stat(path)
+        parts.append("{}:{}:{}".format(path, *stat) if stat is not None else path + ":-")
+    return ";".join(parts)
+
+
+def _load_cache(fingerprint: str) -> tuple or None:
+    """
+    Load the compiled configuration with a single read.
+    :return: the configuration and the time it took to compile it in ms, or None if there
+             is no valid cache for the fingerprint
+    """
+    try:
+        with open(CONFIG_CACHE, 'r') as c:
+            content = c.read()
+    except OSError:
+        return None
+    try:
+        header, body = content.split("\n", 1)
+        cached_fingerprint, compile_ms = header.rsplit("|", 1)
+        if cached_fingerprint != fingerprint:
+            return None
+        return json.loads(body), int(compile_ms)
+    except ValueError:
+        return None  # incomplete or corrupt cache file
+
+
+def _store_cache(fingerprint: str, cfg: dict, compile_ms: int):
+    tmp = CONFIG_CACHE + ".tmp"
+    with open(tmp, 'w') as c:
+        c.write("{}|{}\n".format(fingerprint, compile_ms))
+        c.write(json.dumps(cfg))
+    replace_file(tmp, CONFIG_CACHE)
+
+
+def compile_config(sources: list) -> dict:
+    """
+    Merge the config files, validate the result and derive the service URLs.
+    :param sources: the config files, later files overwrite the values of earlier ones,
+                    all but the first are optional
+    :return: the configuration
+    """
     # load default config
-    default_config = "default_config.json"
-    with open(default_config, 'r') as c:
+    with open(sources[0], 'r') as c:
         cfg = json.load(c)
 
-    # overwrite default config with user config if there is one
-    user_config = "config.json"
-    if user_config in os.listdir():
-        with open(user_config, 'r') as c:
-            user_cfg = json.load(c)
-            cfg.update(user_cfg)
-
-    # overwrite existing config with config from sd card if there is one
-    sd_config = 'config.txt'
-    if sd_card_mounted and sd_config in os.listdir('/sd'):
-        with open('/sd/' + sd_config, 'r') as c:
-            api_config = json.load(c)
-            cfg.update(api_config)
+    # overwrite default config with user config and config from sd card if there are any
+    for path in sources[1:]:
+        if not file_exists(path):
+            continue
+        with open(path, 'r') as c:
+            cfg.update(json.load(c))
 
     # ensure that the ubirch backend auth token is set
     if cfg['password'] is None:
         raise Exception("missing auth token")
 
+    # the CoAP transport needs a gateway which forwards the requests to the backend
+    if cfg['transport'] == "coap" and 'coap_gateway' not in cfg:
+        raise Exception("missing CoAP gateway URL")
+
     # set default values for unset service URLs
     if 'niomon' not in cfg:
         cfg['niomon'] = NIOMON_SERVICE.format(cfg['env'])
@@ -76,8 +222,8 @@ def load_config(sd_card_mounted: bool = False) -> dict:
     # and set remaining URLs
     if 'data' not in cfg:
         cfg['data'] = DATA_SERVICE.format(cfg['env'])
-    else:
-        cfg['data'] = cfg['data'].rstrip("/msgPack")
+    elif cfg['data'].endswith("/msgPack"):
+        cfg['data'] = cfg['data'][:-len("/msgPack")]
 
     if 'bootstrap' not in cfg:
         cfg['bootstrap'] = BOOTSTRAP_SERVICE.format(cfg['env'])
@@ -85,4 +231,39 @@ def load_config(sd_card_mounted: bool = False) -> dict:
     if 'identity' not in cfg:
         cfg['identity'] = IDENTITY_SERVICE.format(cfg['env'])
 
+    validate_config(cfg)
     return cfg
+
+
+def validate_config(cfg: dict):
+    """
+    Check the types and ranges of the configuration values (see CONFIG_SCHEMA).
+    Unknown keys are ignored.
+    :raises Exception: if a value is invalid
+    """
+    for key, (types, allowed, nullable) in CONFIG_SCHEMA.items():
+        if key not in cfg:
+            continue
+        value = cfg[key]
+        if value is None:
+            if nullable:
+                continue
+            raise Exception("invalid configuration: \"{}\" must be set".format(key))
+        # bool is a subclass of int, but true/false is no valid number
+        if not isinstance(value, types) or (types is int and isinstance(value, bool)):
+            raise Exception("invalid configuration: \"{}\" has the wrong type: {}".format(key, repr(value)))
+        if allowed is None:
+            continue
+        if types is str:
+            if value not in allowed:
+                raise Exception("invalid configuration: \"{}\" must be one of {}, not \"{}\"".format(
+                    key, ", ".join(allowed), value))
+        elif not allowed[0] <= value <= allowed[1]:
+            raise Exception("invalid configuration: \"{}\" must be in the range {} to {}, not {}".format(
+                key, allowed[0], allowed[1], value))
+
+    if cfg.get('send_on_delta'):
+        for channel, deadband in cfg['send_on_delta'].items():
+            if not isinstance(deadband, (int, float)) or isinstance(deadband, bool) or deadband < 0:
+                raise Exception("invalid configuration: deadband of \"{}\" in \"send_on_delta\" must be a "
+                                "non-negative number".format(channel))
@@ -25,21 +25,35 @@ class NB_IoT(Connection):
         self.band = band
         self.attachtimeout = attachtimeout
         self.connecttimeout = connecttimeout
-
-    def attach(self):
-        if self.lte.isattached():
+        self.attach_started = None  # time the attach was started, while attaching
+
+    def start_attach(self):
+        """
+        Start attaching to the network, the modem attaches in the background.
+        attach() and connect() wait for the attach to finish.
+        """
+        if self.attach_started is not None or self.lte.isattached():
             return
 
-        sys.stdout.write("\tattaching to the NB-IoT network")
         # we need to use lte.attach method with legacyattach=False, because
         # the pycom firmware fails to parse the CEREG-responses in firmware
         # v1.20.2.r2 and the following
         self.lte.attach(band=self.band, apn=self.apn,legacyattach=False)
-        i = 0
+        self.attach_started = time.time()
+
+    def attach(self):
+        if self.lte.isattached():
+            self.attach_started = None
+            return
+
+        sys.stdout.write("\tattaching to the NB-IoT network")
+        self.start_attach()
+        i = 0 if self.attach_started is None else time.time() - self.attach_started  # might have been started before
         while not self.lte.isattached() and i < self.attachtimeout:
             i += 1
             time.sleep(1.0)
             sys.stdout.write(".")
+        self.attach_started = None
         if not self.lte.isattached():
             raise OSError("!! unable to attach to NB-IoT network.")
 
@@ -0,0 +1,101 @@
+"""
+Send-on-delta filter: decides whether a new measurement differs enough from the last sent one
+to be signed and sent. The state is small enough to be kept in the RTC memory during deepsleep.
+"""
+import struct
+
+_MAGIC = 0xDB01
+_HEADER = ">HHIHI"  # magic, channel checksum, time of the last sent measurement, suppressed since, suppressed total
+_HEADER_SIZE = 14
+
+_NAN = float("nan")
+
+
+def _is_nan(value: float) -> bool:
+    return value != value
+
+
+def _channel_checksum(channels: list) -> int:
+    checksum = 0
+    for name in channels:
+        for c in name.encode():
+            checksum = ((checksum << 5) + checksum + c) & 0xFFFF
+    return checksum
+
+
+class DeltaFilter:
+
+    def __init__(self, thresholds: dict, max_silence: int, state: bytes = None):
+        """
+        :param thresholds: the deadband per channel, a measurement is sent if the value of a channel
+                           differs at least this much from the last sent value
+        :param max_silence: the maximal time in seconds without sending a measurement (heartbeat)
+        :param state: the state from a previous cycle (see get_state), e.g. from the RTC memory
+        """
+        self.channels = sorted(thresholds)
+        self.thresholds = [thresholds[c] for c in self.channels]
+        self.max_silence = max_silence
+        self.checksum = _channel_checksum(self.channels)
+
+        self.last_values = None  # last sent values per channel, None if there is no valid state
+        self.last_time = 0
+        self.suppressed = 0  # number of suppressed measurements since the last sent one
+        self.suppressed_total = 0
+        if state:
+            self._load(state)
+
+    def _load(self, state: bytes):
+        size = _HEADER_SIZE + 4 * len(self.channels)
+        if len(state) < size:
+            return
+        magic, checksum, last_time, suppressed, suppressed_total = struct.unpack(_HEADER, state[:_HEADER_SIZE])
+        if magic != _MAGIC or checksum != self.checksum:
+            return  # no state or the channels were changed
+        self.last_values = list(struct.unpack(">{}f".format(len(self.channels)), state[_HEADER_SIZE:size]))
+        self.last_time = last_time
+        self.suppressed = suppressed
+        self.suppressed_total = suppressed_total
+
+    def get_state(self) -> bytes:
+        values = self.last_values or [_NAN] * len(self.channels)
+        return struct.pack(_HEADER, _MAGIC, self.checksum, self.last_time, min(self.suppressed, 0xFFFF),
+                           self.suppressed_total) + struct.pack(">{}f".format(len(self.channels)), *values)
+
+    def changed(self, data: dict, now: int) -> bool:
+        """
+        Check if a measurement has to be sent: a value crossed its deadband, or the maximal
+        silence period has passed, or there is no previous measurement.
+        :param data: the measurement
+        :param now: the current time in seconds
+        """
+        if self.last_values is None or now - self.last_time >= self.max_silence or now < self.last_time:
+            return True
+        for i, channel in enumerate(self.channels):
+            value = data.get(channel)
+            value = _NAN if value is None else value
+            last = self.last_values[i]
+            if _is_nan(value) or _is_nan(last):
+                if _is_nan(value) != _is_nan(last):
+                    return True
+            elif abs(value - last) >= self.thresholds[i]:
+                return True
+        return False
+
+    def sent(self, data: dict, now: int):
+        """
+        Remember a measurement as sent.
+        """
+        values = []
+        for channel in self.channels:
+            value = data.get(channel)
+            values.append(_NAN if value is None else value)
+        self.last_values = values
+        self.last_time = now
+        self.suppressed = 0
+
+    def suppress(self):
+        """
+        Count a measurement which is not sent.
+        """
+        self.suppressed += 1
+        self.suppressed_total += 1
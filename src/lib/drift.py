@@ -0,0 +1,154 @@
+"""
+Drift model of the board RTC, to only synchronize the time when it is needed.
+
+The RTC of the GPy keeps running during deepsleep, but drifts. The offsets found at the time syncs
+(see realtimeclock.sync_time) are the error of the drift rate estimated so far. As the offsets have a
+resolution of a second, they are accumulated over at least _MIN_SAMPLE_INTERVAL (hours) before they
+update the rate estimate. Between the syncs the estimated drift is compensated at every wake-up and
+the error of the board time is predicted from the deviation of the rate estimates, which is at least
+the tolerance of a crystal, and the time since the last sync. A sync is only needed if the predicted
+error exceeds the configured bound, or after _MAX_SYNC_INTERVAL.
+The state is kept in the NVS, it survives resets and power cycles.
+"""
+import pycom
+
+_ALPHA = 0.3  # weight of a new rate sample
+_RESOLUTION = 1  # resolution of the board time and the time sources in seconds
+_MIN_DEVIATION = 50e-6  # minimal deviation of the rate estimate, the tolerance of a RTC crystal
+# minimal time the offsets are accumulated for a rate sample, the resolution of the offsets
+# (at both ends) makes an error of at most half the minimal deviation then
+_MIN_SAMPLE_INTERVAL = int(2 * 2 * _RESOLUTION / _MIN_DEVIATION)  # about 22 h
+_MAX_SYNC_INTERVAL = 7 * 24 * 3600  # maximal time between syncs in seconds
+_BIAS = 0x80000000  # the NVS stores unsigned values
+
+_NVS_KEYS = ("drift_sync", "drift_corr", "drift_rate", "drift_dev", "drift_n", "drift_ms", "drift_saved",
+             "drift_sstart", "drift_soffset", "drift_resid")
+
+
+class DriftModel:
+
+    def __init__(self, max_error: int):
+        """
+        :param max_error: the maximal predicted error of the board time in seconds without a sync,
+                          0 to sync every time
+        """
+        self.max_error = max_error
+        self.last_sync = 0  # time of the last sync in seconds since 1970, 0 if there was none
+        self.last_correction = 0  # time up to which the drift is compensated
+        self.rate = 0.0  # estimated drift in seconds per second the board time is behind
+        self.deviation = 0.0  # mean absolute error of the rate estimates
+        self.samples = 0  # number of rate samples
+        self.sync_ms = 0  # mean duration of a sync in ms
+        self.saved_ms = 0  # total time saved by skipped syncs in ms
+        self.sample_start = 0  # time of the sync the offsets of the next rate sample are accumulated from
+        self.sample_offset = 0  # drift not covered by the estimated rate since sample_start in seconds
+        self.residual = 0  # offset of the board time which was not corrected at the last sync (within tolerance)
+        self._stored = ()
+        self._load()
+
+    def _values(self) -> tuple:
+        return (self.last_sync, self.last_correction, int(self.rate * 1e9) + _BIAS, int(self.deviation * 1e9),
+                self.samples, self.sync_ms, min(self.saved_ms, 0xFFFFFFFF), self.sample_start,
+                self.sample_offset + _BIAS, self.residual + _BIAS)
+
+    def _load(self):
+        values = []
+        try:
+            for key in _NVS_KEYS:
+                values.append(pycom.nvs_get(key))
+        except ValueError:
+            return  # not set
+        if None in values:
+            return
+        self.last_sync, self.last_correction, rate, deviation, self.samples, self.sync_ms, self.saved_ms, \
+            self.sample_start, sample_offset, residual = values
+        self.rate = (rate - _BIAS) / 1e9
+        self.deviation = deviation / 1e9
+        self.sample_offset = sample_offset - _BIAS
+        self.residual = residual - _BIAS
+        self._stored = tuple(values)
+
+    def store(self):
+        """
+        Write the changed values to the NVS.
+        """
+        values = self._values()
+        for i, (key, value) in enumerate(zip(_NVS_KEYS, values)):
+            if i >= len(self._stored) or self._stored[i] != value:
+                pycom.nvs_set(key, value)
+        self._stored = values
+
+    def compensate(self, now: int) -> int:
+        """
+        Get the estimated drift since the last compensation in whole seconds, it is counted as compensated.
+        Store the model right after applying the correction, so it is not applied again after a reset.
+        :param now: the board time in seconds since 1970
+        :return: the seconds to add to the board time
+        """
+        if self.samples == 0 or self.last_correction == 0 or now <= self.last_correction:
+            return 0
+        drift = self.rate * (now - self.last_correction)
+        seconds = int(drift)
+        if seconds == 0:
+            return 0
+        # keep the fraction for the next compensation
+        self.last_correction = now - int((drift - seconds) / self.rate)
+        return seconds
+
+    def predicted_error(self, now: int) -> float or None:
+        """
+        Get the predicted error of the board time in seconds, None if it can not be predicted yet.
+        """
+        if self.samples == 0:
+            return None
+        deviation = max(self.deviation, _MIN_DEVIATION)
+        return deviation * max(0, now - self.last_sync) + abs(self.residual) + _RESOLUTION
+
+    def sync_needed(self, now: int) -> bool:
+        error = self.predicted_error(now)
+        return error is None or error > self.max_error or now - self.last_sync >= _MAX_SYNC_INTERVAL
+
+    def add_sync(self, now: int, offset: int = None, duration_ms: int = None, corrected: bool = True):
+        """
+        Update the model with the offset of a sync.
+        :param now: the board time after the sync in seconds since 1970
+        :param offset: the offset of the board time to the time source before the sync, positive if
+                       the board time was behind, None if the board time was not valid before or the
+                       offset is not accurate enough (e.g. from the HTTP Date header)
+        :param duration_ms: the duration of the sync in ms, e.g. the wait for the NTP response
+        :param corrected: whether the board time was set to the time of the source, it is not if the
+                          offset is within the tolerance of the source
+        """
+        if offset is None or self.last_sync == 0 or self.sample_start == 0:
+            # start accumulating the offsets for the next rate sample
+            self.sample_start = now
+            self.sample_offset = 0
+        else:
+            # the offset includes the residual of the last sync, which is not drift since then
+            self.sample_offset += offset - self.residual
+            elapsed = now - self.sample_start
+            if elapsed >= _MIN_SAMPLE_INTERVAL:
+                error = self.sample_offset / elapsed  # the error of the compensated rate
+                if self.samples == 0:
+                    self.rate = error
+                    self.deviation = abs(error)
+                else:
+                    self.rate += _ALPHA * error
+                    self.deviation = (1 - _ALPHA) * self.deviation + _ALPHA * abs(error)
+                self.deviation = max(self.deviation, _RESOLUTION / elapsed, _MIN_DEVIATION)
+                self.samples += 1
+                self.sample_start = now
+                self.sample_offset = 0
+        self.residual = 0 if offset is None or corrected else offset
+        if duration_ms is not None:
+            self.sync_ms = duration_ms if self.sync_ms == 0 else int((1 - _ALPHA) * self.sync_ms + _ALPHA * duration_ms)
+        self.last_sync = now
+        self.last_correction = now
+
+    def skip(self) -> int:
+        """
+        Count a skipped sync.
+        :return: the time saved in ms (the mean duration of a sync)
+        """
+        self.saved_ms += self.sync_ms
+        return self.sync_ms
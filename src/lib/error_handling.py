@@ -1,8 +1,10 @@
 import machine
 import os
 import pycom
+import struct
 import sys
 import time
+import uio
 
 LED_OFF = 0x000000
 
@@ -28,11 +30,57 @@ LED_BLUE_BRIGHT      = 0x0000ff
 LED_TURQUOISE_BRIGHT = 0x40E0D0
 LED_PINK_BRIGHT      = 0xFF1493
 
+# time in seconds an error or warning colour is shown before the LED follows set_led again
+LED_ERROR_TIME = 3
+LED_WARNING_TIME = 1
+
+_led_color = LED_OFF  # colour of the last set_led call
+_led_alarm = None  # timer alarm which ends the signalling of an error or warning
+_led_restore = False  # whether set_led was called while signalling
+
+
 def set_led(led_color):
+    global _led_color, _led_restore
+    _led_color = led_color
+    if _led_alarm is not None:
+        _led_restore = True  # show the colour when the signalling ends
+        return
     pycom.heartbeat(False)  # disable blue heartbeat blink
     pycom.rgbled(led_color)
 
 
+def _end_led_signal(alarm):
+    global _led_alarm
+    _led_alarm = None
+    if _led_restore:
+        pycom.rgbled(_led_color)
+
+
+def signal_led(led_color, duration: float, restore: bool = True):
+    """
+    Show a colour for some time without blocking, set_led calls meanwhile take effect afterwards.
+    :param duration: the time to show the colour in seconds
+    :param restore: restore the colour of the last set_led call afterwards, else only if set_led
+                    was called meanwhile (keeps an error colour if the program blocks after the error)
+    """
+    global _led_alarm, _led_restore
+    if _led_alarm is not None:
+        _led_alarm.cancel()
+    pycom.heartbeat(False)
+    pycom.rgbled(led_color)
+    _led_restore = restore
+    _led_alarm = machine.Timer.Alarm(_end_led_signal, duration)
+
+
+def end_led_signal():
+    """
+    End the signalling of an error or warning now, e.g. before deepsleep.
+    """
+    if _led_alarm is not None:
+        _led_alarm.cancel()
+        _end_led_signal(None)
+
+
 def print_to_console(error: str or Exception):
     if isinstance(error, Exception):
         sys.print_exception(error)
@@ -46,31 +94,107 @@ class ErrorHandler:
         self.logfile = None
         if file_logging_enabled:
             self.logfile = FileLogger(max_file_size_kb=max_file_size_kb, log_to_sd_card=sd_card)
-
-    def log(self, error: str or Exception, led_color: int, reset: bool = False):
-        set_led(led_color)
+        self.counters = [0] * (SEVERITY_FATAL + 1)  # number of logged records per severity
+
+    def log(self, error: str or Exception, led_color: int, reset: bool = False, severity: int = None):
+        """
+        Log an error or warning to the console and the log file and signal it with the LED.
+        Only fatal errors (reset) block, to show the LED colour before the device is reset.
+        Warnings and errors return immediately, the LED shows their colour for a few seconds.
+        :param error: the error message or exception
+        :param led_color: the colour to signal the error with
+        :param reset: reset the device after logging the error
+        :param severity: the severity (SEVERITY_*), defaults to SEVERITY_FATAL with reset, else SEVERITY_ERROR
+        """
+        if severity is None:
+            severity = SEVERITY_FATAL if reset else SEVERITY_ERROR
+        self.counters[severity] += 1
         print_to_console(error)
         if self.logfile is not None:
-            self.logfile.log(error)
-        machine.idle()
-        time.sleep(3)
+            self.logfile.log(error, severity)
+
         if reset:
+            end_led_signal()
+            set_led(led_color)
+            machine.idle()
+            time.sleep(3)
             print(">> Resetting device...")
             time.sleep(1)
             machine.reset()
+        elif severity >= SEVERITY_ERROR:
+            signal_led(led_color, LED_ERROR_TIME, restore=False)
+        elif severity == SEVERITY_WARNING:
+            signal_led(led_color, LED_WARNING_TIME)
+
+    def get_counters(self) -> dict:
+        """
+        Get the number of logged records per severity since the start.
+        """
+        return {
+            "info": self.counters[SEVERITY_INFO],
+            "warning": self.counters[SEVERITY_WARNING],
+            "error": self.counters[SEVERITY_ERROR],
+            "fatal": self.counters[SEVERITY_FATAL]
+        }
+
+    def flush(self):
+        """
+        Write buffered log records to the log file, call this before deepsleep.
+        """
+        if self.logfile is not None:
+            self.logfile.flush()
+
+
+# severities of log records
+SEVERITY_INFO = 1
+SEVERITY_WARNING = 2
+SEVERITY_ERROR = 3
+SEVERITY_FATAL = 4
+
+# binary ring log, see FileLogger
+LOG_SEGMENTS = 4
+LOG_MAGIC = b"ULG1"
+LOG_HEADER_SIZE = 8  # magic, segment sequence number
+LOG_RECORD_HEADER = ">IBHB"  # timestamp, severity, code, payload length
+LOG_BUFFER_SIZE = 512  # flush buffered records when they get larger
 
 
 class FileLogger:
+    """
+    Ring log of compact binary records, made of LOG_SEGMENTS segment files. When the current segment
+    is full, logging continues in the oldest segment, so the log always holds the newest records.
+    Records below SEVERITY_ERROR are buffered in RAM until flush() is called (e.g. before deepsleep).
+    Use tools/decode_log.py to convert the log to text.
+    """
 
     def __init__(self, max_file_size_kb: int = 10, log_to_sd_card: bool = False):
         # set up error logging to log file
-        self.rtc = machine.RTC()
         self.MAX_FILE_SIZE = max_file_size_kb * 1000  # in bytes
-        self.logfile = ('/sd/' if log_to_sd_card else '') + 'log.txt'
-        with open(self.logfile, 'a') as f:
-            self.file_position = f.tell()
+        self.segment_size = self.MAX_FILE_SIZE // LOG_SEGMENTS
+        self.logfile = ('/sd/' if log_to_sd_card else '') + 'log{}.bin'
+        self.buffer = bytearray()
+
+        # continue in the segment with the highest sequence number
+        self.segment = 0
+        self.sequence = -1
+        for i in range(LOG_SEGMENTS):
+            try:
+                with open(self.logfile.format(i), 'rb') as f:
+                    header = f.read(LOG_HEADER_SIZE)
+            except OSError:
+                continue
+            if len(header) == LOG_HEADER_SIZE and header[:4] == LOG_MAGIC:
+                sequence = struct.unpack(">I", header[4:])[0]
+                if sequence > self.sequence:
+                    self.segment, self.sequence = i, sequence
+        if self.sequence < 0:
+            self._start_segment(0, 0)
+        else:
+            self.file_position = os.stat(self.logfile.format(self.segment))[6]
+
         print("++ file logging enabled")
-        print("\tfile: \"{}\"".format(self.logfile))
+        print("\tfile: \"{}\" (segment {} of {})".format(self.logfile.format(self.segment), self.segment + 1,
+                                                         LOG_SEGMENTS))
         print("\tcurrent size:  {: 9.2f} KB".format(self.file_position / 1000.0))
         print("\tmaximal size:  {: 9.2f} KB".format(self.MAX_FILE_SIZE / 1000.0))
         print("\tfree flash memory:{: 6d} KB".format(os.getfree('/flash')))
@@ -78,23 +202,46 @@ class FileLogger:
             print("\tfree SD memory:   {: 6d} MB".format(int(os.getfree('/sd') / 1000)))
         print("")
 
-    def log(self, error: str or Exception):
-        # stop logging to file once file reached its max size
-        if self.file_position >= self.MAX_FILE_SIZE:
+    def _start_segment(self, segment: int, sequence: int):
+        with open(self.logfile.format(segment), 'wb') as f:
+            f.write(LOG_MAGIC + struct.pack(">I", sequence))
+        self.segment = segment
+        self.sequence = sequence
+        self.file_position = LOG_HEADER_SIZE
+
+    def log(self, error: str or Exception, severity: int = SEVERITY_ERROR, code: int = 0):
+        """
+        Log an error message or exception.
+        :param severity: the severity of the record (SEVERITY_*)
+        :param code: an error code, for exceptions with an errno this is used if no code is given
+        """
+        if isinstance(error, Exception):
+            if code == 0 and isinstance(error, OSError) and error.args and isinstance(error.args[0], int):
+                code = error.args[0]
+            # keep the end of the traceback, with the innermost call and the error message
+            trace = uio.StringIO()
+            sys.print_exception(error, trace)
+            payload = trace.getvalue().encode()[-255:]
+        else:
+            payload = error.encode()[:255]
+        record = struct.pack(LOG_RECORD_HEADER, int(time.time()), severity, code & 0xFFFF, len(payload)) + payload
+
+        # continue in the oldest segment if the current one is full
+        if self.file_position + len(self.buffer) + len(record) > self.segment_size:
+            self.flush()
+            self._start_segment((self.segment + 1) % LOG_SEGMENTS, self.sequence + 1)
+
+        self.buffer.extend(record)
+        if severity >= SEVERITY_ERROR or len(self.buffer) >= LOG_BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the buffered records to the log file.
+        """
+        if not self.buffer:
             return
-
-        # log error message to file
-        with open(self.logfile, 'a') as f:
-            # set file to recent position
-            f.seek(self.file_position, 0)
-
-            # log error message and traceback if error is an exception
-            t = self.rtc.now()
-            f.write('({:04d}.{:02d}.{:02d} {:02d}:{:02d}:{:02d}) '.format(t[0], t[1], t[2], t[3], t[4], t[5]))
-            if isinstance(error, Exception):
-                sys.print_exception(error, f)
-            else:
-                f.write(error + "\n")
-
-            # remember current file position
-            self.file_position = f.tell()
+        with open(self.logfile.format(self.segment), 'ab') as f:
+            f.write(self.buffer)
+        self.file_position += len(self.buffer)
+        self.buffer = bytearray()
@@ -0,0 +1,37 @@
+"""
+File helpers shared by the modules which keep state in files (backlog, config cache, manifest).
+
+A file is replaced atomically by writing the new content to `<path>.tmp` first, then removing the old
+file and renaming the temporary file (replace_file). A reset at any time leaves either the old or the
+new file, recover_file finishes or rolls back an interrupted replacement.
+"""
+import os
+
+
+def file_exists(path: str) -> bool:
+    try:
+        os.stat(path)
+        return True
+    except OSError:
+        return False
+
+
+def replace_file(tmp: str, path: str):
+    """
+    Replace a file with a completely written temporary file.
+    """
+    if file_exists(path):
+        os.remove(path)
+    os.rename(tmp, path)
+
+
+def recover_file(path: str):
+    """
+    Finish or roll back an interrupted file replacement.
+    """
+    tmp = path + ".tmp"
+    if file_exists(path):
+        if file_exists(tmp):
+            os.remove(tmp)  # the replacement was interrupted before the old file was removed
+    elif file_exists(tmp):
+        os.rename(tmp, path)  # the replacement was interrupted after the old file was removed
@@ -0,0 +1,168 @@
+"""
+Power management and fix caching of the GNSS receiver of the Pytrack.
+
+Between the measurements the receiver is kept in standby instead of being switched off, so it keeps
+its almanac, ephemeris and time and gets a fix within seconds (hot start) instead of a cold start.
+An acquisition ends as soon as the fix reaches the configured quality. The last fix and the
+distribution of the times to first fix (TTFF) are kept in the RTC memory during deepsleep, the
+last fix is reported with its age if there is no fix within the timeout.
+"""
+import struct
+import time
+
+_MAGIC = 0x6F01
+_STATE = ">HIffBBf"  # magic, time of the last fix, latitude, longitude, fix quality, satellites, HDOP
+_STATE_SIZE = 20
+
+# upper bounds of the TTFF histogram buckets in seconds, the last bucket counts acquisitions without fix
+TTFF_BUCKETS = (1, 2, 5, 10, 20, 30, 60)
+
+_NAN = float("nan")
+
+
+class GNSSManager:
+
+    def __init__(self, location, standby=None):
+        """
+        :param location: the L76GNSS driver
+        :param standby: a function to set the receiver into standby (True) or wake it up (False),
+                        e.g. Pycoproc.gps_standby
+        """
+        self.location = location
+        self.standby = standby
+        self.timeout = 30
+        self.min_quality = 1
+        self.max_hdop = 2.0
+
+        self.last_fix = None  # (time, latitude, longitude, fix quality, satellites, HDOP) of the last fix
+        self.histogram = [0] * (len(TTFF_BUCKETS) + 1)
+        self.ttff = None  # time to first fix of the last acquisition in ms, None if there was no fix
+        self.utc = None  # (UTC date and time, ticks_ms) of the last fix
+
+    def configure(self, timeout: int, min_quality: int, max_hdop: float, state: bytes = None):
+        """
+        :param timeout: the maximal time of an acquisition in seconds
+        :param min_quality: the fix quality (GGA) at which the acquisition ends
+        :param max_hdop: the HDOP at which the acquisition ends
+        :param state: the state from a previous cycle (see get_state), e.g. from the RTC memory
+        """
+        self.timeout = timeout
+        self.min_quality = min_quality
+        self.max_hdop = max_hdop
+        if state:
+            self._load(state)
+
+    def _load(self, state: bytes):
+        size = _STATE_SIZE + 2 * len(self.histogram)
+        if len(state) != size:
+            return
+        magic, fix_time, latitude, longitude, quality, satellites, hdop = struct.unpack(_STATE, state[:_STATE_SIZE])
+        if magic != _MAGIC:
+            return
+        if fix_time > 0:
+            self.last_fix = (fix_time, latitude, longitude, quality, satellites, None if hdop != hdop else hdop)
+        self.histogram = list(struct.unpack(">{}H".format(len(self.histogram)), state[_STATE_SIZE:size]))
+
+    def get_state(self) -> bytes:
+        fix_time, latitude, longitude, quality, satellites, hdop = self.last_fix or (0, _NAN, _NAN, 0, 0, None)
+        return struct.pack(_STATE, _MAGIC, fix_time, latitude, longitude, quality, satellites,
+                           _NAN if hdop is None else hdop) + \
+               struct.pack(">{}H".format(len(self.histogram)), *(min(n, 0xFFFF) for n in self.histogram))
+
+    def _target_reached(self) -> bool:
+        nmea = self.location.nmea
+        return nmea.has_fix() and nmea.fix_quality >= self.min_quality \
+               and nmea.hdop is not None and nmea.hdop <= self.max_hdop
+
+    def acquire(self) -> dict:
+        """
+        Read the receiver output until the fix reaches the target quality or the timeout passed.
+        :return: the data fields: position, fix quality, HDOP, satellites, TTFF in ms and the age of the
+                 position in seconds (> 0 if it is the cached last fix)
+        """
+        nmea = self.location.nmea
+        start = time.ticks_ms()
+        self.ttff = None
+        while not self._target_reached():
+            elapsed = time.ticks_diff(time.ticks_ms(), start)
+            if elapsed >= self.timeout * 1000:
+                break
+            if not self.location.update():
+                time.sleep(0.1)  # no data, wait for the next output of the receiver
+            if self.ttff is None and nmea.has_fix():
+                self.ttff = time.ticks_diff(time.ticks_ms(), start)
+        if self.ttff is None and nmea.has_fix():
+            self.ttff = time.ticks_diff(time.ticks_ms(), start)  # the receiver had the fix already
+
+        self._count_ttff()
+        self._update_utc()
+        if nmea.has_fix():
+            self.last_fix = (int(time.time()), nmea.latitude, nmea.longitude, nmea.fix_quality, nmea.satellites,
+                             nmea.hdop)
+            age = 0
+        elif self.last_fix is not None:
+            age = int(time.time()) - self.last_fix[0]
+        else:
+            age = None
+        _, latitude, longitude, quality, satellites, hdop = self.last_fix or (0, None, None, 0, 0, None)
+        return {
+            "GPS_lat": latitude,
+            "GPS_long": longitude,
+            "GPS_fix": quality,
+            "GPS_hdop": hdop,
+            "GPS_sats": satellites,
+            "GPS_ttff": self.ttff,
+            "GPS_age": age
+        }
+
+    def _update_utc(self):
+        if self.location.nmea.has_fix() and self.location.nmea.datetime() is not None:
+            self.utc = (self.location.nmea.datetime(), time.ticks_ms())
+
+    def wait_for_time(self) -> bool:
+        """
+        Read the receiver output until it has a fix and therefore the UTC time, or the timeout passed.
+        :return: whether the receiver has the time
+        """
+        start = time.ticks_ms()
+        while not (self.location.nmea.has_fix() and self.location.nmea.datetime() is not None):
+            if time.ticks_diff(time.ticks_ms(), start) >= self.timeout * 1000:
+                return False
+            if not self.location.update():
+                time.sleep(0.1)
+        self._update_utc()
+        return True
+
+    def utc_time(self) -> int or None:
+        """
+        Time source (see realtimeclock): the UTC time of the last fix in this cycle, advanced by the time since.
+        """
+        if self.utc is None:
+            return None
+        utc, ticks = self.utc
+        return time.mktime(utc + (0, 0)) + time.ticks_diff(time.ticks_ms(), ticks) // 1000
+
+    def _count_ttff(self):
+        bucket = len(TTFF_BUCKETS)
+        if self.ttff is not None:
+            for i, bound in enumerate(TTFF_BUCKETS):
+                if self.ttff <= bound * 1000:
+                    bucket = i
+                    break
+        self.histogram[bucket] += 1
+
+    def print_ttff(self):
+        """
+        Print the TTFF of the last acquisition and the distribution of all acquisitions.
+        """
+        print("\tTTFF: {}".format("{} ms".format(self.ttff) if self.ttff is not None else "no fix"))
+        buckets = ["<={}s: {}".format(bound, n) for bound, n in zip(TTFF_BUCKETS, self.histogram)]
+        buckets.append("no fix: {}".format(self.histogram[-1]))
+        print("\tTTFF distribution: " + ", ".join(buckets))
+
+    def sleep(self):
+        """
+        Set the receiver into standby during deepsleep, it is woken up when the Pytrack is initialized.
+        """
+        if self.standby is not None:
+            self.standby(True)
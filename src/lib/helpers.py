@@ -2,8 +2,12 @@ import machine
 import os
 import time
 
+from backlog import Backlog, KIND_DATA_JSON, KIND_DATA_MSGPACK, KIND_UPP
 from connection import Connection
+from fileutils import file_exists
+from manifest import Manifest
 from modem import Modem
+from serialize import serialize_json, serialize_msgpack
 from uuid import UUID
 
 import ubirch
@@ -25,18 +29,27 @@ def mount_sd():
 
 def store_imsi(imsi: str):
     # save imsi to file on SD, SD needs to be mounted
-    imsi_file = "imsi.txt"
-    if imsi_file not in os.listdir('/sd'):
+    imsi_file = "/sd/imsi.txt"
+    if not file_exists(imsi_file):
         print("\twriting IMSI to SD")
-        with open('/sd/' + imsi_file, 'w') as f:
+        with open(imsi_file, 'w') as f:
             f.write(imsi)
 
 
-def get_pin_from_flash(pin_file: str, imsi: str) -> str or None:
-    if pin_file in os.listdir():
+def get_pin_from_flash(pin_file: str, imsi: str, manifest: Manifest) -> str or None:
+    # the manifest tells if there is a PIN file, without it (e.g. after a firmware update) the file is checked once
+    if manifest.has_pin(imsi) or file_exists(pin_file):
         print("\tloading PIN for " + imsi)
-        with open(pin_file, "rb") as f:
-            return f.readline().decode()
+        try:
+            with open(pin_file, "rb") as f:
+                pin = f.readline().decode()
+        except OSError:
+            # the manifest is out of date (e.g. the flash was formatted), bootstrap the SIM again
+            print("\tPIN file {} is missing".format(pin_file))
+            manifest.update(pin=None)
+            return None
+        manifest.update(pin=imsi)
+        return pin
     else:
         print("\tno PIN found for " + imsi)
         return None
@@ -81,6 +94,79 @@ def send_backend_data(sim: ubirch.SimProtocol, modem: Modem, conn: Connection, a
         raise Exception("could not establish connection to backend")
 
 
+# status codes with which the backend rejects a record because of its content (malformed, too large or invalid)
+REJECTED_STATUS_CODES = (400, 413, 422)
+
+
+def _send_batch(api_function):
+    """
+    Wrap a batch API function (e.g. API.send_upps) for send_backend_data, so a batch without any
+    response counts as a failed connection and is retried.
+    """
+
+    def send(uuid, bodies: list) -> list:
+        responses = api_function(uuid, bodies)
+        if all(response is None for response in responses):
+            raise Exception("no response to {} requests".format(len(bodies)))
+        return responses
+
+    return send
+
+
+def send_backlog(backlog: Backlog, sim: ubirch.SimProtocol, modem: Modem, conn: Connection, api: ubirch.API, uuid,
+                 max_records: int) -> list:
+    """
+    Send the oldest pending data messages and UPPs of the backlog to the backend and remove them from the
+    backlog when the backend accepted them. The records of each kind are sent in one batch, with HTTP
+    pipelined over one connection. Records the backend rejects because of their content are dropped,
+    so they do not block the backlog. Sending stops at any other backend error (temporary errors, but also
+    authentication or configuration errors) or at a record without response, it and the following records
+    stay in the backlog for the next attempt, also if the backend accepted some of them already (UPPs are
+    acknowledged with 409 then).
+    Throws an exception if the connection to the backend fails.
+    :param max_records: the maximal number of records to send
+    :return: a list with the backend errors
+    """
+    api_functions = {
+        KIND_DATA_JSON: api.send_data_messages,
+        KIND_DATA_MSGPACK: api.send_data_messages_msgpack,
+        KIND_UPP: api.send_upps
+    }
+    records = backlog.peek(max_records)
+    responses = [None] * len(records)
+    for kind in api_functions:
+        indices = [i for i, record in enumerate(records) if record[0] == kind]
+        if indices:
+            batch = send_backend_data(sim, modem, conn, _send_batch(api_functions[kind]), uuid,
+                                      [records[i][1] for i in indices])
+            for i, response in zip(indices, batch):
+                responses[i] = response
+
+    # the backlog can only remove its oldest records, so the responses are processed in the order of the records
+    errors = []
+    done = 0  # number of accepted or dropped records
+    for (kind, _), response in zip(records, responses):
+        name = "UPP" if kind == KIND_UPP else "data"
+        if response is None:
+            errors.append("backend ({}) did not respond".format(name))
+            break
+        status_code, content = response
+        if 200 <= status_code < 300 or status_code == 409:  # 409: the backend already has it
+            done += 1
+        elif status_code in REJECTED_STATUS_CODES:
+            # the backend will not accept this record, drop it so it does not block the backlog
+            done += 1
+            errors.append("backend ({}) rejected record: ({}) {}".format(name, status_code, str(content)))
+        else:
+            # temporary errors (408, 429, 5xx) and errors of the request itself (e.g. 401/403: wrong password,
+            # 404: wrong environment), which would be the same for the following records
+            errors.append("backend ({}) returned error: ({}) {}".format(name, status_code, str(content)))
+            break
+    if done > 0:
+        backlog.pop(done)
+    return errors
+
+
 def bootstrap(imsi: str, api: ubirch.API) -> str:
     """
     Load bootstrap PIN, returns PIN
@@ -141,49 +227,33 @@ def pack_data_json(uuid: UUID, data: dict) -> bytes:
     return serialize_json(msg_map)
 
 
-def serialize_json(msg: dict) -> bytes:
+def pack_data_msgpack(uuid: UUID, data: dict) -> bytes:
     """
-    create a compact sorted rendering of a json object since micropython
-    implementation of ujson.dumps does not support sorted keys
-    :param msg: the json object (dict) to serialize
-    :return: the compact sorted rendering
+    Generate a msgpack formatted message for the ubirch data service.
+    The message contains the device UUID, timestamp and data to ensure unique hash.
+    :param uuid: the device UUID
+    :param data: the mapped data to be sent to the ubirch data service
+    :return: the msgpack formatted message
     """
-    serialized = "{"
-    for key in sorted(msg):
-        serialized += "\"{}\":".format(key)
-        value = msg[key]
-        value_type = type(value)
-        if value_type is str:
-            serialized += "\"{:s}\"".format(value)
-        elif value_type is int:
-            serialized += "{:d}".format(value)
-        elif isinstance(value, float):
-            serialized += "\"{:.2f}\"".format(value)
-        elif value_type is dict:
-            serialized += serialize_json(value).decode()
-        elif value is None:
-            serialized += "null"
-        else:
-            raise Exception("unsupported data type {} for serialization in json message".format(value_type))
-        serialized += ","
-    serialized = serialized.rstrip(",") + "}"  # replace last comma with closing braces
-    return serialized.encode()
+    # hint for the message format (version)
+    MSG_TYPE = 1
+
+    # the binary UUID and native number types keep the message small,
+    # sorted keys ensure determinism when creating the hash
+    return serialize_msgpack({
+        'uuid': uuid.bytes,
+        'msg_type': MSG_TYPE,
+        'timestamp': int(time.time()),
+        'data': data
+    })
 
 
-def get_upp_payload(upp: bytes) -> bytes:
+def get_upp_payload(upp: bytes) -> memoryview:
     """
-    Get the payload of a Ubirch Protocol Message
+    Get the payload of a Ubirch Protocol Message (a view into the UPP, the payload is not copied)
     """
-    if upp[0] == 0x95 and upp[1] == 0x22:  # signed UPP
-        payload_start_idx = 23
-    elif upp[0] == 0x96 and upp[1] == 0x23:  # chained UPP
-        payload_start_idx = 89
-    else:
+    try:
+        return ubirch.decode_upp(upp).payload
+    except ValueError as e:
         from binascii import hexlify
-        raise Exception("!! can't get payload from {} (not a UPP)".format(hexlify(upp).decode()))
-
-    if upp[payload_start_idx - 2] != 0xC4:
-        raise Exception("unexpected payload type: %X".format(upp[payload_start_idx - 2]))
-
-    payload_len = upp[payload_start_idx - 1]
-    return upp[payload_start_idx:payload_start_idx + payload_len]
+        raise Exception("!! can't get payload from {}: {}".format(hexlify(upp).decode(), e))
@@ -0,0 +1,63 @@
+"""
+Provisioning state of the device (IMSI, UUID, PIN presence, registered CSRs), kept in one small file, so
+the regular cycle does not need to look for the provisioning files in the file system.
+The file is replaced by writing a temporary file first, so a reset at any time leaves either the old or
+the new state. Entries missing in the manifest (e.g. files from an older firmware version) are checked
+once in the file system and then added.
+"""
+import ujson as json
+
+from fileutils import recover_file, replace_file
+
+MANIFEST_FILE = "manifest.json"
+
+
+class Manifest:
+
+    def __init__(self, path: str = MANIFEST_FILE):
+        """
+        Load the manifest, recovering from an interrupted update.
+        :param path: the manifest file
+        """
+        self.path = path
+        self.state = {}
+
+        recover_file(path)
+        try:
+            with open(path, 'r') as f:
+                self.state = json.load(f)
+        except OSError:
+            pass  # no manifest yet
+        except ValueError:
+            print("!! provisioning manifest {} is corrupt, discarding it".format(path))
+
+    def get(self, key: str, default=None):
+        return self.state.get(key, default)
+
+    def update(self, **values):
+        """
+        Set entries of the manifest and write it, if anything changed.
+        """
+        if all(self.state.get(key) == value for key, value in values.items()):
+            return
+        self.state.update(values)
+        tmp = self.path + ".tmp"
+        with open(tmp, 'w') as f:
+            f.write(json.dumps(self.state))
+        replace_file(tmp, self.path)
+
+    def has_pin(self, imsi: str) -> bool:
+        """
+        Check whether the PIN of the SIM with the IMSI is stored in the flash.
+        """
+        return self.state.get("pin") == imsi
+
+    def has_csr(self, uuid, env: str) -> bool:
+        """
+        Check whether a CSR for the UUID was registered at the identity service of the environment.
+        """
+        return "{}_{}".format(uuid, env) in self.state.get("csr", [])
+
+    def add_csr(self, uuid, env: str):
+        if not self.has_csr(uuid, env):
+            self.update(csr=self.state.get("csr", []) + ["{}_{}".format(uuid, env)])
@@ -126,7 +126,8 @@ class Modem(ModemInterface):
             else:
                 # unsolicited
                 if self.error_handler is not None:
-                    self.error_handler.log("WARNING: ignoring: {}".format(line), COLOR_MODEM_FAIL)
+                    self.error_handler.log("WARNING: ignoring: {}".format(line), COLOR_MODEM_FAIL,
+                                           severity=SEVERITY_WARNING)
 
         if retval is not None:
             return retval
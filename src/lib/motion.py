@@ -0,0 +1,66 @@
+"""
+Statistics over a window of accelerometer samples, e.g. the content of the LIS2HH12 FIFO.
+The samples are accumulated as raw integers, they are only scaled to g when the result is computed.
+"""
+import math
+import struct
+
+
+class MotionStatistics:
+
+    def __init__(self, scale: float):
+        """
+        :param scale: the factor from raw sample values to g
+        """
+        self.scale = scale
+        self.n = 0
+        self.sums = [0, 0, 0]  # per axis
+        self.squares = [0, 0, 0]  # sums of the squared values per axis
+        self.peak = 0  # maximal squared magnitude
+
+    def add_samples(self, buf, n: int):
+        """
+        Add samples from a buffer.
+        :param buf: the raw samples, X, Y and Z as little endian int16 per sample (the LIS2HH12 output registers)
+        :param n: the number of samples in the buffer
+        """
+        sums = self.sums
+        squares = self.squares
+        peak = self.peak
+        for i in range(n):
+            x, y, z = struct.unpack_from('<hhh', buf, 6 * i)
+            sums[0] += x
+            sums[1] += y
+            sums[2] += z
+            xx, yy, zz = x * x, y * y, z * z
+            squares[0] += xx
+            squares[1] += yy
+            squares[2] += zz
+            if xx + yy + zz > peak:
+                peak = xx + yy + zz
+        self.peak = peak
+        self.n += n
+
+    def mean(self) -> tuple:
+        """
+        Get the mean acceleration vector in g.
+        """
+        return tuple(s * self.scale / self.n for s in self.sums)
+
+    def result(self) -> dict:
+        """
+        Get the statistics of the window:
+        the mean acceleration per axis, the RMS and the peak of the magnitude, and the vibration energy
+        (the sum of the variances of the axes, i.e. the mean squared deviation from the mean vector) in g and g².
+        """
+        n = self.n
+        mean = self.mean()
+        mean_square = sum(self.squares) * self.scale * self.scale / n
+        variance = sum(self.squares[i] * self.scale * self.scale / n - mean[i] * mean[i] for i in range(3))
+        return {
+            "mean": mean,
+            "rms": math.sqrt(mean_square),
+            "peak": math.sqrt(self.peak) * self.scale,
+            "energy": max(variance, 0.0),
+            "samples": n
+        }
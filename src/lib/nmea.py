@@ -0,0 +1,179 @@
+"""
+Incremental NMEA 0183 parser for the output of the L76 GNSS receiver.
+
+The received bytes are framed into sentences in a fixed buffer, the checksum is computed while the
+sentence is received. Valid GLL, RMC, GGA, GSA and ZDA sentences (of any talker, e.g. GP, GL or GN) update
+the state of the parser: position, fix quality, HDOP, number of satellites and UTC date and time.
+Only a valid sentence allocates (for splitting its fields), reading and framing does not.
+"""
+
+MAX_SENTENCE = 96  # the NMEA maximum is 82 characters, the L76 sends longer PMTK responses
+
+_DOLLAR = 0x24
+_STAR = 0x2A
+_CR = 0x0D
+_LF = 0x0A
+
+# fix quality (GGA)
+FIX_NONE = 0
+FIX_GPS = 1
+FIX_DGPS = 2
+
+
+def _hex_value(c: int) -> int:
+    if 0x30 <= c <= 0x39:
+        return c - 0x30
+    if 0x41 <= c <= 0x46:
+        return c - 0x37
+    if 0x61 <= c <= 0x66:
+        return c - 0x57
+    return -1
+
+
+def _coordinate(value: bytes, hemisphere: bytes) -> float or None:
+    """
+    Convert a coordinate from (d)ddmm.mmmm and N/S/E/W to decimal degrees.
+    """
+    if not value:
+        return None
+    v = float(value)
+    degrees = (v // 100) + ((v % 100) / 60)
+    return -degrees if hemisphere in (b'S', b'W') else degrees
+
+
+def _time(value: bytes) -> tuple or None:
+    if len(value) < 6:
+        return None
+    return int(value[0:2]), int(value[2:4]), int(float(value[4:]))
+
+
+class NMEAParser:
+
+    def __init__(self):
+        self.sentence = bytearray(MAX_SENTENCE)
+        self.length = -1  # length of the sentence received so far, -1 while waiting for the start of a sentence
+        self.checksum = 0
+        self.checksum_start = -1  # index of the checksum in the sentence, -1 before the '*'
+
+        # statistics
+        self.sentences = 0  # number of valid sentences
+        self.errors = 0  # number of sentences with wrong checksum or format, or too long
+
+        # state from the parsed sentences
+        self.latitude = None
+        self.longitude = None
+        self.altitude = None
+        self.position_valid = False  # whether latitude and longitude are from a valid fix
+        self.position_updates = 0  # number of parsed GLL and RMC sentences
+        self.fix_quality = FIX_NONE  # GGA fix quality, see FIX_*
+        self.fix_type = 1  # GSA fix type: 1 no fix, 2 2D, 3 3D
+        self.satellites = 0
+        self.hdop = None
+        self.utc_time = None  # (hours, minutes, seconds)
+        self.utc_date = None  # (year, month, day)
+
+    def feed(self, data, n: int = None) -> int:
+        """
+        Parse received bytes.
+        :param data: the received bytes
+        :param n: the number of bytes to parse, all by default
+        :return: the number of valid sentences in the data
+        """
+        valid = 0
+        sentence = self.sentence
+        for i in range(len(data) if n is None else n):
+            c = data[i]
+            if c == _DOLLAR:
+                if self.length > 0:
+                    self.errors += 1  # incomplete sentence
+                self.length = 0
+                self.checksum = 0
+                self.checksum_start = -1
+                continue
+            if self.length < 0:
+                continue  # padding or the rest of a discarded sentence
+            if c == _CR or c == _LF:
+                if self._complete():
+                    valid += 1
+                self.length = -1
+                continue
+            if self.length >= MAX_SENTENCE:
+                self.errors += 1
+                self.length = -1
+                continue
+            if c == _STAR:
+                self.checksum_start = self.length + 1
+            elif self.checksum_start < 0:
+                self.checksum ^= c
+            sentence[self.length] = c
+            self.length += 1
+        return valid
+
+    def _complete(self) -> bool:
+        """
+        Check the checksum of the received sentence and parse it.
+        """
+        start = self.checksum_start
+        if start < 0 or self.length != start + 2:
+            self.errors += 1
+            return False
+        high, low = _hex_value(self.sentence[start]), _hex_value(self.sentence[start + 1])
+        if high < 0 or low < 0 or (high << 4 | low) != self.checksum:
+            self.errors += 1
+            return False
+        self.sentences += 1
+        try:
+            self._parse(bytes(self.sentence[:start - 1]).split(b','))
+        except (ValueError, IndexError):
+            self.errors += 1
+            return False
+        return True
+
+    def _parse(self, fields: list):
+        kind = fields[0][2:]
+        if kind == b'GLL':
+            # GLL,lat,N/S,lon,E/W,time,status,mode
+            self.latitude = _coordinate(fields[1], fields[2])
+            self.longitude = _coordinate(fields[3], fields[4])
+            self.utc_time = _time(fields[5]) or self.utc_time
+            self.position_valid = fields[6] == b'A' and self.latitude is not None
+            self.position_updates += 1
+        elif kind == b'RMC':
+            # RMC,time,status,lat,N/S,lon,E/W,speed,course,date,...
+            self.utc_time = _time(fields[1]) or self.utc_time
+            self.latitude = _coordinate(fields[3], fields[4])
+            self.longitude = _coordinate(fields[5], fields[6])
+            self.position_valid = fields[2] == b'A' and self.latitude is not None
+            date = fields[9]
+            if len(date) == 6:
+                self.utc_date = (2000 + int(date[4:6]), int(date[2:4]), int(date[0:2]))
+            self.position_updates += 1
+        elif kind == b'GGA':
+            # GGA,time,lat,N/S,lon,E/W,quality,satellites,hdop,altitude,M,...
+            self.utc_time = _time(fields[1]) or self.utc_time
+            self.fix_quality = int(fields[6]) if fields[6] else FIX_NONE
+            self.satellites = int(fields[7]) if fields[7] else 0
+            self.hdop = float(fields[8]) if fields[8] else None
+            self.altitude = float(fields[9]) if fields[9] else None
+        elif kind == b'GSA':
+            # GSA,mode,fix type,12 satellite ids,pdop,hdop,vdop
+            self.fix_type = int(fields[2]) if fields[2] else 1
+            if fields[16]:
+                self.hdop = float(fields[16])
+        elif kind == b'ZDA':
+            # ZDA,time,day,month,year,local zone hours,local zone minutes
+            self.utc_time = _time(fields[1]) or self.utc_time
+            if fields[2] and fields[3] and fields[4]:
+                self.utc_date = (int(fields[4]), int(fields[3]), int(fields[2]))
+
+    def has_fix(self) -> bool:
+        return self.position_valid and self.fix_quality != FIX_NONE
+
+    def datetime(self) -> tuple or None:
+        """
+        Get the UTC date and time of the last sentences with date and time.
+        :return: (year, month, day, hours, minutes, seconds) or None if not known
+        """
+        if self.utc_date is None or self.utc_time is None:
+            return None
+        return self.utc_date + self.utc_time
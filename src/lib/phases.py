@@ -0,0 +1,76 @@
+"""
+Timing of the phases of a cycle, including background phases (e.g. the network attach of the modem),
+to show how much of a background phase overlapped with the work in the foreground.
+"""
+import time
+
+
+class PhaseTimer:
+
+    def __init__(self):
+        self.phases = []  # [name, start, end, waiting] of the foreground phases, in ms
+        self.background = {}  # name -> [start, end, done] of the background phases, in ms
+        self.start_ms = time.ticks_ms()
+
+    def _now(self) -> int:
+        return time.ticks_diff(time.ticks_ms(), self.start_ms)
+
+    def start(self, name: str, waiting: bool = False):
+        """
+        End the current phase and start the next one.
+        :param name: the name of the phase
+        :param waiting: whether the phase waits for a background phase (does not count as overlap)
+        """
+        now = self._now()
+        self.stop(now)
+        self.phases.append([name, now, None, waiting])
+
+    def stop(self, now: int = None):
+        """
+        End the current phase.
+        """
+        now = self._now() if now is None else now
+        if self.phases and self.phases[-1][2] is None:
+            self.phases[-1][2] = now
+        # check if background phases finished meanwhile
+        for name, phase in self.background.items():
+            if phase[1] is None and phase[2] is not None and phase[2]():
+                phase[1] = now
+
+    def start_background(self, name: str, done=None):
+        """
+        Start a background phase.
+        :param name: the name of the phase
+        :param done: a function which tells if the background phase finished, it is checked at the
+                     start of each foreground phase, else the phase ends with stop_background
+        """
+        if name not in self.background:
+            self.background[name] = [self._now(), None, done]
+
+    def stop_background(self, name: str):
+        if name in self.background and self.background[name][1] is None:
+            self.background[name][1] = self._now()
+
+    def overlap(self, name: str) -> int:
+        """
+        Get the time in ms a background phase ran during foreground phases which did not wait for it.
+        """
+        start, end, _ = self.background[name]
+        end = self._now() if end is None else end
+        overlap = 0
+        for _, phase_start, phase_end, waiting in self.phases:
+            phase_end = self._now() if phase_end is None else phase_end
+            if not waiting:
+                overlap += max(0, min(end, phase_end) - max(start, phase_start))
+        return overlap
+
+    def report(self):
+        self.stop()
+        print("++ phase timings")
+        for name, start, end, waiting in self.phases:
+            print("\t{:20s} {:7d} ms{}".format(name, end - start, " (waiting)" if waiting else ""))
+        for name, (start, end, _) in self.background.items():
+            end = self._now() if end is None else end
+            print("\t{:20s} {:7d} ms in the background, {} ms overlapped with other phases".format(
+                name, end - start, self.overlap(name)))
+        print("\t{:20s} {:7d} ms".format("total", self._now()))
@@ -10,8 +10,8 @@
 
 from machine import Timer
 import time
-import gc
 import binascii
+from nmea import NMEAParser
 
 
 class L76GNSS:
@@ -30,6 +30,8 @@ class L76GNSS:
         self.timeout = timeout
         self.timeout_status = True
         self.buffer = buffer
+        self._buf = bytearray(buffer)
+        self.nmea = NMEAParser()
 
         self.reg = bytearray(1)
         self.i2c.writeto(GPS_I2CADDR, self.reg)
@@ -38,6 +40,15 @@ class L76GNSS:
         self.reg = self.i2c.readfrom(GPS_I2CADDR, self.buffer)
         return self.reg
 
+    def update(self) -> bool:
+        """
+        Read the next chunk of NMEA output into the preallocated buffer and parse it.
+        :return: whether the chunk contained data (the L76 pads with newlines if it has no data)
+        """
+        self.i2c.readfrom_into(GPS_I2CADDR, self._buf)
+        self.nmea.feed(self._buf)
+        return self._buf[0] != 0x0A or self._buf[-1] != 0x0A
+
     def _convert_coords(self, gngll_s):
         lat = gngll_s[1]
         lat_d = (float(lat) // 100) + ((float(lat) % 100) / 60)
@@ -50,51 +61,31 @@ class L76GNSS:
         return(lat_d, lon_d)
 
     def coordinates(self, debug=False):
-        lat_d, lon_d, debug_timeout = None, None, False
+        """
+        Get the position from the next GLL or RMC sentence.
+        :return: (latitude, longitude) in decimal degrees, (None, None) if there is no fix or on timeout
+        """
+        debug_timeout = False
         if self.timeout is not None:
             self.chrono.reset()
             self.chrono.start()
-        nmea = b''
-        while True:
+        updates = self.nmea.position_updates
+        while self.nmea.position_updates == updates:
             if self.timeout is not None and self.chrono.read() >= self.timeout:
                 self.chrono.stop()
                 chrono_timeout = self.chrono.read()
                 self.chrono.reset()
-                self.timeout_status = False
                 debug_timeout = True
-            if not self.timeout_status:
-                gc.collect()
                 break
-            nmea += self._read().lstrip(b'\n\n').rstrip(b'\n\n')
-            gngll_idx = nmea.find(b'GNGLL')
-            gpgll_idx = nmea.find(b'GPGLL')
-            if gngll_idx < 0 and gpgll_idx >= 0:
-                gngll_idx = gpgll_idx
-            if gngll_idx >= 0:
-                gngll = nmea[gngll_idx:]
-                e_idx = gngll.find(b'\r\n')
-                if e_idx >= 0:
-                    try:
-                        gngll = gngll[:e_idx].decode('ascii')
-                        gngll_s = gngll.split(',')
-                        lat_d, lon_d = self._convert_coords(gngll_s)
-                    except Exception:
-                        pass
-                    finally:
-                        nmea = nmea[(gngll_idx + e_idx):]
-                        gc.collect()
-                        break
-            else:
-                gc.collect()
-                if len(nmea) > 410: # i suppose it can be safely changed to 82, which is longest NMEA frame
-                    nmea = nmea[-5:] # $GNGL without last L
-            time.sleep(0.1)
-        self.timeout_status = True
-        if debug and debug_timeout:
-            print('GPS timed out after %f seconds' % (chrono_timeout))
+            if not self.update():
+                time.sleep(0.1)  # no data, wait for the next output of the receiver
+        if debug_timeout:
+            if debug:
+                print('GPS timed out after %f seconds' % (chrono_timeout))
             return(None, None)
-        else:
-            return(lat_d, lon_d)
+        if not self.nmea.position_valid:
+            return(None, None)
+        return(self.nmea.latitude, self.nmea.longitude)
 
     def dump_nmea(self):
         nmea = b''
@@ -113,7 +104,7 @@ class L76GNSS:
         calc_cksum = 0
         for s in nmeadata:
             calc_cksum ^= ord(s)
-        return('{:X}'.format(calc_cksum))
+        return('{:02X}'.format(calc_cksum))
 
     def write(self, data):
         self.i2c.writeto(GPS_I2CADDR, '${}*{}\r\n'.format(data, self._checksum(data)) )
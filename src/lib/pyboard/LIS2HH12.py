@@ -26,6 +26,12 @@ ODR_200_HZ = const(4)
 ODR_400_HZ = const(5)
 ODR_800_HZ = const(6)
 
+FIFO_BYPASS = const(0)
+FIFO_MODE = const(1)
+FIFO_STREAM = const(2)
+
+FIFO_SIZE = const(32)
+
 ACC_G_DIV = 1000 * 65536
 
 
@@ -47,6 +53,8 @@ class LIS2HH12:
     ACC_Z_H_REG = const(0x2D)
     ACT_THS = const(0x1E)
     ACT_DUR = const(0x1F)
+    FIFO_CTRL_REG = const(0x2E)
+    FIFO_SRC_REG = const(0x2F)
 
     SCALES = {FULL_SCALE_2G: 4000, FULL_SCALE_4G: 8000, FULL_SCALE_8G: 16000}
     ODRS = [0, 10, 50, 100, 200, 400, 800]
@@ -66,6 +74,8 @@ class LIS2HH12:
         self.int_pin = None
         self.act_dur = 0
         self.debounced = False
+        self._buf = bytearray(6)  # preallocated buffer for the burst read of the X, Y and Z registers
+        self._fifo_buf = None  # preallocated buffer for draining the FIFO, see enable_fifo
 
         whoami = self.i2c.readfrom_mem(ACC_I2CADDR , PRODUCTID_REG, 1)
         if (whoami[0] != 0x41):
@@ -77,6 +87,9 @@ class LIS2HH12:
         # change the full-scale to 4g
         self.set_full_scale(FULL_SCALE_4G)
 
+        # enable the register address auto increment for burst reads (default after power-on)
+        self.set_register(CTRL4_REG, 1, 2, 1)
+
         # set the interrupt pin as active low and open drain
         self.set_register(CTRL5_REG, 3, 0, 3)
 
@@ -84,22 +97,20 @@ class LIS2HH12:
         self.acceleration()
 
     def acceleration(self):
-        x = self.i2c.readfrom_mem(ACC_I2CADDR , ACC_X_L_REG, 2)
-        self.x = struct.unpack('<h', x)
-        y = self.i2c.readfrom_mem(ACC_I2CADDR , ACC_Y_L_REG, 2)
-        self.y = struct.unpack('<h', y)
-        z = self.i2c.readfrom_mem(ACC_I2CADDR , ACC_Z_L_REG, 2)
-        self.z = struct.unpack('<h', z)
+        # read X, Y and Z in one transaction, so all axes are from the same sample
+        self.i2c.readfrom_mem_into(ACC_I2CADDR , ACC_X_L_REG, self._buf)
+        self.x, self.y, self.z = struct.unpack_from('<hhh', self._buf)
         _mult = self.SCALES[self.full_scale] / ACC_G_DIV
-        return (self.x[0] * _mult, self.y[0] * _mult, self.z[0] * _mult)
+        return (self.x * _mult, self.y * _mult, self.z * _mult)
 
-    def roll(self):
-        x,y,z = self.acceleration()
+    def roll(self, acceleration=None):
+        # use the given acceleration vector to derive roll and pitch from the same reading
+        x,y,z = acceleration or self.acceleration()
         rad = math.atan2(-x, z)
         return (180 / math.pi) * rad
 
-    def pitch(self):
-        x,y,z = self.acceleration()
+    def pitch(self, acceleration=None):
+        x,y,z = acceleration or self.acceleration()
         rad = -math.atan2(y, (math.sqrt(x*x + z*z)))
         return (180 / math.pi) * rad
 
@@ -117,6 +128,40 @@ class LIS2HH12:
         self.set_register(CTRL1_REG, odr, 4, 7)
         self.odr = odr
 
+    def scale(self):
+        # factor from the raw output values to g
+        return self.SCALES[self.full_scale] / ACC_G_DIV
+
+    def enable_fifo(self, mode=FIFO_STREAM):
+        # FIFO mode stops collecting when the FIFO is full, stream mode keeps the newest samples
+        if self._fifo_buf is None:
+            self._fifo_buf = bytearray(6 * FIFO_SIZE)
+        self.set_register(FIFO_CTRL_REG, FIFO_BYPASS, 5, 7)  # bypass mode empties the FIFO
+        self.set_register(CTRL3_REG, 1, 7, 1)
+        self.set_register(FIFO_CTRL_REG, mode, 5, 7)
+
+    def disable_fifo(self):
+        self.set_register(FIFO_CTRL_REG, FIFO_BYPASS, 5, 7)
+        self.set_register(CTRL3_REG, 0, 7, 1)
+
+    def fifo_samples(self):
+        # number of unread samples, the overrun flag is set when the FIFO is full
+        src = self.i2c.readfrom_mem(ACC_I2CADDR, FIFO_SRC_REG, 1)[0]
+        if src & 0x40:
+            return FIFO_SIZE
+        return src & 0x1F
+
+    def read_fifo(self):
+        """
+        Drain the FIFO in one burst read: with the FIFO enabled the register address rolls back from
+        the Z high to the X low register, so consecutive samples are read in one transaction.
+        :return: the buffer with the samples (X, Y and Z as little endian int16 each) and the number of samples
+        """
+        n = self.fifo_samples()
+        if n > 0:
+            self.i2c.readfrom_mem_into(ACC_I2CADDR, ACC_X_L_REG, memoryview(self._fifo_buf)[:6 * n])
+        return self._fifo_buf, n
+
     def set_high_pass(self, hp):
         self.set_register(CTRL2_REG, 1 if hp else 0, 2, 1)
 
@@ -8,6 +8,7 @@
 # available at https://www.pycom.io/opensource/licensing
 #
 
+import struct
 import time
 from machine import I2C
 
@@ -51,6 +52,8 @@ class LTR329ALS01:
         else:
             self.i2c = I2C(0, mode=I2C.MASTER, pins=(sda, scl))
 
+        self._buf = bytearray(4)  # preallocated buffer for the burst read of both channels
+
         contr = self._getContr(gain)
         self.i2c.writeto_mem(ALS_I2CADDR, ALS_CONTR_REG, bytearray([contr]))
 
@@ -69,12 +72,8 @@ class LTR329ALS01:
         return ((high & 0xFF) << 8) + (low & 0xFF)
 
     def light(self):
-        ch1low = self.i2c.readfrom_mem(ALS_I2CADDR , ALS_DATA_CH1_LOW, 1)
-        ch1high = self.i2c.readfrom_mem(ALS_I2CADDR , ALS_DATA_CH1_HIGH, 1)
-        data1 = int(self._getWord(ch1high[0], ch1low[0]))
-
-        ch0low = self.i2c.readfrom_mem(ALS_I2CADDR , ALS_DATA_CH0_LOW, 1)
-        ch0high = self.i2c.readfrom_mem(ALS_I2CADDR , ALS_DATA_CH0_HIGH, 1)
-        data0 = int(self._getWord(ch0high[0], ch0low[0]))
+        # read CH1 and CH0 (low and high bytes) in one transaction, in the order required by the datasheet
+        self.i2c.readfrom_mem_into(ALS_I2CADDR , ALS_DATA_CH1_LOW, self._buf)
+        data1, data0 = struct.unpack_from('<HH', self._buf)
 
         return (data0, data1)
@@ -60,6 +60,8 @@ class MPL3115A2:
             self.i2c = I2C(0, mode=I2C.MASTER, pins=(sda, scl))
 
         self.STA_reg = bytearray(1)
+        self._pressure_buf = bytearray(3)  # preallocated buffers for the burst reads of the data registers
+        self._temp_buf = bytearray(2)
         self.mode = mode
 
         #perform reset
@@ -125,22 +127,20 @@ class MPL3115A2:
         if self.mode == ALTITUDE:
             raise MPL3115A2exception("Incorrect Measurement Mode MPL3115A2")
 
-        OUT_P_MSB = self.i2c.readfrom_mem(MPL3115_I2CADDR, MPL3115_PRESSURE_DATA_MSB,1)
-        OUT_P_CSB = self.i2c.readfrom_mem(MPL3115_I2CADDR, MPL3115_PRESSURE_DATA_CSB,1)
-        OUT_P_LSB = self.i2c.readfrom_mem(MPL3115_I2CADDR, MPL3115_PRESSURE_DATA_LSB,1)
+        self.i2c.readfrom_mem_into(MPL3115_I2CADDR, MPL3115_PRESSURE_DATA_MSB, self._pressure_buf)
+        OUT_P_MSB, OUT_P_CSB, OUT_P_LSB = self._pressure_buf
 
-        return float((OUT_P_MSB[0] << 10) + (OUT_P_CSB[0] << 2) + ((OUT_P_LSB[0] >> 6) & 0x03) + ((OUT_P_LSB[0] >> 4) & 0x03) / 4.0)
+        return float((OUT_P_MSB << 10) + (OUT_P_CSB << 2) + ((OUT_P_LSB >> 6) & 0x03) + ((OUT_P_LSB >> 4) & 0x03) / 4.0)
 
     def altitude(self):
         if self.mode == PRESSURE:
             raise MPL3115A2exception("Incorrect Measurement Mode MPL3115A2")
 
-        OUT_P_MSB = self.i2c.readfrom_mem(MPL3115_I2CADDR, MPL3115_PRESSURE_DATA_MSB,1)
-        OUT_P_CSB = self.i2c.readfrom_mem(MPL3115_I2CADDR, MPL3115_PRESSURE_DATA_CSB,1)
-        OUT_P_LSB = self.i2c.readfrom_mem(MPL3115_I2CADDR, MPL3115_PRESSURE_DATA_LSB,1)
+        self.i2c.readfrom_mem_into(MPL3115_I2CADDR, MPL3115_PRESSURE_DATA_MSB, self._pressure_buf)
+        OUT_P_MSB, OUT_P_CSB, OUT_P_LSB = self._pressure_buf
 
-        alt_int = (OUT_P_MSB[0] << 8) + (OUT_P_CSB[0])
-        alt_frac = ((OUT_P_LSB[0] >> 4) & 0x0F)
+        alt_int = (OUT_P_MSB << 8) + (OUT_P_CSB)
+        alt_frac = ((OUT_P_LSB >> 4) & 0x0F)
 
         if alt_int > 32767:
             alt_int -= 65536
@@ -148,11 +148,10 @@ class MPL3115A2:
         return float(alt_int + alt_frac / 16.0)
 
     def temperature(self):
-        OUT_T_MSB = self.i2c.readfrom_mem(MPL3115_I2CADDR, MPL3115_TEMP_DATA_MSB,1)
-        OUT_T_LSB = self.i2c.readfrom_mem(MPL3115_I2CADDR, MPL3115_TEMP_DATA_LSB,1)
+        self.i2c.readfrom_mem_into(MPL3115_I2CADDR, MPL3115_TEMP_DATA_MSB, self._temp_buf)
 
-        temp_int = OUT_T_MSB[0]
-        temp_frac = OUT_T_LSB[0]
+        temp_int = self._temp_buf[0]
+        temp_frac = self._temp_buf[1]
 
         if temp_int > 127:
             temp_int -= 256
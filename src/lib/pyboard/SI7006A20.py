@@ -31,25 +31,31 @@ class SI7006A20:
         else:
             self.i2c = I2C(0, mode=I2C.MASTER, pins=(sda, scl))
 
+        # preallocated buffers for the measurement commands and results
+        self._temp_cmd = bytes([TEMP_NOHOLDMASTER])
+        self._humd_cmd = bytes([HUMD_NOHOLDMASTER])
+        self._buf = bytearray(3)
+        self._word = memoryview(self._buf)[:2]
+
     def _getWord(self, high, low):
         return ((high & 0xFF) << 8) + (low & 0xFF)
 
     def temperature(self):
         """ obtaining the temperature(degrees Celsius) measured by sensor """
-        self.i2c.writeto(SI7006A20_I2C_ADDR, bytearray([0xF3]))
+        self.i2c.writeto(SI7006A20_I2C_ADDR, self._temp_cmd)
         time.sleep(0.5)
-        data = self.i2c.readfrom(SI7006A20_I2C_ADDR, 3)
-        #print("CRC Raw temp data: " + hex(data[0]*65536 + data[1]*256 + data[2]))
-        data = self._getWord(data[0], data[1])
+        self.i2c.readfrom_into(SI7006A20_I2C_ADDR, self._buf)
+        #print("CRC Raw temp data: " + hex(self._buf[0]*65536 + self._buf[1]*256 + self._buf[2]))
+        data = self._getWord(self._buf[0], self._buf[1])
         temp = ((175.72 * data) / 65536.0) - 46.85
         return temp
 
     def humidity(self):
         """ obtaining the relative humidity(%) measured by sensor """
-        self.i2c.writeto(SI7006A20_I2C_ADDR, bytearray([0xF5]))
+        self.i2c.writeto(SI7006A20_I2C_ADDR, self._humd_cmd)
         time.sleep(0.5)
-        data = self.i2c.readfrom(SI7006A20_I2C_ADDR, 2)
-        data = self._getWord(data[0], data[1])
+        self.i2c.readfrom_into(SI7006A20_I2C_ADDR, self._word)
+        data = self._getWord(self._buf[0], self._buf[1])
         humidity = ((125.0 * data) / 65536.0) - 6.0
         return humidity
 
@@ -1,27 +1,97 @@
+from gnss import GNSSManager
+from machine import I2C
+from motion import MotionStatistics
 from .pycoproc import Pycoproc
 
 
+class CountingI2C:
+    """
+    Wrapper of the I2C bus which counts the transactions (reads and writes), other calls are passed through.
+    """
+
+    def __init__(self, i2c: I2C):
+        self.i2c = i2c
+        self.transactions = 0
+
+    def readfrom(self, *args, **kwargs):
+        self.transactions += 1
+        return self.i2c.readfrom(*args, **kwargs)
+
+    def readfrom_into(self, *args, **kwargs):
+        self.transactions += 1
+        return self.i2c.readfrom_into(*args, **kwargs)
+
+    def readfrom_mem(self, *args, **kwargs):
+        self.transactions += 1
+        return self.i2c.readfrom_mem(*args, **kwargs)
+
+    def readfrom_mem_into(self, *args, **kwargs):
+        self.transactions += 1
+        return self.i2c.readfrom_mem_into(*args, **kwargs)
+
+    def writeto(self, *args, **kwargs):
+        self.transactions += 1
+        return self.i2c.writeto(*args, **kwargs)
+
+    def writeto_mem(self, *args, **kwargs):
+        self.transactions += 1
+        return self.i2c.writeto_mem(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.i2c, name)
+
+
 class Pyboard(Pycoproc):
 
     def __init__(self):
-        super().__init__(i2c=None, sda='P22', scl='P21')
+        i2c = CountingI2C(I2C(0, mode=I2C.MASTER, pins=('P22', 'P21'), baudrate=100000))
+        super().__init__(i2c=i2c, sda='P22', scl='P21')
 
         from .LIS2HH12 import LIS2HH12
 
         self.accelerometer = LIS2HH12(self)
+        # collect acceleration samples in the FIFO until the measurement, it keeps the newest 32 samples
+        self.accelerometer.enable_fifo()
         self.voltage = self.read_battery_voltage
+        self.i2c_transactions = 0  # number of I2C transactions of the last snapshot
 
     def get_data(self) -> dict:
         """
-        Get data from the sensors
+        Get data from the sensors, see snapshot
         :return: a dictionary (json) with the data
         """
+        start = self.i2c.transactions
+        data = self.snapshot()
+        self.i2c_transactions = self.i2c.transactions - start
+        return data
+
+    def snapshot(self) -> dict:
+        """
+        Read every sensor exactly once, values derived from a sensor reading (e.g. roll and pitch
+        from the acceleration vector) are computed from the same reading.
+        The acceleration values are statistics over the samples in the accelerometer FIFO: the mean
+        per axis, RMS and peak of the magnitude and the vibration energy (see MotionStatistics).
+        :return: a dictionary (json) with the data
+        """
+        buf, n = self.accelerometer.read_fifo()
+        if n > 0:
+            statistics = MotionStatistics(self.accelerometer.scale())
+            statistics.add_samples(buf, n)
+            motion = statistics.result()
+            acceleration = motion["mean"]
+        else:
+            acceleration = self.accelerometer.acceleration()
+            motion = {"rms": None, "peak": None, "energy": None}
         return {
-            "AccX": self.accelerometer.acceleration()[0],
-            "AccY": self.accelerometer.acceleration()[1],
-            "AccZ": self.accelerometer.acceleration()[2],
-            "AccRoll": self.accelerometer.roll(),
-            "AccPitch": self.accelerometer.pitch(),
+            "AccX": acceleration[0],
+            "AccY": acceleration[1],
+            "AccZ": acceleration[2],
+            "AccRoll": self.accelerometer.roll(acceleration),
+            "AccPitch": self.accelerometer.pitch(acceleration),
+            "AccRMS": motion["rms"],
+            "AccPeak": motion["peak"],
+            "AccVib": motion["energy"],
+            "AccN": n,
             "V": self.voltage()
         }
 
@@ -43,11 +113,12 @@ class Pysense(Pyboard):
         self.barometer = MPL3115A2(self, mode=PRESSURE)
         self.humidity = SI7006A20(self)
 
-    def get_data(self) -> dict:
-        data = super().get_data()
+    def snapshot(self) -> dict:
+        data = super().snapshot()
+        light = self.light()
         data.update({
-            "L_blue": self.light()[0],
-            "L_red": self.light()[1],
+            "L_blue": light[0],
+            "L_red": light[1],
             # "Alt": self.altimeter.altitude(),
             "T": self.barometer.temperature(),
             "P": self.barometer.pressure(),
@@ -67,14 +138,12 @@ class Pytrack(Pyboard):
         from .L76GNSS import L76GNSS
 
         self.location = L76GNSS(self, timeout=30)
+        # the receiver is woken up from standby by Pycoproc.__init__, see GNSSManager
+        self.gnss = GNSSManager(self.location, standby=self.gps_standby)
 
-    def get_data(self) -> dict:
-        data = super().get_data()
-        coord = self.location.coordinates(debug=True)
-        data.update({
-            "GPS_long": coord[0],
-            "GPS_lat": coord[1]
-        })
+    def snapshot(self) -> dict:
+        data = super().snapshot()
+        data.update(self.gnss.acquire())
         return data
 
 
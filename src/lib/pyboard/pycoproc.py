@@ -95,6 +95,7 @@ class Pycoproc:
         self.scl = scl
         self.clk_cal_factor = 1
         self.reg = bytearray(6)
+        self._status = bytearray(1)  # preallocated buffer for polling the status
         self.wake_int = False
         self.wake_int_pin = False
         self.wake_int_pin_rising_edge = True
@@ -138,11 +139,13 @@ class Pycoproc:
     def _wait(self):
         count = 0
         time.sleep_us(10)
-        while self.i2c.readfrom(I2C_SLAVE_ADDR, 1)[0] != 0xFF:
+        self.i2c.readfrom_into(I2C_SLAVE_ADDR, self._status)
+        while self._status[0] != 0xFF:
             time.sleep_us(100)
             count += 1
             if (count > 500):  # timeout after 50ms
                 raise Exception('Board timeout')
+            self.i2c.readfrom_into(I2C_SLAVE_ADDR, self._status)
 
     def _send_cmd(self, cmd):
         self._write(bytes([cmd]))
@@ -1,4 +1,5 @@
 import machine
+import struct
 import time
 import sys
 
@@ -8,6 +9,8 @@ SYNC_INTERVAL_DEFAULT = 3600
 rtc = machine.RTC()
 
 def enable_time_sync(server=NTP_SERVER_DEFAULT,interval=SYNC_INTERVAL_DEFAULT):
+    # remember the board time, to know the offset after NTP set the time in the background
+    _time_state["ntp_reference"] = (int(time.time()), time.ticks_ms())
     rtc.ntp_sync(server, interval)
 
 def disable_time_sync():
@@ -27,4 +30,158 @@ def board_time():
     return rtc.now()
 
 def board_time_valid():
-    return (board_time()[0] >= 2020)
\ No newline at end of file
+    return (board_time()[0] >= 2020)
+
+# time sources with their confidence, the board time is validated or set from the available source with
+# the highest confidence, so it does not need a separate NTP session if e.g. the GNSS receiver has the time
+TIME_CONFIDENCE_NONE = 0
+TIME_CONFIDENCE_HTTP = 1  # Date header of a backend response, 1 s resolution plus the response delay
+TIME_CONFIDENCE_NTP = 2
+TIME_CONFIDENCE_GNSS = 3
+
+# the board time is only corrected if it differs more than this from the source, in seconds
+_TIME_TOLERANCE = {TIME_CONFIDENCE_HTTP: 3, TIME_CONFIDENCE_NTP: 0, TIME_CONFIDENCE_GNSS: 1}
+
+_time_sources = []  # [confidence, name, function returning the UTC time in seconds since 1970 or None]
+# the source, confidence and offset of the board time in this cycle, the board time before the NTP sync
+_time_state = {"source": None, "confidence": TIME_CONFIDENCE_NONE, "offset": None, "corrected": False,
+               "ntp_reference": None}
+
+def add_time_source(name: str, confidence: int, get_time):
+    """
+    Add a time source.
+    :param name: the name of the source, e.g. "gnss"
+    :param confidence: the confidence of its time, see TIME_CONFIDENCE_*
+    :param get_time: a function returning the current UTC time in seconds since 1970 or None if the
+                     source has no time (yet)
+    """
+    _time_sources.append([confidence, name, get_time])
+    _time_sources.sort(key=lambda source: -source[0])
+
+def sync_time(min_confidence: int = TIME_CONFIDENCE_HTTP) -> bool:
+    """
+    Validate the board time with the available source with the highest confidence, and correct it if it
+    differs more than the tolerance of the source. Sources with less confidence than the board time already
+    has in this cycle are not used.
+    :param min_confidence: the minimal confidence of the source
+    :return: whether a source had the time
+    """
+    for confidence, name, get_time in _time_sources:
+        if confidence < max(min_confidence, _time_state["confidence"]):
+            break
+        now = get_time()
+        if now is None:
+            continue
+        offset = now - _unsynced_time() if name == "ntp" else now - int(time.time())
+        corrected = not board_time_valid() or abs(offset) > _TIME_TOLERANCE[confidence]
+        if corrected:
+            set_board_time(now)
+            print("\ttime set from {} (corrected by {} s)".format(name, offset))
+        _time_state["source"] = name
+        _time_state["confidence"] = confidence
+        _time_state["offset"] = offset
+        _time_state["corrected"] = corrected
+        return True
+    return False
+
+def _unsynced_time() -> int:
+    """
+    Get the board time as it would be without the NTP sync (which sets the time in the background).
+    """
+    reference, ticks = _time_state["ntp_reference"]
+    return reference + time.ticks_diff(time.ticks_ms(), ticks) // 1000
+
+def set_board_time(now: int):
+    """
+    :param now: the UTC time in seconds since 1970
+    """
+    rtc.init(time.gmtime(now)[:6])
+
+def time_offset() -> int or None:
+    """
+    Get the offset of the board time to the source it was validated with in this cycle, before it was
+    corrected, positive if the board time was behind.
+    """
+    return _time_state["offset"]
+
+def time_corrected() -> bool:
+    """
+    Check whether the board time was set to the time of the source it was validated with in this cycle,
+    it is not if the offset is within the tolerance of the source.
+    """
+    return _time_state["corrected"]
+
+def time_source() -> (str, int):
+    """
+    Get the source the board time was validated with in this cycle and its confidence.
+    """
+    return _time_state["source"], _time_state["confidence"]
+
+def ntp_time() -> int or None:
+    """
+    Time source: the board time after a NTP sync (see enable_time_sync).
+    """
+    return int(time.time()) if rtc.synced() else None
+
+_MONTHS = (b"Jan", b"Feb", b"Mar", b"Apr", b"May", b"Jun", b"Jul", b"Aug", b"Sep", b"Oct", b"Nov", b"Dec")
+
+def http_date_time(last_date: tuple or None) -> int or None:
+    """
+    Time source: the Date header of a HTTP response, e.g. b"Mon, 19 Oct 2026 12:00:00 GMT", advanced by
+    the time since the response was received.
+    :param last_date: the header value and the ticks_ms when it was received (see urequests.last_date)
+    """
+    if last_date is None:
+        return None
+    date, ticks = last_date
+    try:
+        _, day, month, year, clock, _ = date.split()
+        hours, minutes, seconds = clock.split(b":")
+        return time.mktime((int(year), _MONTHS.index(month) + 1, int(day), int(hours), int(minutes),
+                            int(seconds), 0, 0)) + time.ticks_diff(time.ticks_ms(), ticks) // 1000
+    except (AttributeError, ValueError):
+        return None
+
+# the RTC memory keeps its content during deepsleep, it is shared by several users which each store
+# their data in a section: magic, then per section its id and length (">BH") followed by the data
+RTC_MEMORY_DELTA_FILTER = 1
+RTC_MEMORY_GNSS = 2
+RTC_MEMORY_AGNSS = 3
+
+_RTC_MEMORY_MAGIC = b'\xa5'
+
+def _rtc_memory_sections() -> dict:
+    memory = rtc.memory()
+    sections = {}
+    if memory[:1] != _RTC_MEMORY_MAGIC:
+        return sections
+    i = 1
+    while i + 3 <= len(memory):
+        section, length = struct.unpack_from(">BH", memory, i)
+        if section == 0 or i + 3 + length > len(memory):
+            break
+        sections[section] = memory[i + 3:i + 3 + length]
+        i += 3 + length
+    return sections
+
+def load_rtc_memory(section: int) -> bytes or None:
+    """
+    Load the data of a section of the RTC memory.
+    :param section: the section, see RTC_MEMORY_*
+    :return: the data or None if the section is empty
+    """
+    return _rtc_memory_sections().get(section)
+
+def store_rtc_memory(data: bytes, section: int):
+    """
+    Store data in a section of the RTC memory, the other sections are kept.
+    :param data: the data
+    :param section: the section, see RTC_MEMORY_*
+    """
+    sections = _rtc_memory_sections()
+    sections[section] = data
+    memory = bytearray(_RTC_MEMORY_MAGIC)
+    for section, data in sections.items():
+        memory += struct.pack(">BH", section, len(data))
+        memory += data
+    rtc.memory(memory)
@@ -0,0 +1,224 @@
+"""
+Deterministic serialization of data messages. This module has no dependencies on
+the pycom firmware, so the same code can be used on the host (tools/).
+"""
+import struct
+
+FLOAT_PRECISION = 2
+
+_ESCAPES = {
+    0x22: b"\\\"",
+    0x5C: b"\\\\",
+    0x08: b"\\b",
+    0x0C: b"\\f",
+    0x0A: b"\\n",
+    0x0D: b"\\r",
+    0x09: b"\\t"
+}
+
+
+def _needs_escape(s: str) -> bool:
+    return s and (min(s) < " " or "\"" in s or "\\" in s)
+
+
+def _write_json_str(buf: bytearray, s: str):
+    encoded = s.encode()
+    buf.append(0x22)
+    start = 0
+    for i, c in enumerate(encoded):
+        if c < 0x20 or c == 0x22 or c == 0x5C:
+            buf.extend(encoded[start:i])
+            buf.extend(_ESCAPES.get(c) or "\\u{:04x}".format(c).encode())
+            start = i + 1
+    buf.extend(encoded[start:])
+    buf.append(0x22)
+
+
+_KEY_CACHE_SIZE = 128  # maximal number of cached encoded map keys
+_key_cache = {}
+
+
+def _encode_json_key(key) -> bytes:
+    """
+    Get the rendering of a map key including the colon. The keys of the data messages are the same in
+    every cycle, so the encoded keys are cached (up to _KEY_CACHE_SIZE) to not check and encode them again.
+    """
+    encoded = _key_cache.get(key) if type(key) is str else None
+    if encoded is None:
+        s = str(key)
+        if _needs_escape(s):
+            buf = bytearray()
+            _write_json_str(buf, s)
+            buf.append(0x3A)  # :
+            encoded = bytes(buf)
+        else:
+            encoded = ("\"" + s + "\":").encode()
+        if type(key) is str and len(_key_cache) < _KEY_CACHE_SIZE:
+            _key_cache[key] = encoded
+    return encoded
+
+
+def _write_json(buf: bytearray, value, float_format: str):
+    value_type = type(value)
+    if value_type is float:
+        buf.extend(float_format.format(value).encode())
+    elif value_type is int:
+        buf.extend(str(value).encode())
+    elif value_type is str:
+        if _needs_escape(value):
+            _write_json_str(buf, value)
+        else:
+            buf.extend(("\"" + value + "\"").encode())
+    elif value_type is dict:
+        buf.append(0x7B)  # {
+        first = True
+        for key in sorted(value):
+            if first:
+                first = False
+            else:
+                buf.append(0x2C)  # ,
+            buf.extend(_encode_json_key(key))
+            item = value[key]
+            if type(item) is float:  # most sensor values, without the type dispatch
+                buf.extend(float_format.format(item).encode())
+            else:
+                _write_json(buf, item, float_format)
+        buf.append(0x7D)  # }
+    elif value_type is list or value_type is tuple:
+        buf.append(0x5B)  # [
+        for i, item in enumerate(value):
+            if i:
+                buf.append(0x2C)  # ,
+            _write_json(buf, item, float_format)
+        buf.append(0x5D)  # ]
+    elif value is True:
+        buf.extend(b"true")
+    elif value is False:
+        buf.extend(b"false")
+    elif value is None:
+        buf.extend(b"null")
+    elif isinstance(value, float):
+        buf.extend(float_format.format(value).encode())
+    else:
+        raise Exception("unsupported data type {} for serialization in json message".format(value_type))
+
+
+def dump_json(value, buf: bytearray, precision: int = FLOAT_PRECISION) -> bytearray:
+    """
+    Append the compact rendering of a value to a buffer. Maps are rendered with sorted keys,
+    floats as strings with a fixed number of decimals, so the rendering is deterministic.
+    :param value: the value to serialize (dict, list, tuple, str, int, float, bool or None)
+    :param buf: the buffer to append to
+    :param precision: the number of decimals of float values
+    :return: the buffer
+    """
+    _write_json(buf, value, "\"{:." + str(precision) + "f}\"")
+    return buf
+
+
+def serialize_json(msg: dict, precision: int = FLOAT_PRECISION) -> bytes:
+    """
+    create a compact sorted rendering of a json object since micropython
+    implementation of ujson.dumps does not support sorted keys
+    :param msg: the json object (dict) to serialize
+    :param precision: the number of decimals of float values (rendered as strings)
+    :return: the compact sorted rendering
+    """
+    return bytes(dump_json(msg, bytearray(), precision))
+
+
+def _write_msgpack_header(buf: bytearray, length: int, fix_type: int, fix_max: int, type8: int or None, type16: int):
+    if length <= fix_max:
+        buf.append(fix_type | length)
+    elif type8 is not None and length <= 0xFF:
+        buf.append(type8)
+        buf.append(length)
+    elif length <= 0xFFFF:
+        buf.append(type16)
+        buf.extend(struct.pack(">H", length))
+    else:
+        buf.append(type16 + 1)
+        buf.extend(struct.pack(">I", length))
+
+
+def dump_msgpack(value, buf: bytearray) -> bytearray:
+    """
+    Append the msgpack encoding of a value to a buffer. Integers, strings, binaries, arrays and maps
+    use the smallest representation, map keys are sorted and floats are encoded as float 32,
+    so the encoding is deterministic.
+    :param value: the value to serialize (dict, list, tuple, str, bytes, int, float, bool or None)
+    :param buf: the buffer to append to
+    :return: the buffer
+    """
+    value_type = type(value)
+    if value_type is str:
+        encoded = value.encode()
+        _write_msgpack_header(buf, len(encoded), 0xA0, 31, 0xD9, 0xDA)
+        buf.extend(encoded)
+    elif value_type is int:
+        if 0 <= value < 0x80:
+            buf.append(value)  # positive fixint
+        elif -32 <= value < 0:
+            buf.append(value & 0xFF)  # negative fixint
+        elif value > 0:
+            if value <= 0xFF:
+                buf.append(0xCC)
+                buf.append(value)
+            elif value <= 0xFFFF:
+                buf.append(0xCD)
+                buf.extend(struct.pack(">H", value))
+            elif value <= 0xFFFFFFFF:
+                buf.append(0xCE)
+                buf.extend(struct.pack(">I", value))
+            else:
+                buf.append(0xCF)
+                buf.extend(struct.pack(">Q", value))
+        else:
+            if value >= -0x80:
+                buf.append(0xD0)
+                buf.extend(struct.pack(">b", value))
+            elif value >= -0x8000:
+                buf.append(0xD1)
+                buf.extend(struct.pack(">h", value))
+            elif value >= -0x80000000:
+                buf.append(0xD2)
+                buf.extend(struct.pack(">i", value))
+            else:
+                buf.append(0xD3)
+                buf.extend(struct.pack(">q", value))
+    elif value_type is float:
+        buf.append(0xCA)
+        buf.extend(struct.pack(">f", value))
+    elif value_type is dict:
+        _write_msgpack_header(buf, len(value), 0x80, 15, None, 0xDE)
+        for key in sorted(value):
+            dump_msgpack(key, buf)
+            dump_msgpack(value[key], buf)
+    elif value_type is list or value_type is tuple:
+        _write_msgpack_header(buf, len(value), 0x90, 15, None, 0xDC)
+        for item in value:
+            dump_msgpack(item, buf)
+    elif value_type is bytes or value_type is bytearray:
+        _write_msgpack_header(buf, len(value), 0, -1, 0xC4, 0xC5)
+        buf.extend(value)
+    elif value is True:
+        buf.append(0xC3)
+    elif value is False:
+        buf.append(0xC2)
+    elif value is None:
+        buf.append(0xC0)
+    elif isinstance(value, float):
+        buf.append(0xCA)
+        buf.extend(struct.pack(">f", value))
+    else:
+        raise Exception("unsupported data type {} for serialization in msgpack message".format(value_type))
+    return buf
+
+
+def serialize_msgpack(msg: dict) -> bytes:
+    """
+    create a compact and deterministic msgpack rendering of a map
+    :param msg: the map to serialize
+    :return: the msgpack encoded message
+    """
+    return bytes(dump_msgpack(msg, bytearray()))
@@ -1,2 +1,3 @@
 from .ubirch_api import API
 from .ubirch_sim import SimProtocol, ModemInterface
+from .ubirch_upp import UPP, decode_upp
@@ -1,20 +1,206 @@
 import urequests as requests
-from ubinascii import b2a_base64
+from binascii import b2a_base64
 from uuid import UUID
 
 
-def _send_request(url: str, data: bytes, headers: dict) -> (int, bytes):
+def _send_request(url: str, data: bytes, headers: dict, raw_headers: bytes = None,
+                  writer: requests.RequestWriter = None) -> (int, bytes):
     """
     Send a http post request to the backend.
     :param url: the backend service URL
     :param data: the data to send to the backend
     :param headers: the headers for the request
+    :param raw_headers: additional pre-encoded header lines
+    :param writer: the request buffer to use
     :return: the backend response status code, the backend response content (body)
     """
-    r = requests.post(url=url, data=data, headers=headers)
+    r = requests.post(url=url, data=data, headers=headers, raw_headers=raw_headers, writer=writer)
     return r.status_code, r.content
 
 
+def _encode_headers(headers: dict) -> bytes:
+    """
+    Pre-encode headers to the raw header lines as they are written to the wire.
+    """
+    encoded = b""
+    for k in headers:
+        encoded += "{}: {}\r\n".format(k, headers[k]).encode()
+    return encoded
+
+
+SERVICE_NIOMON = "niomon"
+SERVICE_DATA = "data"
+SERVICE_DATA_MSGPACK = "data_msgpack"
+SERVICE_BOOTSTRAP = "bootstrap"
+SERVICE_IDENTITY = "identity"
+
+
+class Transport:
+    """
+    Interface for the transport of requests to the ubirch backend services.
+    Transports implement request(method, service, data, uuid, imsi, authenticate) -> (int, bytes),
+    see HTTPTransport.request.
+    """
+
+    def request_many(self, service: str, bodies: list, uuid: UUID) -> list:
+        """
+        Send a POST request per body to a ubirch backend service.
+        Transports that can batch requests override this, by default they are sent one by one.
+        :param service: the backend service (SERVICE_*)
+        :param bodies: the request bodies
+        :param uuid: the sender's UUID
+        :return: a list with a (status code, content) tuple per body, or None if the request failed
+        """
+        results = []
+        for body in bodies:
+            try:
+                results.append(self.request("POST", service, body, uuid=uuid))
+            except Exception as e:
+                print("\tsending failed: {}".format(e))
+                results.append(None)
+        return results
+
+
+class HTTPTransport(Transport):
+    """Transport via HTTP(S), directly to the ubirch backend services."""
+
+    def __init__(self, cfg: dict, credential: str):
+        self.urls = {
+            SERVICE_NIOMON: cfg['niomon'],
+            SERVICE_DATA: cfg['data'] + "/json",
+            SERVICE_DATA_MSGPACK: cfg['data'] + "/msgPack",
+            SERVICE_BOOTSTRAP: cfg['bootstrap'],
+            SERVICE_IDENTITY: cfg['identity']
+        }
+        self._ubirch_headers = {
+            'X-Ubirch-Credential': credential,
+            'X-Ubirch-Auth-Type': 'ubirch'
+        }
+        # the static ubirch headers are encoded once, only the hardware ID line changes with the UUID
+        self._ubirch_headers_raw = _encode_headers(self._ubirch_headers)
+        self._raw_headers_uuid = None
+        self._raw_headers = None
+        self.writer = requests.RequestWriter()
+
+    def _get_raw_headers(self, uuid: UUID) -> bytes:
+        """
+        Get the pre-encoded ubirch headers including the hardware ID header for the UUID.
+        """
+        if uuid is not self._raw_headers_uuid:
+            self._raw_headers = self._ubirch_headers_raw + _encode_headers({'X-Ubirch-Hardware-Id': str(uuid)})
+            self._raw_headers_uuid = uuid
+        return self._raw_headers
+
+    def request(self, method: str, service: str, data: bytes = None, uuid: UUID = None, imsi: str = None,
+                authenticate: bool = True) -> (int, bytes):
+        """
+        Send a request to a ubirch backend service.
+        :param method: "GET" or "POST"
+        :param service: the backend service (SERVICE_*)
+        :param data: the request body
+        :param uuid: the sender's UUID, if the request is sent on behalf of an identity
+        :param imsi: the SIM IMSI, if the request is sent on behalf of a SIM
+        :param authenticate: whether to send the ubirch auth token
+        :return: the server response status code, the server response content (body)
+        """
+        url = self.urls[service]
+        if not authenticate:
+            headers, raw_headers = {'Content-Type': 'application/octet-stream'}, None
+        elif uuid is not None:
+            headers, raw_headers = {}, self._get_raw_headers(uuid)
+        else:
+            headers, raw_headers = {}, self._ubirch_headers_raw
+        if imsi is not None:
+            headers['X-Ubirch-IMSI'] = imsi
+
+        if method == "POST":
+            return _send_request(url=url, data=data, headers=headers, raw_headers=raw_headers, writer=self.writer)
+        r = requests.request(method, url=url, headers=headers, raw_headers=raw_headers, writer=self.writer)
+        return r.status_code, r.content
+
+    def request_many(self, service: str, bodies: list, uuid: UUID) -> list:
+        try:
+            return requests.pipeline("POST", self.urls[service], bodies, raw_headers=self._get_raw_headers(uuid),
+                                     writer=self.writer)
+        except Exception as e:
+            print("\tsending failed: {}".format(e))
+            return [None] * len(bodies)
+
+
+# CoAP resources of the ubirch CoAP gateway
+COAP_PATHS = {
+    SERVICE_NIOMON: "upp",
+    SERVICE_DATA: "data/json",
+    SERVICE_DATA_MSGPACK: "data/msgpack",
+    SERVICE_BOOTSTRAP: "bootstrap",
+    SERVICE_IDENTITY: "csr"
+}
+
+# CoAP options (experimental use range, elective) carrying the ubirch headers
+COAP_OPTION_HARDWARE_ID = 65000  # UUID, 16 bytes binary
+COAP_OPTION_CREDENTIAL = 65004  # X-Ubirch-Credential
+COAP_OPTION_IMSI = 65008  # X-Ubirch-IMSI
+
+
+def _coap_to_http_status(code: int) -> int:
+    """
+    Map a CoAP response code to the equivalent HTTP status code.
+    """
+    code_class, detail = code >> 5, code & 0x1F
+    if code_class == 2:
+        return 201 if detail == 1 else 200
+    return code_class * 100 + detail
+
+
+class CoAPTransport(Transport):
+    """
+    Transport via CoAP over UDP to a CoAP gateway, which forwards the requests to the ubirch backend services.
+    Saves the TCP and TLS handshakes and the HTTP headers on every request.
+    """
+
+    def __init__(self, gateway_url: str, credential: str, block_size: int = 512):
+        import coap
+        self._coap = coap
+        proto, _, host = gateway_url.split("/", 3)[:3]
+        if proto not in ("coap:", "coaps:"):
+            raise ValueError("Unsupported protocol: " + proto)
+        port = coap.DEFAULT_PORT if proto == "coap:" else coap.DEFAULT_PORT + 1
+        if ":" in host:
+            host, port = host.split(":", 1)
+            port = int(port)
+        self.client = coap.Client(host, port, secure=(proto == "coaps:"), block_size=block_size)
+        self._credential = (COAP_OPTION_CREDENTIAL, credential.encode())
+
+    def request(self, method: str, service: str, data: bytes = None, uuid: UUID = None, imsi: str = None,
+                authenticate: bool = True) -> (int, bytes):
+        coap = self._coap
+        options = []
+        if authenticate:
+            options.append(self._credential)
+        if uuid is not None:
+            options.append((COAP_OPTION_HARDWARE_ID, uuid.bytes))
+        if imsi is not None:
+            options.append((COAP_OPTION_IMSI, imsi.encode()))
+
+        if method == "POST":
+            content_format = coap.FORMAT_JSON if service == SERVICE_DATA else coap.FORMAT_OCTET_STREAM
+            code, content = self.client.post(COAP_PATHS[service], data, options, content_format)
+        else:
+            code, content = self.client.get(COAP_PATHS[service], options)
+        return _coap_to_http_status(code), content
+
+
+def get_transport(cfg: dict) -> Transport:
+    credential = b2a_base64(cfg['password'].encode()).decode().rstrip('\n')
+    transport = cfg['transport']
+    if transport == "http":
+        return HTTPTransport(cfg, credential)
+    elif transport == "coap":
+        return CoAPTransport(cfg['coap_gateway'], credential)
+    else:
+        raise Exception("Transport {} not supported. Supported transports: 'http' and 'coap'".format(transport))
+
+
 class API:
     """ubirch API accessor methods."""
 
@@ -25,10 +211,7 @@ class API:
         self.data_service_url = cfg['data']
         self.auth_service_url = cfg['niomon']
         self.bootstrap_service_url = cfg['bootstrap']
-        self._ubirch_headers = {
-            'X-Ubirch-Credential': b2a_base64(cfg['password']).decode().rstrip('\n'),
-            'X-Ubirch-Auth-Type': 'ubirch'
-        }
+        self.transport = get_transport(cfg)
 
     def send_upp(self, uuid: UUID, upp: bytes) -> (int, bytes):
         """
@@ -40,10 +223,19 @@ class API:
         """
         if self.debug:
             print("** sending UPP to " + self.auth_service_url)
-        self._ubirch_headers['X-Ubirch-Hardware-Id'] = str(uuid)
-        return _send_request(url=self.auth_service_url,
-                             data=upp,
-                             headers=self._ubirch_headers)
+        return self.transport.request("POST", SERVICE_NIOMON, upp, uuid=uuid)
+
+    def send_upps(self, uuid: UUID, upps: list) -> list:
+        """
+        Send multiple UPPs to the authentication service, with HTTP they are pipelined over one connection.
+        :param uuid: the sender's UUID
+        :param upps: the msgpack encoded UPPs to send
+        :return: a list with the server response (status code, content) per UPP in the same order,
+                 or None for UPPs which did not get a response and need to be sent again
+        """
+        if self.debug:
+            print("** sending {} UPPs to {}".format(len(upps), self.auth_service_url))
+        return self.transport.request_many(SERVICE_NIOMON, upps, uuid)
 
     def send_data(self, uuid: UUID, message: bytes) -> (int, bytes):
         """
@@ -55,10 +247,43 @@ class API:
         """
         if self.debug:
             print("** sending data message to " + self.data_service_url + "/json")
-        self._ubirch_headers['X-Ubirch-Hardware-Id'] = str(uuid)
-        return _send_request(url=self.data_service_url + "/json",
-                             data=message,
-                             headers=self._ubirch_headers)
+        return self.transport.request("POST", SERVICE_DATA, message, uuid=uuid)
+
+    def send_data_messages(self, uuid: UUID, messages: list) -> list:
+        """
+        Send multiple JSON data messages to the ubirch data service, with HTTP they are pipelined over one connection.
+        :param uuid: the sender's UUID
+        :param messages: the encoded JSON messages to send to the data service
+        :return: a list with the server response (status code, content) per message in the same order,
+                 or None for messages which did not get a response and need to be sent again
+        """
+        if self.debug:
+            print("** sending {} data messages to {}/json".format(len(messages), self.data_service_url))
+        return self.transport.request_many(SERVICE_DATA, messages, uuid)
+
+    def send_data_msgpack(self, uuid: UUID, message: bytes) -> (int, bytes):
+        """
+        Send a msgpack data message to the ubirch data service. Requires encoding before sending.
+        :param uuid: the sender's UUID
+        :param message: the msgpack encoded message to send to the data service
+        :return: the server response status code, the server response content (body)
+        """
+        if self.debug:
+            print("** sending data message to " + self.data_service_url + "/msgPack")
+        return self.transport.request("POST", SERVICE_DATA_MSGPACK, message, uuid=uuid)
+
+    def send_data_messages_msgpack(self, uuid: UUID, messages: list) -> list:
+        """
+        Send multiple msgpack data messages to the ubirch data service, with HTTP they are pipelined over one
+        connection.
+        :param uuid: the sender's UUID
+        :param messages: the msgpack encoded messages to send to the data service
+        :return: a list with the server response (status code, content) per message in the same order,
+                 or None for messages which did not get a response and need to be sent again
+        """
+        if self.debug:
+            print("** sending {} data messages to {}/msgPack".format(len(messages), self.data_service_url))
+        return self.transport.request_many(SERVICE_DATA_MSGPACK, messages, uuid)
 
     def bootstrap_sim_identity(self, imsi: str) -> (int, bytes):
         """
@@ -70,10 +295,7 @@ class API:
         """
         if self.debug:
             print("** bootstrapping identity {} at {}".format(imsi, self.bootstrap_service_url))
-        self._ubirch_headers['X-Ubirch-IMSI'] = imsi
-        r = requests.get(url=self.bootstrap_service_url, headers=self._ubirch_headers)
-        del self._ubirch_headers['X-Ubirch-IMSI']
-        return r.status_code, r.content
+        return self.transport.request("GET", SERVICE_BOOTSTRAP, imsi=imsi)
 
     def send_csr(self, csr: bytes) -> (int, bytes):
         """
@@ -82,6 +304,4 @@ class API:
         :return: the server response status code, the server response content (body)
         """
         if self.debug: print("** sending CSR to " + self.identity_service_url)
-        return _send_request(url=self.identity_service_url,
-                             data=csr,
-                             headers={'Content-Type': 'application/octet-stream'})
+        return self.transport.request("POST", SERVICE_IDENTITY, csr, authenticate=False)
@@ -0,0 +1,102 @@
+"""
+Decoder for Ubirch Protocol Packages (UPPs) of protocol version 2, signed (0x22) and chained (0x23).
+The decoded fields are memoryviews into the UPP, nothing is copied.
+"""
+
+UPP_SIGNED = 0x22
+UPP_CHAINED = 0x23
+
+UUID_LENGTH = 16
+SIGNATURE_LENGTH = 64
+
+
+class UPP:
+    """The fields of a decoded UPP, binary fields are memoryviews into the UPP."""
+
+    def __init__(self, version: int, uuid: memoryview, prev_signature: memoryview or None, payload_type: int,
+                 payload: memoryview, signature: memoryview, signed: memoryview):
+        self.version = version
+        self.uuid = uuid
+        self.prev_signature = prev_signature
+        self.type = payload_type
+        self.payload = payload
+        self.signature = signature
+        self.signed = signed  # the part of the UPP covered by the signature
+
+    @property
+    def chained(self) -> bool:
+        return self.version == UPP_CHAINED
+
+
+def _read_bin(mv: memoryview, idx: int) -> (memoryview, int):
+    """
+    Read a msgpack bin (or str) field of any length width.
+    :return: the view of the field content, the index after the field
+    """
+    t = mv[idx]
+    if t == 0xC4 or t == 0xD9:
+        length = mv[idx + 1]
+        idx += 2
+    elif t == 0xC5 or t == 0xDA:
+        length = (mv[idx + 1] << 8) | mv[idx + 2]
+        idx += 3
+    elif t == 0xC6 or t == 0xDB:
+        length = (mv[idx + 1] << 24) | (mv[idx + 2] << 16) | (mv[idx + 3] << 8) | mv[idx + 4]
+        idx += 5
+    elif 0xA0 <= t <= 0xBF:
+        length = t & 0x1F
+        idx += 1
+    else:
+        raise ValueError("expected bin at index {}, got 0x{:02X}".format(idx, t))
+    end = idx + length
+    if end > len(mv):
+        raise ValueError("bin at index {} exceeds UPP".format(idx))
+    return mv[idx:end], end
+
+
+def _read_uint(mv: memoryview, idx: int) -> (int, int):
+    t = mv[idx]
+    if t <= 0x7F:
+        return t, idx + 1
+    if t == 0xCC:
+        return mv[idx + 1], idx + 2
+    if t == 0xCD:
+        return (mv[idx + 1] << 8) | mv[idx + 2], idx + 3
+    raise ValueError("expected unsigned integer at index {}, got 0x{:02X}".format(idx, t))
+
+
+def decode_upp(upp) -> UPP:
+    """
+    Decode and validate a signed or chained UPP.
+    Throws ValueError if the UPP is malformed.
+    :param upp: the msgpack encoded UPP (bytes, bytearray or memoryview)
+    :return: the decoded UPP
+    """
+    mv = memoryview(upp)
+    try:
+        if mv[0] == 0x95 and mv[1] == UPP_SIGNED:
+            version = UPP_SIGNED
+        elif mv[0] == 0x96 and mv[1] == UPP_CHAINED:
+            version = UPP_CHAINED
+        else:
+            raise ValueError("not a UPP (header 0x{:02X}{:02X})".format(mv[0], mv[1]))
+
+        uuid, idx = _read_bin(mv, 2)
+        if len(uuid) != UUID_LENGTH:
+            raise ValueError("invalid UUID length {}".format(len(uuid)))
+        prev_signature = None
+        if version == UPP_CHAINED:
+            prev_signature, idx = _read_bin(mv, idx)
+            if len(prev_signature) != SIGNATURE_LENGTH:
+                raise ValueError("invalid previous signature length {}".format(len(prev_signature)))
+        payload_type, idx = _read_uint(mv, idx)
+        payload, idx = _read_bin(mv, idx)
+        signed_end = idx
+        signature, idx = _read_bin(mv, idx)
+    except IndexError:
+        raise ValueError("UPP truncated")
+    if len(signature) != SIGNATURE_LENGTH:
+        raise ValueError("invalid signature length {}".format(len(signature)))
+    if idx != len(mv):
+        raise ValueError("{} trailing bytes after signature".format(len(mv) - idx))
+    return UPP(version, uuid, prev_signature, payload_type, payload, signature, mv[:signed_end])
@@ -1,4 +1,22 @@
-import usocket
+import time
+
+try:
+    import usocket
+except ImportError:
+    import socket as usocket
+
+try:
+    _ticks_ms = time.ticks_ms
+except AttributeError:  # CPython, e.g. the tools
+    def _ticks_ms():
+        return int(time.monotonic() * 1000)
+
+WRITE_BUFFER_SIZE = 1024  # request head and small bodies (UPPs, data messages) fit in one write
+PIPELINE_DEPTH = 4  # maximal number of pipelined requests in flight
+
+# value of the Date header of the last response and the ticks_ms when it was received,
+# a time source (see realtimeclock.http_date_time)
+last_date = None
 
 
 class Response:
@@ -33,8 +51,130 @@ class Response:
         return ujson.loads(self.content)
 
 
-def request(method, url, data=None, json=None, headers={}, stream=None):
-    # print("request POST " + url)
+class RequestWriter:
+    """
+    Assembles a HTTP request in one reusable buffer, so that the request head (and a small body)
+    leaves with a single socket write instead of one write per request line, header key and value.
+    On a TLS socket every write can become its own TLS record and radio packet.
+    """
+
+    def __init__(self, size: int = WRITE_BUFFER_SIZE):
+        self.buf = bytearray(size)
+        self.mv = memoryview(self.buf)
+        self.pos = 0
+        self.writes = 0  # number of socket writes, for statistics
+
+    def add(self, s, data):
+        if isinstance(data, str):
+            data = data.encode()
+        n = len(data)
+        if self.pos + n > len(self.buf):
+            self.flush(s)
+            if n > len(self.buf):
+                # does not fit into the buffer at all, send directly
+                self._write(s, data)
+                return
+        self.mv[self.pos:self.pos + n] = data
+        self.pos += n
+
+    def flush(self, s):
+        if self.pos > 0:
+            self._write(s, self.mv[:self.pos])
+            self.pos = 0
+
+    def _write(self, s, data):
+        s.write(data)
+        self.writes += 1
+
+
+_writer = None
+
+
+def _get_writer() -> RequestWriter:
+    global _writer
+    if _writer is None:
+        _writer = RequestWriter()
+    return _writer
+
+
+def write_request(s, method: str, host: str, path: str, headers: dict, data: bytes = None,
+                  raw_headers: bytes = None, version: str = "HTTP/1.0", flush: bool = True,
+                  writer: RequestWriter = None):
+    """
+    Write a complete HTTP request to the socket using the shared request buffer.
+    :param s: the (connected) socket to write to
+    :param method: the HTTP method
+    :param host: the host name for the Host header
+    :param path: the request path without leading slash
+    :param headers: dict with additional headers
+    :param data: the request body
+    :param raw_headers: pre-encoded header lines (b"Key: Value\r\n...") appended after headers
+    :param version: the HTTP version of the request line
+    :param flush: whether to send the request right away, otherwise it stays in the buffer
+                  (as far as it fits) to be sent together with following requests
+    :param writer: the request buffer to use, defaults to one shared by all requests
+    """
+    w = writer or _get_writer()
+    w.add(s, method)
+    w.add(s, b" /")
+    w.add(s, path)
+    w.add(s, b" ")
+    w.add(s, version)
+    w.add(s, b"\r\n")
+    if not "Host" in headers:
+        w.add(s, b"Host: ")
+        w.add(s, host)
+        w.add(s, b"\r\n")
+    # Iterate over keys to avoid tuple alloc
+    for k in headers:
+        w.add(s, k)
+        w.add(s, b": ")
+        w.add(s, headers[k])
+        w.add(s, b"\r\n")
+    if raw_headers:
+        w.add(s, raw_headers)
+    if data:
+        w.add(s, b"Content-Length: ")
+        w.add(s, str(len(data)))
+        w.add(s, b"\r\n")
+    w.add(s, b"\r\n")
+    if data:
+        # a small body goes out in the same write as the head, a large one right after it
+        w.add(s, data)
+    if flush:
+        w.flush(s)
+
+
+class _StreamSocket:
+    """
+    Wraps a CPython socket to provide the stream methods of a MicroPython socket,
+    so the host side tools can use this module.
+    """
+
+    def __init__(self, s):
+        self.s = s
+        self.f = s.makefile("rb")
+
+    def write(self, data):
+        self.s.sendall(data)
+        return len(data)
+
+    def readline(self):
+        return self.f.readline()
+
+    def read(self, size=-1):
+        return self.f.read(size)
+
+    def close(self):
+        self.f.close()
+        self.s.close()
+
+
+def _open(url):
+    """
+    Open a connection to the host of the URL.
+    :return: the connected socket, the host, the path
+    """
     try:
         proto, dummy, host, path = url.split("/", 3)
     except ValueError:
@@ -52,9 +192,10 @@ def request(method, url, data=None, json=None, headers={}, stream=None):
         host, port = host.split(":", 1)
         port = int(port)
 
-    usocket.dnsserver(1, '8.8.4.4')
-    usocket.dnsserver(0, '8.8.8.8')
-    # print(usocket.dnsserver())
+    if hasattr(usocket, "dnsserver"):
+        usocket.dnsserver(1, '8.8.4.4')
+        usocket.dnsserver(0, '8.8.8.8')
+        # print(usocket.dnsserver())
 
     ai = usocket.getaddrinfo(host, port)
     addr = ai[0][-1]
@@ -65,25 +206,108 @@ def request(method, url, data=None, json=None, headers={}, stream=None):
         s = ussl.wrap_socket(s, server_hostname=host)
     try:
         s.connect(addr)
-        s.write(b"%s /%s HTTP/1.0\r\n" % (method, path))
-        if not "Host" in headers:
-            s.write(b"Host: %s\r\n" % host)
-        # Iterate over keys to avoid tuple alloc
-        for k in headers:
-            s.write(k)
-            s.write(b": ")
-            s.write(headers[k])
-            s.write(b"\r\n")
+    except OSError:
+        s.close()
+        raise
+    if not hasattr(s, "readline"):
+        s = _StreamSocket(s)
+    return s, host, path
+
+
+def _read_exactly(s, size: int) -> bytes:
+    data = s.read(size)
+    while len(data) < size:
+        chunk = s.read(size - len(data))
+        if not chunk:
+            raise OSError("connection closed before the response was complete")
+        data += chunk
+    return data
+
+
+def _read_response(s) -> (int, bytes, bool):
+    """
+    Read one response of a persistent HTTP/1.1 connection.
+    :return: the status code, the content, whether the server closes the connection
+    """
+    global last_date
+    l = s.readline().split(None, 2)
+    if len(l) < 2:
+        raise OSError("connection closed before the response")
+    status = int(l[1])
+    close = l[0] != b"HTTP/1.1"
+    length = None
+    while True:
+        l = s.readline()
+        if not l or l == b"\r\n":
+            break
+        lower = l.lower()
+        if lower.startswith(b"content-length:"):
+            length = int(l[15:])
+        elif lower.startswith(b"connection:"):
+            close = b"close" in lower
+        elif lower.startswith(b"date:"):
+            last_date = (l[5:].strip(), _ticks_ms())
+        elif lower.startswith(b"transfer-encoding:") and b"chunked" in lower:
+            raise ValueError("Unsupported " + l.decode())
+    if length is None:
+        # the body ends with the connection
+        return status, s.read(), True
+    return status, _read_exactly(s, length), close
+
+
+def pipeline(method, url, bodies: list, headers={}, raw_headers=None, depth: int = PIPELINE_DEPTH,
+             writer: RequestWriter = None) -> list:
+    """
+    Send one request per body to the same URL over a single persistent connection (HTTP/1.1 pipelining).
+    Up to `depth` requests are in flight at a time, they are written to the socket together
+    and the responses are matched to the requests in order.
+    If the connection fails or is closed by the server, the remaining requests are reported as
+    unanswered, so they can be retried on their own.
+    :return: a list with a (status code, content) tuple per body, or None for unanswered requests
+    """
+    results = [None] * len(bodies)
+    if not bodies:
+        return results
+    s, host, path = _open(url)
+    w = writer or _get_writer()
+    w.pos = 0  # drop anything left in the buffer by a failed request
+    sent = 0
+    received = 0
+    try:
+        while received < len(bodies):
+            if sent == received:
+                # window is empty: write the next batch of requests in as few writes as possible
+                while sent < len(bodies) and sent - received < depth:
+                    write_request(s, method, host, path, headers, bodies[sent], raw_headers,
+                                  version="HTTP/1.1", flush=False, writer=w)
+                    sent += 1
+                w.flush(s)
+            status, content, close = _read_response(s)
+            results[received] = (status, content)
+            received += 1
+            if close:
+                break
+    except (OSError, ValueError, IndexError) as e:
+        print("\tpipeline interrupted after {} of {} responses: {}".format(received, len(bodies), e))
+    finally:
+        s.close()
+    return results
+
+
+def request(method, url, data=None, json=None, headers={}, stream=None, raw_headers=None, writer=None):
+    global last_date
+    # print("request POST " + url)
+    s, host, path = _open(url)
+    w = writer or _get_writer()
+    w.pos = 0  # drop anything left in the buffer by a failed request
+    try:
         if json is not None:
             assert data is None
             import ujson
             data = ujson.dumps(json)
-            s.write(b"Content-Type: application/json\r\n")
-        if data:
-            s.write(b"Content-Length: %d\r\n" % len(data))
-        s.write(b"\r\n")
-        if data:
-            s.write(data)
+            headers = dict(headers)
+            headers["Content-Type"] = "application/json"
+        write_request(s, method, host, path, headers, data, raw_headers, writer=w)
 
         l = s.readline()
         # print(l)
@@ -97,7 +321,9 @@ def request(method, url, data=None, json=None, headers={}, stream=None):
             if not l or l == b"\r\n":
                 break
             #print(l)
-            if l.startswith(b"Transfer-Encoding:"):
+            if l[:5].lower() == b"date:":
+                last_date = (l[5:].strip(), _ticks_ms())
+            elif l.startswith(b"Transfer-Encoding:"):
                 if b"chunked" in l:
                     raise ValueError("Unsupported " + l)
             elif l.startswith(b"Location:") and not 200 <= status <= 299:
@@ -0,0 +1,71 @@
+"""
+Wake-up from deepsleep on accelerometer activity (motion) with a rate limit.
+
+The activity interrupt of the LIS2HH12 is connected to the pin P13 of the GPy. To limit the rate of
+measurements triggered by motion, the device first sleeps for the rate limit period without the
+wake-up on motion and then only re-enables it (see rearm_motion_wakeup) and sleeps until the next
+regular (heartbeat) measurement is due. The time it is due is kept in the NVS in the meantime.
+"""
+import machine
+import pycom
+import time
+
+ACCELEROMETER_INT_PIN = 'P13'
+
+WAKE_RESET = "reset"
+WAKE_TIMER = "timer"
+WAKE_MOTION = "motion"
+
+_NVS_HEARTBEAT_DUE = "hb_due"
+
+
+def get_wake_reason() -> str:
+    """
+    Get the reason of the last wake-up (WAKE_*).
+    """
+    if machine.reset_cause() != machine.DEEPSLEEP_RESET:
+        return WAKE_RESET
+    if machine.wake_reason()[0] == machine.PIN_WAKE:
+        return WAKE_MOTION
+    return WAKE_TIMER
+
+
+def deepsleep(seconds: int, wake_on_motion: bool = False):
+    """
+    Go into deepsleep, execution resumes from the main.py entry point.
+    :param seconds: the time to sleep if there is no motion
+    :param wake_on_motion: wake up early on accelerometer activity, the activity interrupt of
+                           the accelerometer needs to be enabled
+    """
+    if wake_on_motion:
+        machine.pin_sleep_wakeup([ACCELEROMETER_INT_PIN], mode=machine.WAKEUP_ANY_HIGH, enable_pull=True)
+    machine.deepsleep(1000 * seconds)
+
+
+def set_heartbeat_due(heartbeat_due: int):
+    """
+    Remember the time of the next regular measurement, when sleeping for the rate limit period.
+    """
+    pycom.nvs_set(_NVS_HEARTBEAT_DUE, heartbeat_due)
+
+
+def rearm_motion_wakeup():
+    """
+    Re-enable the wake-up on motion after the rate limit period and sleep until the next regular
+    measurement is due. Returns if this is no wake-up after a rate limit period or if the next
+    measurement is already due.
+    """
+    if get_wake_reason() != WAKE_TIMER:
+        return
+    try:
+        heartbeat_due = pycom.nvs_get(_NVS_HEARTBEAT_DUE)
+        pycom.nvs_erase(_NVS_HEARTBEAT_DUE)
+    except ValueError:
+        return  # not set
+    if heartbeat_due is None:
+        return
+
+    sleep_time = heartbeat_due - int(time.time())
+    if sleep_time > 0:
+        print(">> enabling wake-up on motion, going into deepsleep for {} seconds".format(sleep_time))
+        deepsleep(sleep_time, wake_on_motion=True)
@@ -12,17 +12,26 @@ wdt = machine.WDT(
     timeout=5 * 60 * 1000)  # we set it to 5 minutes here and will reconfigure it when we have loaded the configuration
 wdt.feed()  # we only feed it once since this code hopefully finishes with deepsleep (=no WDT) before reset_after_ms
 
+# wake-up on motion mode: at the end of the rate limit period only enable the wake-up on motion and sleep again
+from wakeup import *
+rearm_motion_wakeup()
+
+from agnss import AssistedGNSS
 from binascii import hexlify, b2a_base64
 from config import load_config
 from connection import get_connection, NB_IoT
+from deadband import DeltaFilter
+from drift import DriftModel
 from error_handling import *
 from helpers import *
 from modem import Modem
 from network import LTE
 from os import listdir
+from phases import PhaseTimer
 from realtimeclock import *
 
 import ubirch
+import urequests
 
 # Pycom specifics
 from pyboard import get_pyboard
@@ -41,8 +50,13 @@ COLOR_UNKNOWN_FAIL = LED_WHITE_BRIGHT
 # signal beginning of main code
 set_led(LED_PINK)
 
+# measure the time of the phases of this cycle
+phases = PhaseTimer()
+phases.start("setup")
+
 # check reset cause
 COMING_FROM_DEEPSLEEP = (machine.reset_cause() == machine.DEEPSLEEP_RESET)
+WAKE_REASON = get_wake_reason()
 
 # mount SD card if there is one
 print("++ mounting SD")
@@ -57,7 +71,11 @@ max_file_size_kb = 10240 if SD_CARD_MOUNTED else 20
 error_handler = ErrorHandler(file_logging_enabled=True, max_file_size_kb=max_file_size_kb,
                              sd_card=SD_CARD_MOUNTED)
 try:
+    # load the provisioning state (IMSI, PIN, UUID, CSRs), this avoids searching the file system for it
+    manifest = Manifest()
+
     # initialize modem
+    phases.start("modem")
     lte = LTE()
     modem = Modem(lte, error_handler)
 
@@ -70,6 +88,7 @@ try:
         print("++ getting IMSI")
         imsi = modem.get_imsi()
         print("IMSI: " + imsi)
+        manifest.update(imsi=imsi)
     except Exception as e:
         print("\tERROR setting up modem")
         error_handler.log(e, COLOR_MODEM_FAIL)
@@ -83,13 +102,18 @@ try:
 
     # load configuration, blocks in case of failure
     print("++ loading config")
+    phases.start("config")
     try:
-        cfg = load_config(sd_card_mounted=SD_CARD_MOUNTED)
+        # the compiled configuration is only used when coming from deepsleep, after a reset
+        # (e.g. after uploading new config files) the config files are always compiled again
+        cfg = load_config(sd_card_mounted=SD_CARD_MOUNTED, use_cache=COMING_FROM_DEEPSLEEP)
 
         lvl_debug = cfg['debug']  # set debug level
         if lvl_debug: print("\t" + repr(cfg))
 
-        interval = cfg['interval']  # set measurement interval
+        interval = cfg['interval']  # set measurement and sending interval
+        sample_interval = cfg['sample_interval'] or interval  # in batching mode measure more often than sending
+        samples_per_transmission = max(1, interval // sample_interval)
         sensors = get_pyboard(cfg['board'])  # initialise the sensors on the pyboard
         connection = get_connection(lte, cfg)  # initialize connection object depending on config
         api = ubirch.API(cfg)  # set up API for backend communication
@@ -99,6 +123,35 @@ try:
         while True:
             machine.idle()
 
+    # open the backlog of data messages and UPPs which have not been accepted by the backend yet
+    print("++ opening backlog")
+    backlog_size_kb = cfg['backlog_size_kb'] if SD_CARD_MOUNTED else min(cfg['backlog_size_kb'], 64)
+    backlog = Backlog(directory="/sd/" if SD_CARD_MOUNTED else "", max_size_kb=backlog_size_kb)
+    print("\t{} records pending".format(len(backlog)))
+
+    # set up the send-on-delta filter, its state is kept in the RTC memory during deepsleep
+    delta_filter = None
+    if cfg['send_on_delta']:
+        delta_filter = DeltaFilter(cfg['send_on_delta'], cfg['max_silence'],
+                                   load_rtc_memory(RTC_MEMORY_DELTA_FILTER) if COMING_FROM_DEEPSLEEP else None)
+
+    # the last GNSS fix and the TTFF statistics are kept in the RTC memory during deepsleep
+    if cfg['board'] == "pytrack":
+        sensors.gnss.configure(cfg['gnss_timeout'], cfg['gnss_fix_quality'], cfg['gnss_max_hdop'],
+                               load_rtc_memory(RTC_MEMORY_GNSS) if COMING_FROM_DEEPSLEEP else None)
+
+        # assisted GNSS: send the time, the last position and the EPO data from the SD card to the receiver,
+        # the time and position only if the receiver did not keep them in standby
+        if cfg['agnss'] and SD_CARD_MOUNTED and board_time_valid():
+            print("++ injecting GNSS assistance data")
+            agnss_state = load_rtc_memory(RTC_MEMORY_AGNSS) if COMING_FROM_DEEPSLEEP else None
+            agnss = AssistedGNSS(sensors.location, state=agnss_state)
+            sentences = agnss.inject(int(time.time()), board_time(), sensors.gnss.last_fix,
+                                     hints=not (COMING_FROM_DEEPSLEEP and cfg['gnss_standby']))
+            store_rtc_memory(agnss.get_state(), RTC_MEMORY_AGNSS)
+            print("\t{} PMTK sentences sent, EPO data age: {} hours".format(sentences,
+                                                                           agnss.epo_age(int(time.time()))))
+
     # configure watchdog and connection timeouts according to config and reset reason
     if COMING_FROM_DEEPSLEEP:
         # this is a normal boot after sleep
@@ -114,8 +167,9 @@ try:
             connection.setconnecttimeout(cfg["nbiot_extended_connect_timeout"])
 
     # get PIN from flash, or bootstrap from backend and then save PIN to flash
+    phases.start("provisioning")
     pin_file = imsi + ".bin"
-    pin = get_pin_from_flash(pin_file, imsi)
+    pin = get_pin_from_flash(pin_file, imsi, manifest)
     if pin is None:
         try:
             connection.connect()
@@ -126,6 +180,7 @@ try:
             pin = bootstrap(imsi, api)
             with open(pin_file, "wb") as f:
                 f.write(pin.encode())
+            manifest.update(pin=imsi)
         except Exception as e:
             error_handler.log(e, COLOR_BACKEND_FAIL, reset=True)
 
@@ -165,10 +220,13 @@ try:
     key_name = "ukey"
     uuid = sim.get_uuid(key_name)
     print("UUID: " + str(uuid))
+    manifest.update(uuid=str(uuid))
 
     # send a X.509 Certificate Signing Request for the public key to the ubirch identity service (once)
     csr_file = "csr_{}_{}.der".format(uuid, api.env)
-    if csr_file not in os.listdir():
+    if not manifest.has_csr(uuid, api.env) and file_exists(csr_file):
+        manifest.add_csr(uuid, api.env)  # registered by an older firmware version
+    if not manifest.has_csr(uuid, api.env):
         try:
             connection.connect()
         except Exception as e:
@@ -178,105 +236,213 @@ try:
             csr = submit_csr(key_name, cfg["CSR_country"], cfg["CSR_organization"], sim, api)
             with open(csr_file, "wb") as f:
                 f.write(csr)
+            manifest.add_csr(uuid, api.env)
         except Exception as e:
             error_handler.log(e, COLOR_BACKEND_FAIL)
 
+    # sources to validate and correct the board time with, the GNSS receiver of the Pytrack has the most
+    # accurate time and needs no network connection
+    add_time_source("ntp", TIME_CONFIDENCE_NTP, ntp_time)
+    add_time_source("http", TIME_CONFIDENCE_HTTP, lambda: http_date_time(urequests.last_date))
+    if cfg['board'] == "pytrack":
+        add_time_source("gnss", TIME_CONFIDENCE_GNSS, sensors.gnss.utc_time)
+
+    # compensate the estimated drift of the board RTC since the last wake-up, the drift model also tells
+    # if the time needs to be synced in this cycle (see below)
+    drift = DriftModel(cfg['time_sync_max_error'])
+    if board_time_valid():
+        correction = drift.compensate(int(time.time()))
+        if correction:
+            set_board_time(int(time.time()) + correction)
+            start_time += correction
+            drift.store()  # a reset in this cycle must not apply the correction again
+            print("++ compensated RTC drift of {} s".format(correction))
+
     # if the board does not have a time set, synchronize it
     print("++ checking board time\n\ttime is: ", board_time())
-    if not board_time_valid():  # time can't be correct -> connect to sync time
+    if not board_time_valid():  # time can't be correct -> get the time from GNSS or connect to sync time
         print("\ttime invalid, syncing")
-        # connect to network, set time, disconnect afterwards to speed up SIM communication
-        try:
-            connection.connect()
-            enable_time_sync()
-            print("\twaiting for time sync")
-            wait_for_sync(print_dots=False)
-        except Exception as e:
-            error_handler.log(e, COLOR_INET_FAIL, reset=True)
+        if not (cfg['board'] == "pytrack" and sensors.gnss.wait_for_time() and sync_time(TIME_CONFIDENCE_GNSS)):
+            # connect to network, set time, disconnect afterwards to speed up SIM communication
+            try:
+                connection.connect()
+                enable_time_sync()
+                print("\twaiting for time sync")
+                wait_for_sync(print_dots=False)
+                sync_time(TIME_CONFIDENCE_NTP)
+            except Exception as e:
+                error_handler.log(e, COLOR_INET_FAIL, reset=True)
 
         # set start time again with valid time
         start_time = time.time()
+        drift.add_sync(int(time.time()))
+        drift.store()
 
     if isinstance(connection, NB_IoT):
         print("\tdisconnecting")
         connection.disconnect()
 
+    # in batching mode the measurements are collected in the backlog and only sent every
+    # `samples_per_transmission` measurements (including the one of this cycle), or when the backlog fills up,
+    # measurements triggered by motion are sent immediately
+    transmit = backlog.count(KIND_UPP) + 1 >= samples_per_transmission or not COMING_FROM_DEEPSLEEP \
+               or WAKE_REASON == WAKE_MOTION or backlog.pending_size() > backlog.max_size * 3 // 4
+
+    # start the network attach if the measurement will be sent in this cycle, the modem attaches in the
+    # background while the sensors are read and the measurement is sealed (the SIM can be accessed while
+    # attaching, but not while connected); with send-on-delta it is not known yet if anything will be sent
+    if isinstance(connection, NB_IoT) and delta_filter is None and transmit:
+        print("++ starting network attach in the background")
+        connection.start_attach()
+        phases.start_background("attach", done=lte.isattached)
+
     ############
     #   DATA   #
     ############
     set_led(LED_BLUE)
+    phases.start("sensors")
 
     # get data from sensors
     print("++ getting measurements")
     data = sensors.get_data()
+    print("\t{} I2C transactions".format(sensors.i2c_transactions))
+    if cfg['board'] == "pytrack":
+        sensors.gnss.print_ttff()
+        # validate and correct the board time with the time of the fix
+        if sync_time(TIME_CONFIDENCE_GNSS):
+            drift.add_sync(int(time.time()), time_offset(), corrected=time_corrected())
+            drift.store()
+    if cfg['wake_on_motion']:
+        data['wake'] = WAKE_REASON  # "motion", "timer" (heartbeat) or "reset"
+
+    # send-on-delta: only seal and send the measurement if a value changed more than its deadband
+    # since the last sent measurement or if nothing was sent for the maximal silence period (or on motion)
+    suppressed = False
+    if delta_filter is not None:
+        if WAKE_REASON == WAKE_MOTION or delta_filter.changed(data, time.time()):
+            data['suppressed'] = delta_filter.suppressed  # number of measurements skipped before this one
+        else:
+            delta_filter.suppress()
+            store_rtc_memory(delta_filter.get_state(), RTC_MEMORY_DELTA_FILTER)
+            suppressed = True
+            print("\tmeasurement unchanged, not sending ({} suppressed, {} in total)\n".format(
+                delta_filter.suppressed, delta_filter.suppressed_total))
+
+    if not suppressed:
+        # pack data message containing measurements as well as device UUID and timestamp to ensure unique hash
+        if cfg['data_format'] == "msgpack":
+            message = pack_data_msgpack(uuid, data)
+            data_kind = KIND_DATA_MSGPACK
+            print("\tdata message [msgpack]: {}\n".format(hexlify(message).decode()))
+        else:
+            message = pack_data_json(uuid, data)
+            data_kind = KIND_DATA_JSON
+            print("\tdata message [json]: {}\n".format(message.decode()))
 
-    # pack data message containing measurements as well as device UUID and timestamp to ensure unique hash
-    message = pack_data_json(uuid, data)
-    print("\tdata message [json]: {}\n".format(message.decode()))
+        # seal the data message (data message will be hashed and inserted into UPP as payload by SIM card)
+        phases.start("sealing")
+        try:
+            print("++ creating UPP")
+            upp = sim.message_chained(key_name, message, hash_before_sign=True)
+            print("\tUPP: {}\n".format(hexlify(upp).decode()))
+            # print data message hash from generated UPP (useful for manual verification)
+            message_hash = get_upp_payload(upp)
+            print("\tdata message hash: {}".format(b2a_base64(message_hash).decode()))
+        except Exception as e:
+            error_handler.log(e, COLOR_SIM_FAIL, reset=True)
 
-    # seal the data message (data message will be hashed and inserted into UPP as payload by SIM card)
-    try:
-        print("++ creating UPP")
-        upp = sim.message_chained(key_name, message, hash_before_sign=True)
-        print("\tUPP: {}\n".format(hexlify(upp).decode()))
-        # print data message hash from generated UPP (useful for manual verification)
-        message_hash = get_upp_payload(upp)
-        print("\tdata message hash: {}".format(b2a_base64(message_hash).decode()))
-    except Exception as e:
-        error_handler.log(e, COLOR_SIM_FAIL, reset=True)
+        # queue data message and UPP, they stay in the backlog until the backend accepted them
+        backlog.put(data_kind, message)
+        backlog.put(KIND_UPP, upp)
+        if backlog.dropped > 0:
+            print("\tbacklog full, dropped {} oldest records".format(backlog.dropped))
+
+        # remember the values of the sealed measurement for the send-on-delta filter
+        if delta_filter is not None:
+            delta_filter.sent(data, time.time())
+            store_rtc_memory(delta_filter.get_state(), RTC_MEMORY_DELTA_FILTER)
 
     ###############
     #   SENDING   #
     ###############
-    set_led(LED_GREEN)
+    # nothing is sent if the measurement was suppressed by the send-on-delta filter (see `transmit` above)
+    if suppressed:
+        transmit = False
+    elif not transmit:
+        print("++ {} of {} measurements collected, not sending yet\n".format(backlog.count(KIND_UPP),
+                                                                           samples_per_transmission))
 
-    print("++ checking/establishing connection")
-    try:
-        connection.connect()
-        enable_time_sync()
-    except Exception as e:
-        error_handler.log(e, COLOR_INET_FAIL, reset=True)
+    if transmit:
+        set_led(LED_GREEN)
 
-    # send data to ubirch data service and UPP to ubirch auth service
-    # TODO: add retrying to send/handling of already created UPP in case of final failure
+        # sync the time with NTP if it was not validated with a more accurate source (GNSS) in this cycle and
+        # the predicted error of the board time exceeds the bound
+        time_sync = time_source()[1] < TIME_CONFIDENCE_NTP and drift.sync_needed(int(time.time()))
 
-    try:
-        # send data message to data service, with reconnects/modem resets if necessary
-        print("++ sending data")
+        print("++ checking/establishing connection")
         try:
-            status_code, content = send_backend_data(sim, modem, connection, api.send_data, uuid, message)
+            if isinstance(connection, NB_IoT):
+                phases.start("attach", waiting=True)
+                connection.attach()
+            phases.start("connect")
+            connection.connect()
+            if time_sync:
+                enable_time_sync()
         except Exception as e:
-            error_handler.log(e, COLOR_MODEM_FAIL, reset=True)
-
-        # communication worked in general, now check server response
-        if not 200 <= status_code < 300:
-            raise Exception("backend (data) returned error: ({}) {}".format(status_code, str(content)))
+            error_handler.log(e, COLOR_INET_FAIL, reset=True)
 
-        # send UPP to the ubirch authentication service to be anchored to the blockchain
-        print("++ sending UPP")
+        # send the backlog of data messages to the ubirch data service and UPPs to the ubirch auth service,
+        # oldest first, with reconnects/modem resets if necessary
+        phases.start("sending")
         try:
-            status_code, content = send_backend_data(sim, modem, connection, api.send_upp, uuid, upp)
-        except Exception as e:
-            error_handler.log(e, COLOR_MODEM_FAIL, reset=True)
+            print("++ sending data and UPPs ({} pending)".format(len(backlog)))
+            try:
+                errors = send_backlog(backlog, sim, modem, connection, api, uuid,
+                                      max(cfg['backlog_batch_size'], 2 * samples_per_transmission))
+            except Exception as e:
+                error_handler.log(e, COLOR_MODEM_FAIL, reset=True)
+            print("\t{} records pending".format(len(backlog)))
+
+            # communication worked in general, now check server responses
+            if errors:
+                raise Exception("\n".join(errors))
 
-        # communication worked in general, now check server response
-        if not 200 <= status_code < 300:
-            raise Exception("backend (UPP) returned error: ({}) {}".format(status_code, str(content)))
-
-    except Exception as e:
-        error_handler.log(e, COLOR_BACKEND_FAIL)
+        except Exception as e:
+            error_handler.log(e, COLOR_BACKEND_FAIL)
 
-    print("++ waiting for time sync")
-    try:
-        wait_for_sync(print_dots=True, timeout=10)
-        print("\ttime synced")
-    except Exception as e:
-        error_handler.log("WARNING: Could not sync time before timeout: {}".format(repr(e)), COLOR_INET_FAIL)
+        # if NTP does not respond the time is validated with the Date header of the backend responses
+        if time_sync:
+            phases.start("time sync")
+            print("++ waiting for time sync")
+            sync_start = time.ticks_ms()
+            try:
+                wait_for_sync(print_dots=True, timeout=10)
+                sync_time(TIME_CONFIDENCE_NTP)
+                drift.add_sync(int(time.time()), time_offset(), time.ticks_diff(time.ticks_ms(), sync_start),
+                               time_corrected())
+                drift.store()
+                print("\ttime synced")
+            except Exception as e:
+                if sync_time(TIME_CONFIDENCE_HTTP):
+                    if time_corrected():
+                        # the offset to the Date header is not accurate enough for a rate sample of the
+                        # drift model, but the sample has to start again from the corrected time
+                        drift.add_sync(int(time.time()))
+                        drift.store()
+                else:
+                    error_handler.log("WARNING: Could not sync time before timeout: {}".format(repr(e)),
+                                      COLOR_INET_FAIL, severity=SEVERITY_WARNING)
+        elif time_source()[1] < TIME_CONFIDENCE_NTP:
+            print("++ no time sync needed, predicted error {:.1f} s, saved {} ms ({} s in total)".format(
+                drift.predicted_error(int(time.time())), drift.skip(), drift.saved_ms // 1000))
+        if time_source()[0] is not None:
+            print("++ time validated with {} (confidence {})".format(*time_source()))
 
     ###################
     #   GO TO SLEEP   #
     ###################
     set_led(LED_YELLOW)
+    phases.start("sleep preparation")
 
     # prepare hardware for sleep (needed for low current draw and
     # freeing of resources for after the reset, as the modem stays on)
@@ -287,18 +453,53 @@ try:
     print("\tdeinit SIM")
     sim.deinit()
 
+    # remember the last GNSS fix and keep the receiver in standby, it keeps its almanac and ephemeris
+    # for a hot start after deepsleep
+    if cfg['board'] == "pytrack":
+        store_rtc_memory(sensors.gnss.get_state(), RTC_MEMORY_GNSS)
+        if cfg['gnss_standby']:
+            print("\tGNSS standby")
+            sensors.gnss.sleep()
+
+    # log the number of warnings and errors of this cycle, write buffered log records
+    counters = error_handler.get_counters()
+    if counters["warning"] or counters["error"]:
+        error_handler.log("cycle: {warning} warnings, {error} errors".format(**counters), LED_OFF,
+                          severity=SEVERITY_INFO)
+    print("\tflush log")
+    error_handler.flush()
+
+    print("\tstore RTC drift model")
+    drift.store()
+
     # not detaching causes smaller/no re-attach time on next reset but but
     # somewhat higher sleep current needs to be balanced based on your specific interval
     print("\tdeinit LTE")
     lte.deinit(detach=False)
 
     # go to deepsleep
-    sleep_time = interval - int(time.time() - start_time)
+    sleep_time = sample_interval - int(time.time() - start_time)
     if sleep_time < 0:
         sleep_time = 0
-    print(">> going into deepsleep for {} seconds".format(sleep_time))
+
+    # in wake-up on motion mode wake up on accelerometer activity or for the next regular measurement
+    # (heartbeat), but not within the rate limit period after this measurement
+    wake_on_motion = cfg['wake_on_motion']
+    if wake_on_motion:
+        sensors.accelerometer.enable_activity_interrupt(cfg['motion_threshold'], cfg['motion_duration'],
+                                                        handler=lambda pin: None)
+        rearm_delay = cfg['motion_rate_limit'] - int(time.time() - start_time)
+        if 0 < rearm_delay < sleep_time:
+            set_heartbeat_due(int(time.time()) + sleep_time)
+            sleep_time = rearm_delay
+            wake_on_motion = False
+
+    phases.report()
+    print(">> going into deepsleep for {} seconds{}".format(sleep_time,
+                                                             " (or until motion)" if wake_on_motion else ""))
+    end_led_signal()
     set_led(LED_OFF)
-    machine.deepsleep(1000 * sleep_time)  # sleep, execution will resume from main.py entry point
+    deepsleep(sleep_time, wake_on_motion)  # sleep, execution will resume from main.py entry point
 
 except Exception as e:
     error_handler.log(e, COLOR_UNKNOWN_FAIL, reset=True)
@@ -0,0 +1,210 @@
+"""
+Time to first fix with and without GNSS assistance, replayed from recorded NMEA output (host side, CPython).
+
+Each recording is the raw NMEA output of the L76 (e.g. captured with L76GNSS.dump_nmea), one second of
+output per RMC sentence. It is served by a stand-in for the receiver on the I2C bus with a simulated
+clock: the receiver outputs one second of the recording per second, reads return the available bytes
+padded with newlines and cost their bus time. The assistance data (agnss.AssistedGNSS) is written to the
+stand-in first (with --epo), then gnss.GNSSManager acquires the fix. Reports the TTFF, the duration of
+the acquisition (until the target quality or the timeout), the number of reads and the bus time of the
+injected PMTK sentences.
+
+The effect of the assistance is in the recording, so record the output of a cold start, a hot start and
+an assisted start on the device and replay the assisted one with --epo to include the injection cost.
+Without recordings, synthetic streams with a fix after the seconds given by --fix-after are replayed,
+which only checks the replay and injection path (the TTFF is then the given value by construction).
+
+usage: python3 tools/bench_agnss.py [recording.nmea ...] [--epo MTK14.EPO|synthetic] [--fix-after 2,8,35]
+"""
+import argparse
+import os
+import struct
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src", "lib"))
+
+from agnss import AssistedGNSS, EPO_RECORD_SIZE, EPO_SATELLITES, EPO_SEGMENT_HOURS, gps_hour
+from gnss import GNSSManager
+from nmea import NMEAParser
+
+GPS_I2CADDR = 0x10
+START = 1792411200  # 2026-10-19 12:00:00 UTC
+
+
+class Clock:
+    """Simulated time, replaces the time functions used by GNSSManager."""
+
+    def __init__(self):
+        self.ms = 0.0
+
+    def install(self):
+        time.ticks_ms = lambda: int(self.ms)
+        time.ticks_diff = lambda a, b: a - b
+        time.sleep = lambda seconds: self.advance(seconds * 1000)
+        time.time = lambda: START + self.ms / 1000
+
+    def advance(self, ms: float):
+        self.ms += ms
+
+
+class ReceiverStandIn:
+    """The L76 on the I2C bus, replaying one second of recorded output per simulated second."""
+
+    def __init__(self, seconds: list, clock: Clock, baudrate: int = 100000):
+        self.seconds = seconds
+        self.clock = clock
+        self.baudrate = baudrate
+        self.pending = b''
+        self.released = 0  # number of seconds of the recording output so far
+        self.start_ms = 0.0  # the time the recording starts, e.g. after the injection
+        self.reads = 0
+        self.written = []
+
+    def _bus(self, nbytes: int):
+        self.clock.advance((9 * (1 + nbytes) + 2) / self.baudrate * 1000)
+
+    def readfrom_into(self, addr: int, buf: bytearray):
+        while self.released < len(self.seconds) and self.released * 1000 <= self.clock.ms - self.start_ms:
+            self.pending += self.seconds[self.released]
+            self.released += 1
+        n = min(len(buf), len(self.pending))
+        buf[:n] = self.pending[:n]
+        buf[n:] = b'\n' * (len(buf) - n)
+        self.pending = self.pending[n:]
+        self.reads += 1
+        self._bus(len(buf))
+
+    def writeto(self, addr: int, data):
+        self.written.append(data)
+        self._bus(len(data))
+
+
+class Location:
+    """The parts of L76GNSS used by GNSSManager and AssistedGNSS, on the stand-in."""
+
+    def __init__(self, i2c: ReceiverStandIn, buffer: int = 64):
+        self.i2c = i2c
+        self._buf = bytearray(buffer)
+        self.nmea = NMEAParser()
+
+    def update(self) -> bool:
+        self.i2c.readfrom_into(GPS_I2CADDR, self._buf)
+        self.nmea.feed(self._buf)
+        return self._buf[0] != 0x0A or self._buf[-1] != 0x0A
+
+    def _checksum(self, nmeadata):
+        calc_cksum = 0
+        for s in nmeadata:
+            calc_cksum ^= ord(s)
+        return '{:02X}'.format(calc_cksum)
+
+    def write(self, data):
+        self.i2c.writeto(GPS_I2CADDR, '${}*{}\r\n'.format(data, self._checksum(data)))
+
+
+def split_seconds(stream: bytes) -> list:
+    """Split recorded output into seconds, each second starts with an RMC sentence."""
+    seconds = []
+    for line in stream.splitlines(keepends=True):
+        if line[3:6] == b'RMC' or not seconds:
+            seconds.append(b'')
+        seconds[-1] += line
+    return seconds
+
+
+def nmea(data: str) -> bytes:
+    checksum = 0
+    for c in data:
+        checksum ^= ord(c)
+    return '${}*{:02X}\r\n'.format(data, checksum).encode()
+
+
+def synthetic(fix_after: int, length: int) -> list:
+    seconds = []
+    for t in range(length):
+        utc = time.strftime("%H%M%S.000", time.gmtime(START + t))
+        if t < fix_after:
+            seconds.append(nmea('GNRMC,{},V,,,,,0.00,0.00,191026,,,N'.format(utc)) +
+                           nmea('GNGGA,{},,,,,0,{:02d},,,M,,M,,'.format(utc, min(t, 3))) +
+                           nmea('GNGSA,A,1,,,,,,,,,,,,,,,'))
+        else:
+            seconds.append(nmea('GNRMC,{},A,5231.2000,N,01324.0000,E,0.12,0.00,191026,,,A'.format(utc)) +
+                           nmea('GNGGA,{},5231.2000,N,01324.0000,E,1,08,1.02,35.2,M,47.9,M,,'.format(utc)) +
+                           nmea('GNGSA,A,3,05,07,13,15,20,24,28,30,,,,,1.80,1.02,1.48'))
+    return seconds
+
+
+def synthetic_epo(path: str):
+    """An EPO file of 14 days starting at the current 6 hour period, with random orbit data."""
+    start = gps_hour(START) - gps_hour(START) % EPO_SEGMENT_HOURS
+    with open(path, 'wb') as f:
+        for segment in range(14 * 24 // EPO_SEGMENT_HOURS):
+            hour = start + segment * EPO_SEGMENT_HOURS
+            for sv in range(1, EPO_SATELLITES + 1):
+                f.write(struct.pack("<I", hour | sv << 24) + os.urandom(EPO_RECORD_SIZE - 4))
+
+
+def replay(seconds: list, epo: str or None, timeout: int) -> dict:
+    clock = Clock()
+    clock.install()
+    i2c = ReceiverStandIn(seconds, clock)
+    location = Location(i2c)
+    manager = GNSSManager(location)
+    manager.configure(timeout, 1, 2.0)
+    last_fix = (START - 600, 52.52, 13.40, 1, 8, 1.0)
+
+    sentences, written = 0, 0
+    if epo is not None:
+        agnss = AssistedGNSS(location, epo)
+        sentences = agnss.inject(int(time.time()), time.gmtime(START)[:6], last_fix)
+        written = sum(len(s) for s in i2c.written)
+    inject_ms = clock.ms
+    i2c.start_ms = clock.ms
+
+    data = manager.acquire()
+    return {
+        "inject_ms": inject_ms,
+        "sentences": sentences,
+        "written": written,
+        "ttff": data["GPS_ttff"],
+        "acquisition": clock.ms - inject_ms,
+        "reads": i2c.reads
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("recordings", nargs="*", help="files with recorded NMEA output")
+    parser.add_argument("--epo", help="EPO file to inject before the replay, 'synthetic' for random orbit data")
+    parser.add_argument("--fix-after", default="2,8,35", help="fix times of the synthetic streams in seconds")
+    parser.add_argument("--timeout", type=int, default=60, help="acquisition timeout in seconds")
+    args = parser.parse_args()
+
+    streams = []
+    for path in args.recordings:
+        with open(path, 'rb') as f:
+            streams.append((os.path.basename(path), split_seconds(f.read())))
+    if not streams:
+        for fix_after in (int(s) for s in args.fix_after.split(",")):
+            streams.append(("synthetic, fix after {} s".format(fix_after), synthetic(fix_after, args.timeout + 5)))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        epo = args.epo
+        if epo == "synthetic":
+            epo = os.path.join(tmp, "MTK14.EPO")
+            synthetic_epo(epo)
+        for name, seconds in streams:
+            r = replay(seconds, epo, args.timeout)
+            print("{:30s} TTFF {:>8s}, acquisition {:6.0f} ms, {:4d} reads".format(
+                name, "{} ms".format(r["ttff"]) if r["ttff"] is not None else "no fix", r["acquisition"],
+                r["reads"]), end="")
+            if epo is not None:
+                print(", injection of {} sentences ({} bytes) took {:.1f} ms".format(
+                    r["sentences"], r["written"], r["inject_ms"]), end="")
+            print()
+
+
+if __name__ == '__main__':
+    main()
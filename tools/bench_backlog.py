@@ -0,0 +1,190 @@
+"""
+Throughput and recovery tests of the backlog (store-and-forward queue) (host side, CPython).
+
+1. Throughput: put, peek and pop rates for data message and UPP records.
+2. Recovery time: time to open a backlog with N pending records.
+3. Crash safety: simulates a reset at every byte while writing records (truncated data file),
+   an interrupted index write and interrupted compactions, then checks that the reopened
+   backlog contains exactly the committed, not yet removed records in order.
+
+usage: python3 tools/bench_backlog.py [-n 10000] [--dir /tmp/backlog-bench]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src", "lib"))
+
+from backlog import Backlog, KIND_DATA_JSON, KIND_UPP
+
+DATA = b'{"data":{"AccX":"0.01","AccY":"-0.02","AccZ":"1.01","T":"21.50","V":"4.20"},"msg_type":1,' \
+       b'"timestamp":1617181920,"uuid":"5122a5c8-0000-4000-8000-000000000001"}'
+UPP = bytes(187)
+
+
+def record(i: int) -> (int, bytes):
+    """The i-th test record, data messages and UPPs alternating, each with a unique content."""
+    if i % 2 == 0:
+        return KIND_DATA_JSON, DATA + str(i).encode()
+    return KIND_UPP, UPP + str(i).encode()
+
+
+def fresh_dir(base: str, name: str) -> str:
+    directory = os.path.join(base, name)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+    return directory + "/"
+
+
+def rate(count: int, seconds: float) -> str:
+    return "{:10.0f} records/s".format(count / seconds)
+
+
+def test_throughput(base: str, n: int):
+    directory = fresh_dir(base, "throughput")
+    backlog = Backlog(directory, max_size_kb=100000)
+    t = time.perf_counter()
+    for i in range(n):
+        backlog.put(*record(i))
+    print("put            " + rate(n, time.perf_counter() - t))
+
+    t = time.perf_counter()
+    for _ in range(0, n, 10):
+        backlog.peek(10)
+    print("peek (10)      " + rate(n, time.perf_counter() - t))
+
+    t = time.perf_counter()
+    for i in range(n):
+        backlog.pop()
+    print("pop            " + rate(n, time.perf_counter() - t))
+
+    # steady state of a device: 2 records per interval, drained in the same interval
+    t = time.perf_counter()
+    for i in range(0, n, 2):
+        backlog.put(*record(i))
+        backlog.put(*record(i + 1))
+        assert [data for _, data in backlog.peek(10)] == [record(i)[1], record(i + 1)[1]]
+        backlog.pop(2)
+    print("put/peek/pop   " + rate(n, time.perf_counter() - t))
+
+
+def test_recovery_time(base: str, n: int):
+    directory = fresh_dir(base, "recovery")
+    backlog = Backlog(directory, max_size_kb=100000)
+    for i in range(n):
+        backlog.put(*record(i))
+    backlog.pop(n // 2)
+    for pending in (n - n // 2, 0):
+        t = time.perf_counter()
+        reopened = Backlog(directory, max_size_kb=100000)
+        elapsed = time.perf_counter() - t
+        assert len(reopened) == pending
+        print("open with {:6d} pending records: {:8.2f} ms".format(pending, elapsed * 1000))
+        reopened.pop(pending)
+
+
+def expect(directory: str, expected: list):
+    backlog = Backlog(directory, max_size_kb=100000)
+    records = backlog.peek(len(expected) + 1)
+    assert records == expected, "expected {} records, got {}".format(len(expected), len(records))
+    return backlog
+
+
+def test_crash_safety(base: str):
+    directory = fresh_dir(base, "crash")
+    backlog = Backlog(directory, max_size_kb=100000)
+    for i in range(6):
+        backlog.put(*record(i))
+    backlog.pop(2)
+    committed_size = backlog.size
+    backlog.put(*record(6))
+    complete = open(backlog.path, "rb").read()
+    index = open(backlog.index_path, "rb").read()
+
+    # reset while writing record 6: every truncation of the data file
+    for size in range(committed_size, len(complete)):
+        with open(backlog.path, "wb") as f:
+            f.write(complete[:size])
+        with open(backlog.index_path, "wb") as f:
+            f.write(index)
+        expect(directory, [record(i) for i in range(2, 6)])
+        shutil.rmtree(directory[:-1])
+        os.makedirs(directory)
+    print("reset while writing a record: {} cases ok".format(len(complete) - committed_size))
+
+    # reset while appending to the index: the removal of the records is lost, they are sent again
+    for cut in range(1, 6):
+        with open(backlog.path, "wb") as f:
+            f.write(complete)
+        with open(backlog.index_path, "wb") as f:
+            f.write(index[:-cut])
+        expect(directory, [record(i) for i in range(0, 7)])
+    print("reset while writing the index: ok")
+
+    # reset during a compaction: before and after the old data file was removed
+    with open(backlog.path, "wb") as f:
+        f.write(complete)
+    with open(backlog.index_path, "wb") as f:
+        f.write(index)
+    compacted = Backlog(directory, max_size_kb=100000)
+    compacted._compact()
+    new_data, new_index = open(backlog.path, "rb").read(), open(backlog.index_path, "rb").read()
+    for state in ("tmp written", "old removed", "index tmp written", "old index removed"):
+        for path, content in ((backlog.path, complete), (backlog.index_path, index),
+                              (backlog.path + ".tmp", None), (backlog.index_path + ".tmp", None)):
+            if os.path.exists(path):
+                os.remove(path)
+            if content is not None:
+                with open(path, "wb") as f:
+                    f.write(content)
+        if state in ("tmp written", "old removed"):
+            with open(backlog.path + ".tmp", "wb") as f:
+                f.write(new_data)
+            if state == "old removed":
+                os.remove(backlog.path)
+        else:
+            os.remove(backlog.path)
+            with open(backlog.path, "wb") as f:
+                f.write(new_data)
+            with open(backlog.index_path + ".tmp", "wb") as f:
+                f.write(new_index)
+            if state == "old index removed":
+                os.remove(backlog.index_path)
+        expect(directory, [record(i) for i in range(2, 7)])
+    print("reset during a compaction: ok")
+
+    # a full backlog drops the oldest records
+    directory = fresh_dir(base, "full")
+    backlog = Backlog(directory, max_size_kb=2)
+    for i in range(20):
+        backlog.put(*record(i))
+    kept = backlog.peek(20)
+    assert kept == [record(i) for i in range(20 - len(kept), 20)] and backlog.dropped == 20 - len(kept)
+    assert os.path.getsize(backlog.path) <= 2000
+    expect(directory, kept)
+    print("full backlog: kept the newest {} of 20 records".format(len(kept)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=10000, help="number of records")
+    parser.add_argument("--dir", help="directory for the backlog files (default: a temporary directory)")
+    args = parser.parse_args()
+
+    base = args.dir or tempfile.mkdtemp(prefix="backlog-bench-")
+    try:
+        test_throughput(base, args.n)
+        print("")
+        test_recovery_time(base, args.n)
+        print("")
+        test_crash_safety(base)
+    finally:
+        if args.dir is None:
+            shutil.rmtree(base)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Amortized energy and latency per data point of the batching mode (host side, CPython).
+
+Simulates the main.py cycle for different numbers of measurements per transmission (1 is the
+flow without batching): every sample interval a measurement is taken and signed and queued in
+the backlog, every N samples the radio is brought up (network attach) and the backlog is sent
+to the mock ubirch backend (mock_backend.py) in one session, like helpers.send_backlog: the data
+messages and the UPPs are each sent in one batch, pipelined over one connection. Network attach and request latency
+are simulated with delays, scaled by --time-scale to keep the run short, boot, sensors and signing
+are accounted with --wake-time, and the times are converted to energy with the given currents of the GPy.
+
+usage: python3 tools/bench_batching.py [--batch-sizes 1,2,4,8,16] [--samples 32] [--sample-interval 600]
+                                       [--attach-time 6] [--request-time 1.5] [--time-scale 0.01]
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid as std_uuid
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src", "lib"))
+
+import ubirch
+from backlog import Backlog, KIND_DATA_JSON, KIND_UPP
+from mock_backend import MockBackend
+from serialize import serialize_json
+
+UUID = std_uuid.UUID(int=0x5122 << 112)
+VOLTAGE = 3.7
+
+
+def make_upp(message: bytes, prev_signature: bytes) -> (bytes, bytes):
+    signature = os.urandom(64)
+    return b"\x96\x23\xc4\x10" + UUID.bytes + b"\xc4\x40" + prev_signature + b"\x00\xc4\x20" \
+           + hashlib.sha256(message).digest() + b"\xc4\x40" + signature, signature
+
+
+def run(args, batch_size: int, base: str) -> dict:
+    directory = os.path.join(base, str(batch_size)) + "/"
+    os.makedirs(directory)
+    backend = MockBackend(password="secret", latency=args.request_time * args.time_scale, strict_chain=True)
+    backend.start()
+    api = ubirch.API(backend.config())
+    backlog = Backlog(directory)
+    functions = {KIND_DATA_JSON: api.send_data_messages, KIND_UPP: api.send_upps}
+
+    prev_signature = bytes(64)
+    sample_times = []  # (virtual) time of the measurement of the pending samples
+    latencies = []  # time from measurement to acceptance by the backend per data point
+    radio_time = 0.0  # time with the radio in use (attach and requests)
+    connections = 0
+    for i in range(args.samples):
+        now = i * args.sample_interval
+        message = serialize_json({'uuid': str(UUID), 'msg_type': 1, 'timestamp': int(time.time()) + i,
+                                  'data': {"T": 21.5, "H": 45.0, "P": 101325.0}})
+        upp, prev_signature = make_upp(message, prev_signature)
+        backlog.put(KIND_DATA_JSON, message)
+        backlog.put(KIND_UPP, upp)
+        sample_times.append(now + args.wake_time)
+
+        if backlog.count(KIND_UPP) >= batch_size:
+            t = time.perf_counter()
+            time.sleep(args.attach_time * args.time_scale)
+            records = backlog.peek(len(backlog))
+            for kind in functions:
+                responses = functions[kind](UUID, [data for k, data in records if k == kind])
+                assert all(r is not None and 200 <= r[0] < 300 for r in responses), responses
+                connections += 1
+            backlog.pop(len(records))
+            session = (time.perf_counter() - t) / args.time_scale
+            radio_time += session
+            latencies.extend(now + args.wake_time + session - t0 for t0 in sample_times)
+            sample_times = []
+    backend.stop()
+
+    samples = args.samples - len(sample_times)
+    awake = args.samples * args.wake_time  # boot, sensors and signing in every cycle
+    charge = awake * args.wake_current + radio_time * args.radio_current \
+             + (args.samples * args.sample_interval - awake - radio_time) * args.sleep_current  # mAs
+    return {
+        "radio": radio_time / samples,
+        "connections": connections / samples,
+        "energy": charge * VOLTAGE / samples,  # mJ
+        "latency": sum(latencies) / len(latencies)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-sizes", default="1,2,4,8,16", help="measurements per transmission")
+    parser.add_argument("--samples", type=int, default=32, help="number of simulated measurements")
+    parser.add_argument("--sample-interval", type=float, default=600, help="measure interval in seconds")
+    parser.add_argument("--wake-time", type=float, default=5, help="boot, sensor and SIM signing time in seconds")
+    parser.add_argument("--attach-time", type=float, default=6, help="network attach and connect time in seconds")
+    parser.add_argument("--request-time", type=float, default=1.5, help="time per backend request in seconds")
+    parser.add_argument("--wake-current", type=float, default=60, help="current while awake in mA")
+    parser.add_argument("--radio-current", type=float, default=150, help="current while using the radio in mA")
+    parser.add_argument("--sleep-current", type=float, default=0.05, help="current in deep sleep in mA")
+    parser.add_argument("--time-scale", type=float, default=0.01, help="factor for the simulated delays")
+    args = parser.parse_args()
+
+    base = tempfile.mkdtemp(prefix="batching-bench-")
+    try:
+        print("{:>6s} {:>15s} {:>13s} {:>15s} {:>13s}".format(
+            "batch", "radio/point [s]", "conn/point", "energy/pt [mJ]", "latency [s]"))
+        baseline = None
+        for batch_size in [int(b) for b in args.batch_sizes.split(",")]:
+            r = run(args, batch_size, base)
+            baseline = baseline or r
+            print("{:6d} {:15.2f} {:13.2f} {:15.1f} {:13.0f}   ({:.0f}% energy)".format(
+                batch_size, r["radio"], r["connections"], r["energy"], r["latency"],
+                100 * r["energy"] / baseline["energy"]))
+    finally:
+        shutil.rmtree(base)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+"""
+Benchmark of the CoAP transport against HTTP (host side, CPython).
+
+Runs the mock ubirch backend (mock_backend.py) and the CoAP gateway, then sends the
+requests of a testkit cycle through the CoAP transport and, for comparison, as plain HTTP/1.0
+requests as written by urequests. Reports bytes and round trips per request and the estimated
+latency on a link with the given round trip time. HTTPS additionally needs a TCP handshake
+(1 RTT) and a TLS handshake (2 RTT, --tls-handshake-bytes) for every request.
+
+Before the benchmark two properties of the client are checked which the host does not show by itself:
+the options are encoded in order with the unstable sort of MicroPython (a port of mp_quicksort,
+CPython's sort is stable), so multi-segment paths like "data/json" stay in order, and stray datagrams
+from the server do not extend the response timeout.
+
+usage: python3 tools/bench_coap.py [-n 20] [--rtt 1.5] [--tls-handshake-bytes 4500]
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+import uuid as std_uuid
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src", "lib"))
+
+import coap
+import urequests
+from coap_gateway import get_upstream, start_gateway
+from mock_backend import MockBackend
+from ubirch.ubirch_api import CoAPTransport, HTTPTransport, SERVICE_NIOMON, SERVICE_DATA, SERVICE_BOOTSTRAP, \
+    SERVICE_IDENTITY, COAP_PATHS, COAP_OPTION_CREDENTIAL, COAP_OPTION_HARDWARE_ID
+
+HTTP_ROUND_TRIPS = 1 + 2 + 1  # TCP handshake, TLS handshake, request/response
+
+
+UUID = std_uuid.UUID(bytes=bytes(range(16)))
+IMSI = "901288000000001"
+
+
+def make_upp() -> bytes:
+    return b"\x96\x23\xc4\x10" + UUID.bytes + b"\xc4\x40" + bytes(64) + b"\x00\xc4\x20" + os.urandom(32) \
+           + b"\xc4\x40" + os.urandom(64)
+
+
+def make_data_message() -> bytes:
+    data = {"AccX": 0.01, "AccY": -0.02, "AccZ": 1.01, "H": 45.2, "L_blue": 120, "L_red": 98, "P": 101325.0,
+            "T": 21.5, "V": 4.2, "AccPitch": 1.2, "AccRoll": -0.5}
+    return json.dumps({"data": data, "msg_type": 1, "timestamp": int(time.time()), "uuid": str(UUID)},
+                      sort_keys=True, separators=(",", ":")).encode()
+
+
+REQUESTS = [
+    ("UPP", "POST", SERVICE_NIOMON, make_upp),
+    ("data message", "POST", SERVICE_DATA, make_data_message),
+    ("CSR", "POST", SERVICE_IDENTITY, lambda: b"\x30" * 1200),
+    ("bootstrap", "GET", SERVICE_BOOTSTRAP, lambda: None),
+]
+CREDENTIAL = "c2VjcmV0"  # base64 of the mock backend password
+
+
+def http_request(http: HTTPTransport, method: str, service: str, data: bytes) -> (int, int):
+    """Send one HTTP/1.0 request like urequests, return bytes sent and received."""
+    url = http.urls[service]
+    proto, _, host, path = url.split("/", 3)
+    hostname, port = host.split(":")
+    sent = []
+
+    class Sink:
+        def write(self, b):
+            sent.append(bytes(b))
+
+    raw_headers = http._get_raw_headers(UUID) if service != SERVICE_IDENTITY else None
+    headers = {'X-Ubirch-IMSI': IMSI} if service == SERVICE_BOOTSTRAP else {}
+    urequests.write_request(Sink(), method, host, path, headers, data, raw_headers)
+    s = socket.create_connection((hostname, int(port)))
+    for b in sent:
+        s.sendall(b)
+    received = 0
+    while True:
+        chunk = s.recv(4096)
+        if not chunk:
+            break
+        received += len(chunk)
+    s.close()
+    return sum(len(b) for b in sent), received
+
+
+def mp_sorted(iterable, key=None) -> list:
+    """sorted() as in MicroPython: the unstable quicksort of py/objlist.c (mp_quicksort)."""
+    items = list(iterable)
+    key = key or (lambda x: x)
+
+    def quicksort(head: int, tail: int):
+        while head < tail:
+            h, t = head - 1, tail
+            v = key(items[tail])
+            while True:
+                h += 1
+                while h < t and key(items[h]) < v:
+                    h += 1
+                t -= 1
+                while h < t and v < key(items[t]):
+                    t -= 1
+                if h >= t:
+                    break
+                items[h], items[t] = items[t], items[h]
+            items[h], items[tail] = items[tail], items[h]
+            if t - head < tail - h - 1:
+                quicksort(head, t)
+                head = h + 1
+            else:
+                quicksort(h + 1, tail)
+                tail = t
+
+    quicksort(0, len(items) - 1)
+    return items
+
+
+def check_option_order():
+    """Encode the options of every request like coap.Client.request with the sort of MicroPython."""
+    coap.sorted = mp_sorted
+    try:
+        for path in COAP_PATHS.values():
+            options = [(coap.OPTION_URI_PATH, segment.encode()) for segment in path.split("/")]
+            options += [(COAP_OPTION_CREDENTIAL, CREDENTIAL.encode()), (COAP_OPTION_HARDWARE_ID, UUID.bytes),
+                        (coap.OPTION_CONTENT_FORMAT, coap.encode_uint(coap.FORMAT_JSON))]
+            message = coap.encode_message(coap.TYPE_CON, coap.CODE_POST, 1, b"tok", options, b"x")
+            decoded = coap.decode_message(message)[4]
+            segments = [value.decode() for number, value in decoded if number == coap.OPTION_URI_PATH]
+            assert "/".join(segments) == path, "Uri-Path {} encoded as {}".format(path, "/".join(segments))
+    finally:
+        del coap.sorted
+    print("option order with the MicroPython sort: ok")
+
+
+def check_response_deadline(timeout: float = 0.3):
+    """A server answering only with stray datagrams must not keep the request waiting beyond the timeout."""
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(("127.0.0.1", 0))
+    server.settimeout(2)
+    done = threading.Event()
+
+    def spam():
+        _, addr = server.recvfrom(coap.MAX_DATAGRAM_SIZE)
+        while not done.wait(0.01):
+            server.sendto(b"\x00", addr)  # malformed
+            server.sendto(coap.encode_message(coap.TYPE_NON, 69, 4711, b"other"), addr)  # unrelated response
+
+    spammer = threading.Thread(target=spam, daemon=True)
+    spammer.start()
+    client = coap.Client("127.0.0.1", server.getsockname()[1], ack_timeout=timeout, max_retransmit=0)
+    t = time.monotonic()
+    try:
+        client.request(coap.CODE_GET, "bootstrap")
+        raise AssertionError("request without response succeeded")
+    except OSError:
+        pass
+    elapsed = time.monotonic() - t
+    done.set()
+    spammer.join()
+    client.close()
+    server.close()
+    # the timeout is randomized up to ACK_RANDOM_FACTOR
+    assert elapsed < timeout * coap.ACK_RANDOM_FACTOR + 0.2, "stray datagrams extended the timeout to {:.2f} s".format(
+        elapsed)
+    print("response timeout with stray datagrams: ok ({:.2f} s)".format(elapsed))
+
+
+def run(n: int, rtt: float, tls_handshake_bytes: int):
+    check_option_order()
+    check_response_deadline()
+
+    backend = MockBackend(password="secret", strict_chain=False)
+    backend.start()
+    cfg = backend.config()
+    upstream = get_upstream(niomon=cfg['niomon'], data=cfg['data'] + "/json", bootstrap=cfg['bootstrap'],
+                            identity=cfg['identity'], data_msgpack=cfg['data'] + "/msgPack")
+
+    loop = asyncio.new_event_loop()
+    _, gateway = loop.run_until_complete(start_gateway(upstream, "127.0.0.1", 0))
+    port = gateway.transport.get_extra_info("sockname")[1]
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    http = HTTPTransport(cfg, CREDENTIAL)
+    coap_transport = CoAPTransport("coap://127.0.0.1:{}".format(port), CREDENTIAL)
+    client = coap_transport.client
+
+    print("{:13s} {:>9s} {:>9s} {:>9s} {:>7s} {:>11s} {:>13s}".format(
+        "request", "transport", "bytes up", "bytes dn", "RTTs", "local [ms]", "at RTT [s]"))
+    for name, method, service, make_body in REQUESTS:
+        # CoAP
+        latencies = []
+        sent0, recv0, dgrams0 = client.bytes_sent, client.bytes_received, client.datagrams_sent
+        for _ in range(n):
+            t = time.perf_counter()
+            status, _ = coap_transport.request(method, service, make_body(), uuid=UUID,
+                                               imsi=IMSI if service == SERVICE_BOOTSTRAP else None)
+            latencies.append(time.perf_counter() - t)
+            assert 200 <= status < 300, status
+        up, dn = (client.bytes_sent - sent0) / n, (client.bytes_received - recv0) / n
+        rtts = (client.datagrams_sent - dgrams0) / n
+        print("{:13s} {:>9s} {:9.0f} {:9.0f} {:7.1f} {:11.2f} {:13.2f}".format(
+            name, "coap", up, dn, rtts, statistics.mean(latencies) * 1000, rtts * rtt))
+
+        # HTTP(S)
+        latencies, up, dn = [], 0, 0
+        for _ in range(n):
+            t = time.perf_counter()
+            u, d = http_request(http, method, service, make_body())
+            latencies.append(time.perf_counter() - t)
+            up, dn = u, d
+        print("{:13s} {:>9s} {:9.0f} {:9.0f} {:7d} {:11.2f} {:13.2f}".format(
+            "", "https", up + tls_handshake_bytes / 2, dn + tls_handshake_bytes / 2, HTTP_ROUND_TRIPS,
+            statistics.mean(latencies) * 1000, HTTP_ROUND_TRIPS * rtt))
+
+    print("\nCoAP retransmissions: {}, gateway duplicates: {}".format(client.retransmissions, gateway.duplicates))
+    client.close()
+    backend.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=20, help="requests per type")
+    parser.add_argument("--rtt", type=float, default=1.5, help="round trip time of the radio link in seconds")
+    parser.add_argument("--tls-handshake-bytes", type=int, default=4500,
+                        help="bytes of a full TLS handshake including the certificate chain")
+    args = parser.parse_args()
+    run(args.n, args.rtt, args.tls_handshake_bytes)
@@ -0,0 +1,107 @@
+"""
+Comparison of the JSON and msgpack data message formats (host side, CPython).
+
+Encodes typical Pysense and Pytrack data messages in both formats and reports the message
+size, the number of APDUs needed to pass the message to the SIM card for signing, the encoding
+time and the upload time at the given uplink rate. Then sends the messages to the mock ubirch
+backend (mock_backend.py) with API.send_data and API.send_data_msgpack and reports the latency.
+
+usage: python3 tools/bench_data_format.py [-n 50] [--uplink-rate 20000]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import uuid as std_uuid
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src", "lib"))
+
+import ubirch
+from mock_backend import MockBackend, unpack_msgpack
+from serialize import serialize_json, serialize_msgpack
+from ubirch.ubirch_sim import SimProtocol, STK_APP_SIGN_FINAL
+
+MSG_TYPE = 1
+UUID = std_uuid.UUID(int=0x5122 << 112)
+
+# bytes of message per APDU of the SIM sign command, the message is sent hex encoded
+APDU_CHUNK = (SimProtocol.MAX_AT_LENGTH - len(STK_APP_SIGN_FINAL[:-2].format(0, 0))) // 2
+
+
+def pysense_data() -> dict:
+    return {"AccX": random.gauss(0, 0.01), "AccY": random.gauss(0, 0.01), "AccZ": random.gauss(1, 0.01),
+            "AccRoll": random.gauss(0, 1), "AccPitch": random.gauss(0, 1), "V": random.uniform(4.0, 4.2),
+            "L_blue": random.randint(0, 500), "L_red": random.randint(0, 500), "T": random.uniform(15, 25),
+            "P": random.gauss(101325, 50), "H": random.uniform(30, 60)}
+
+
+def pytrack_data() -> dict:
+    return {"AccX": random.gauss(0, 0.01), "AccY": random.gauss(0, 0.01), "AccZ": random.gauss(1, 0.01),
+            "AccRoll": random.gauss(0, 1), "AccPitch": random.gauss(0, 1), "V": random.uniform(4.0, 4.2),
+            "GPS_long": random.uniform(13.3, 13.5), "GPS_lat": random.uniform(52.4, 52.6)}
+
+
+def pack_data_json(data: dict) -> bytes:
+    """Same message as helpers.pack_data_json (the helpers module needs the pycom firmware)."""
+    return serialize_json({'uuid': str(UUID), 'msg_type': MSG_TYPE, 'timestamp': int(time.time()), 'data': data})
+
+
+def pack_data_msgpack(data: dict) -> bytes:
+    """Same message as helpers.pack_data_msgpack."""
+    return serialize_msgpack({'uuid': UUID.bytes, 'msg_type': MSG_TYPE, 'timestamp': int(time.time()),
+                              'data': data})
+
+
+def encode_time(function, data: dict, n: int) -> float:
+    t = time.perf_counter()
+    for _ in range(n):
+        function(data)
+    return (time.perf_counter() - t) / n
+
+
+def send_latency(send, n: int, make_message) -> (float, list):
+    latencies, statuses = [], set()
+    for _ in range(n):
+        message = make_message()
+        t = time.perf_counter()
+        status, _ = send(UUID, message)
+        latencies.append(time.perf_counter() - t)
+        statuses.add(status)
+    return statistics.median(latencies), sorted(statuses)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=50, help="messages per format")
+    parser.add_argument("--uplink-rate", type=float, default=20000, help="uplink rate in bit/s")
+    args = parser.parse_args()
+
+    print("{:8s} {:8s} {:>7s} {:>6s} {:>12s} {:>12s}".format(
+        "board", "format", "bytes", "APDUs", "encode [us]", "upload [ms]"))
+    for board, make_data in (("pysense", pysense_data), ("pytrack", pytrack_data)):
+        data = make_data()
+        for name, pack in (("json", pack_data_json), ("msgpack", pack_data_msgpack)):
+            message = pack(data)
+            print("{:8s} {:8s} {:7d} {:6d} {:12.1f} {:12.1f}".format(
+                board, name, len(message), -(-len(message) // APDU_CHUNK), encode_time(pack, data, 1000) * 1e6,
+                len(message) * 8 / args.uplink_rate * 1000))
+
+        # the msgpack message carries the same data
+        decoded, _ = unpack_msgpack(pack_data_msgpack(data))
+        assert decoded['uuid'] == UUID.bytes and set(decoded['data']) == set(data)
+
+    backend = MockBackend(password="secret")
+    backend.start()
+    api = ubirch.API(backend.config())
+    print("\n{:8s} {:>13s}  {}".format("format", "latency [ms]", "status codes"))
+    for name, send, pack in (("json", api.send_data, pack_data_json),
+                             ("msgpack", api.send_data_msgpack, pack_data_msgpack)):
+        latency, statuses = send_latency(send, args.n, lambda: pack(pysense_data()))
+        print("{:8s} {:13.2f}  {}".format(name, latency * 1000, statuses))
+    backend.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""
+Single register reads vs. burst reads into preallocated buffers of the pyboard sensor drivers (host side, CPython).
+
+The register reads of LIS2HH12.acceleration, LTR329ALS01.light and MPL3115A2.pressure/temperature are
+mirrored here in their former form (one readfrom_mem per register, new bytes per read) and in the burst
+form of the drivers (readfrom_mem_into a preallocated buffer with register address auto increment,
+decoded with one unpack_from). They run against an I2C stand-in, which serves random register contents
+and accounts the bus time of each transaction at the given clock (start, address and register bytes,
+repeated start, data bytes, 9 clocks per byte) and the buffers allocated for the read data.
+Both forms are checked to decode the same values.
+
+usage: python3 tools/bench_i2c_burst.py [-n 20000] [--clock 100000]
+"""
+import argparse
+import os
+import struct
+import time
+
+ACC_I2CADDR = 30
+ACC_X_L_REG = 0x28
+ALS_I2CADDR = 0x29
+ALS_DATA_CH1_LOW = 0x88
+MPL3115_I2CADDR = 0x60
+MPL3115_PRESSURE_DATA_MSB = 0x01
+MPL3115_TEMP_DATA_MSB = 0x04
+
+ACC_MULT = 8000 / (1000 * 65536)
+
+
+class I2CStandIn:
+    """
+    Register map of the sensors with auto increment, counting transactions and bus clocks.
+    """
+
+    def __init__(self):
+        self.registers = {addr: bytearray(256) for addr in (ACC_I2CADDR, ALS_I2CADDR, MPL3115_I2CADDR)}
+        self.transactions = 0
+        self.clocks = 0
+        self.buffers = 0  # number of buffers allocated for read data
+
+    def randomize(self):
+        for registers in self.registers.values():
+            registers[:] = os.urandom(256)
+
+    def _account(self, nbytes: int):
+        # start, address (write), register, repeated start, address (read), data, stop
+        self.transactions += 1
+        self.clocks += 9 * (3 + nbytes) + 2
+
+    def readfrom_mem(self, addr: int, memaddr: int, nbytes: int) -> bytes:
+        self._account(nbytes)
+        self.buffers += 1
+        return bytes(self.registers[addr][memaddr:memaddr + nbytes])
+
+    def readfrom_mem_into(self, addr: int, memaddr: int, buf):
+        self._account(len(buf))
+        buf[:] = self.registers[addr][memaddr:memaddr + len(buf)]
+
+
+class SingleReads:
+    """The former register reads of the drivers."""
+
+    def __init__(self, i2c: I2CStandIn):
+        self.i2c = i2c
+
+    def acceleration(self):
+        x = struct.unpack('<h', self.i2c.readfrom_mem(ACC_I2CADDR, ACC_X_L_REG, 2))
+        y = struct.unpack('<h', self.i2c.readfrom_mem(ACC_I2CADDR, ACC_X_L_REG + 2, 2))
+        z = struct.unpack('<h', self.i2c.readfrom_mem(ACC_I2CADDR, ACC_X_L_REG + 4, 2))
+        return x[0] * ACC_MULT, y[0] * ACC_MULT, z[0] * ACC_MULT
+
+    def light(self):
+        ch1low = self.i2c.readfrom_mem(ALS_I2CADDR, ALS_DATA_CH1_LOW, 1)
+        ch1high = self.i2c.readfrom_mem(ALS_I2CADDR, ALS_DATA_CH1_LOW + 1, 1)
+        data1 = int(((ch1high[0] & 0xFF) << 8) + (ch1low[0] & 0xFF))
+        ch0low = self.i2c.readfrom_mem(ALS_I2CADDR, ALS_DATA_CH1_LOW + 2, 1)
+        ch0high = self.i2c.readfrom_mem(ALS_I2CADDR, ALS_DATA_CH1_LOW + 3, 1)
+        data0 = int(((ch0high[0] & 0xFF) << 8) + (ch0low[0] & 0xFF))
+        return data0, data1
+
+    def pressure(self):
+        msb = self.i2c.readfrom_mem(MPL3115_I2CADDR, MPL3115_PRESSURE_DATA_MSB, 1)
+        csb = self.i2c.readfrom_mem(MPL3115_I2CADDR, MPL3115_PRESSURE_DATA_MSB + 1, 1)
+        lsb = self.i2c.readfrom_mem(MPL3115_I2CADDR, MPL3115_PRESSURE_DATA_MSB + 2, 1)
+        return float((msb[0] << 10) + (csb[0] << 2) + ((lsb[0] >> 6) & 0x03) + ((lsb[0] >> 4) & 0x03) / 4.0)
+
+    def temperature(self):
+        msb = self.i2c.readfrom_mem(MPL3115_I2CADDR, MPL3115_TEMP_DATA_MSB, 1)
+        lsb = self.i2c.readfrom_mem(MPL3115_I2CADDR, MPL3115_TEMP_DATA_MSB + 1, 1)
+        temp_int = msb[0] - 256 if msb[0] > 127 else msb[0]
+        return float(temp_int + lsb[0] / 256.0)
+
+
+class BurstReads:
+    """The burst reads of the drivers."""
+
+    def __init__(self, i2c: I2CStandIn):
+        self.i2c = i2c
+        self._acc_buf = bytearray(6)
+        self._light_buf = bytearray(4)
+        self._pressure_buf = bytearray(3)
+        self._temp_buf = bytearray(2)
+
+    def acceleration(self):
+        self.i2c.readfrom_mem_into(ACC_I2CADDR, ACC_X_L_REG, self._acc_buf)
+        x, y, z = struct.unpack_from('<hhh', self._acc_buf)
+        return x * ACC_MULT, y * ACC_MULT, z * ACC_MULT
+
+    def light(self):
+        self.i2c.readfrom_mem_into(ALS_I2CADDR, ALS_DATA_CH1_LOW, self._light_buf)
+        data1, data0 = struct.unpack_from('<HH', self._light_buf)
+        return data0, data1
+
+    def pressure(self):
+        self.i2c.readfrom_mem_into(MPL3115_I2CADDR, MPL3115_PRESSURE_DATA_MSB, self._pressure_buf)
+        msb, csb, lsb = self._pressure_buf
+        return float((msb << 10) + (csb << 2) + ((lsb >> 6) & 0x03) + ((lsb >> 4) & 0x03) / 4.0)
+
+    def temperature(self):
+        self.i2c.readfrom_mem_into(MPL3115_I2CADDR, MPL3115_TEMP_DATA_MSB, self._temp_buf)
+        temp_int = self._temp_buf[0] - 256 if self._temp_buf[0] > 127 else self._temp_buf[0]
+        return float(temp_int + self._temp_buf[1] / 256.0)
+
+
+READINGS = ("acceleration", "light", "pressure", "temperature")
+
+
+def check(n: int = 1000):
+    i2c = I2CStandIn()
+    single, burst = SingleReads(i2c), BurstReads(i2c)
+    for _ in range(n):
+        i2c.randomize()
+        for reading in READINGS:
+            assert getattr(single, reading)() == getattr(burst, reading)(), reading
+
+
+def measure(cls, reading: str, n: int, clock: int) -> dict:
+    i2c = I2CStandIn()
+    i2c.randomize()
+    driver = cls(i2c)
+    function = getattr(driver, reading)
+
+    t = time.perf_counter()
+    for _ in range(n):
+        function()
+    cpu = (time.perf_counter() - t) / n
+
+    return {
+        "transactions": i2c.transactions / n,
+        "bus": i2c.clocks / n / clock,
+        "cpu": cpu,
+        "buffers": i2c.buffers / n
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=20000, help="number of readings per sensor")
+    parser.add_argument("--clock", type=int, default=100000, help="I2C clock in Hz")
+    args = parser.parse_args()
+
+    check()
+    print("single and burst reads decode the same values\n")
+    print("{:13s} {:7s} {:>13s} {:>10s} {:>10s} {:>12s}".format(
+        "reading", "reads", "transactions", "bus [ms]", "cpu [us]", "new buffers"))
+    totals = {}
+    for reading in READINGS:
+        for name, cls in (("single", SingleReads), ("burst", BurstReads)):
+            r = measure(cls, reading, args.n, args.clock)
+            totals.setdefault(name, [0, 0.0])
+            totals[name][0] += r["transactions"]
+            totals[name][1] += r["bus"]
+            print("{:13s} {:7s} {:13.0f} {:10.2f} {:10.2f} {:12.0f}".format(
+                reading, name, r["transactions"], r["bus"] * 1000, r["cpu"] * 1e6, r["buffers"]))
+    print("")
+    for name, (transactions, bus) in totals.items():
+        print("{:7s} total: {:3.0f} transactions, {:.2f} ms bus time per measurement".format(
+            name, transactions, bus * 1000))
+
+
+if __name__ == '__main__':
+    main()
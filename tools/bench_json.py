@@ -0,0 +1,115 @@
+"""
+Benchmark of the JSON serialization of data messages (host side, CPython).
+
+Compares serialize.serialize_json with the previous string concatenating implementation
+for messages of increasing size, checks that both produce byte-identical output for the
+data types supported before and that the output is valid JSON.
+
+CPython resizes a string in place for `str +=` when possible, so the host timing hides most
+of the cost of the previous implementation. On MicroPython every concatenation allocates a
+new string and copies the old one, the bytes allocated this way are reported as "concat [kB]"
+(quadratic in the message size, the new implementation appends to one bytearray). This is the gain
+of the new implementation. The encoded map keys are cached, so messages with up to 128 keys are
+serialized as fast as before, larger messages are slower because every string is checked for
+characters to escape (the previous implementation did not escape).
+
+usage: python3 tools/bench_json.py [--sizes 10,100,1000,5000] [-n 20]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src", "lib"))
+
+from serialize import serialize_json
+
+
+def serialize_json_legacy(msg: dict) -> bytes:
+    """The previous implementation of helpers.serialize_json."""
+    serialized = "{"
+    for key in sorted(msg):
+        serialized += "\"{}\":".format(key)
+        value = msg[key]
+        value_type = type(value)
+        if value_type is str:
+            serialized += "\"{:s}\"".format(value)
+        elif value_type is int:
+            serialized += "{:d}".format(value)
+        elif isinstance(value, float):
+            serialized += "\"{:.2f}\"".format(value)
+        elif value_type is dict:
+            serialized += serialize_json_legacy(value).decode()
+        elif value is None:
+            serialized += "null"
+        else:
+            raise Exception("unsupported data type {} for serialization in json message".format(value_type))
+        serialized += ","
+    serialized = serialized.rstrip(",") + "}"
+    return serialized.encode()
+
+
+def concat_bytes(msg: dict) -> int:
+    """Estimate the number of bytes the previous implementation allocates for concatenated strings."""
+    total = 0
+    length = 1
+    for key in sorted(msg):
+        value = msg[key]
+        if type(value) is dict:
+            total += concat_bytes(value)
+        length += len("\"{}\":".format(key))
+        total += length
+        length += len(serialize_json_legacy({key: value})) - len("\"{}\":".format(key)) - 2
+        total += length
+        length += 1  # ","
+        total += length
+    return total
+
+
+def make_message(size: int) -> dict:
+    """A data message with `size` sensor values, partly in nested maps."""
+    data = {}
+    for i in range(size):
+        value = random.choice([random.uniform(-1000, 1000), random.randint(-10 ** 6, 10 ** 6), "v{}".format(i), None])
+        if i % 10 == 9:
+            data["group{:05d}".format(i)] = {"x": value, "n": i}
+        else:
+            data["sensor{:05d}".format(i)] = value
+    return {"uuid": "5122a5c8-0000-4000-8000-000000000001", "msg_type": 1, "timestamp": int(time.time()),
+            "data": data}
+
+
+def measure(function, msg: dict, n: int) -> float:
+    t = time.perf_counter()
+    for _ in range(n):
+        function(msg)
+    return (time.perf_counter() - t) / n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,100,1000,5000", help="comma separated numbers of values")
+    parser.add_argument("-n", type=int, default=20, help="repetitions per size")
+    args = parser.parse_args()
+
+    print("{:>7s} {:>9s} {:>13s} {:>12s} {:>12s} {:>8s}".format(
+        "values", "bytes", "concat [kB]", "legacy [ms]", "new [ms]", "speedup"))
+    for size in [int(s) for s in args.sizes.split(",")]:
+        msg = make_message(size)
+        encoded = serialize_json(msg)
+        assert encoded == serialize_json_legacy(msg), "output differs from the previous implementation"
+        json.loads(encoded)
+        legacy, new = measure(serialize_json_legacy, msg, args.n), measure(serialize_json, msg, args.n)
+        print("{:7d} {:9d} {:13.0f} {:12.3f} {:12.3f} {:7.1f}x".format(
+            size, len(encoded), concat_bytes(msg) / 1000, legacy * 1000, new * 1000, legacy / new))
+
+    # types not supported by the previous implementation
+    msg = {"b": [True, False, None], "l": [1, 2.5, "x", {"z": 1, "a": (2,)}], "s": "quote\" \\ \n"}
+    assert json.loads(serialize_json(msg)) == json.loads(json.dumps(msg, sort_keys=True).replace("2.5", "\"2.50\""))
+    print("\nlists, tuples, bools and escaped strings: {}".format(serialize_json(msg).decode()))
+
+
+if __name__ == '__main__':
+    main()
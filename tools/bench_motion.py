@@ -0,0 +1,101 @@
+"""
+Accuracy and cost of the accelerometer FIFO statistics vs. a single sample (host side, CPython).
+
+Simulates the LIS2HH12 output (4g full scale, 16 bit) of a tilted device with sensor noise and an
+optional vibration, fills a FIFO window with it and compares the roll/pitch error of a single sample
+with that of the FIFO mean (motion.MotionStatistics). Also reports the vibration energy with and
+without vibration, the I2C bus time of both reads at the given clock and the CPU time of the statistics.
+
+usage: python3 tools/bench_motion.py [--trials 2000] [--noise 0.01] [--vibration 0.2] [--odr 50]
+"""
+import argparse
+import math
+import os
+import random
+import struct
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src", "lib"))
+
+from motion import MotionStatistics
+
+SCALE = 8000 / (1000 * 65536)  # 4g full scale
+FIFO_SIZE = 32
+
+
+def roll(x, y, z):
+    return math.degrees(math.atan2(-x, z))
+
+
+def pitch(x, y, z):
+    return math.degrees(-math.atan2(y, math.sqrt(x * x + z * z)))
+
+
+def samples(n: int, roll_deg: float, pitch_deg: float, noise: float, vibration: float, odr: int) -> bytes:
+    """n raw samples of a device at the given orientation with white noise and a 12 Hz vibration along Z."""
+    r, p = math.radians(roll_deg), math.radians(pitch_deg)
+    # gravity vector for which roll() and pitch() give the orientation
+    gy = -math.sin(p)
+    gx = -math.cos(p) * math.sin(r)
+    gz = math.cos(p) * math.cos(r)
+    phase = random.uniform(0, 2 * math.pi)
+    buf = bytearray()
+    for i in range(n):
+        v = vibration * math.sin(phase + 2 * math.pi * 12 * i / odr)
+        values = (gx + random.gauss(0, noise), gy + random.gauss(0, noise), gz + v + random.gauss(0, noise))
+        buf += struct.pack('<hhh', *(max(-32768, min(32767, round(a / SCALE))) for a in values))
+    return bytes(buf)
+
+
+def bus_time(nbytes: int, clock: int) -> float:
+    return (9 * (3 + nbytes) + 2) / clock
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trials", type=int, default=2000, help="number of simulated measurements")
+    parser.add_argument("--noise", type=float, default=0.01, help="sensor noise (standard deviation) in g")
+    parser.add_argument("--vibration", type=float, default=0.2, help="vibration amplitude in g")
+    parser.add_argument("--odr", type=int, default=50, help="output data rate in Hz")
+    parser.add_argument("--clock", type=int, default=100000, help="I2C clock in Hz")
+    args = parser.parse_args()
+
+    for vibration in (0.0, args.vibration):
+        errors = {"single": [], "fifo": []}
+        energies = []
+        cpu = 0.0
+        for _ in range(args.trials):
+            r, p = random.uniform(-60, 60), random.uniform(-60, 60)
+            buf = samples(FIFO_SIZE, r, p, args.noise, vibration, args.odr)
+
+            x, y, z = (a * SCALE for a in struct.unpack_from('<hhh', buf, 6 * (FIFO_SIZE - 1)))
+            errors["single"].append(max(abs(roll(x, y, z) - r), abs(pitch(x, y, z) - p)))
+
+            t = time.perf_counter()
+            statistics = MotionStatistics(SCALE)
+            statistics.add_samples(buf, FIFO_SIZE)
+            result = statistics.result()
+            cpu += time.perf_counter() - t
+            x, y, z = result["mean"]
+            errors["fifo"].append(max(abs(roll(x, y, z) - r), abs(pitch(x, y, z) - p)))
+            energies.append(result["energy"])
+
+        print("vibration {:.2f} g, noise {:.3f} g, {} samples at {} Hz ({:.2f} s window)".format(
+            vibration, args.noise, FIFO_SIZE, args.odr, FIFO_SIZE / args.odr))
+        for name, values in errors.items():
+            values.sort()
+            print("  {:6s} roll/pitch error: mean {:6.2f} deg, 95% {:6.2f} deg".format(
+                name, sum(values) / len(values), values[int(0.95 * len(values))]))
+        print("  vibration energy: {:.5f} g² (expected {:.5f} g²)".format(
+            sum(energies) / len(energies), 3 * args.noise ** 2 + vibration ** 2 / 2))
+        print("  statistics: {:.1f} us per window (CPython)\n".format(cpu / args.trials * 1e6))
+
+    single = bus_time(6, args.clock)
+    fifo = bus_time(1, args.clock) + bus_time(6 * FIFO_SIZE, args.clock)
+    print("I2C bus time at {} kHz: single sample {:.2f} ms, FIFO status and burst read {:.2f} ms".format(
+        args.clock // 1000, single * 1000, fifo * 1000))
+
+
+if __name__ == '__main__':
+    main()
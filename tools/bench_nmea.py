@@ -0,0 +1,133 @@
+"""
+Cost and robustness of the incremental NMEA parser vs. the previous GLL search (host side, CPython).
+
+Generates the 1 Hz output of an L76 (RMC, GGA, GSA, GLL per second) with optional corrupted sentences,
+splits it into I2C reads of the given size padded with newlines like the L76 does, and feeds the reads to
+  - legacy: the previous L76GNSS.coordinates algorithm (growing bytes buffer, search for GNGLL/GPGLL,
+            no checksum validation)
+  - parser: nmea.NMEAParser with a preallocated read buffer
+Reports the CPU time per read, the allocated memory and how many corrupted positions were accepted.
+
+usage: python3 tools/bench_nmea.py [--seconds 600] [--corrupt 0.05] [--read-size 64]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src", "lib"))
+
+from nmea import NMEAParser
+
+
+def checksum(data: str) -> str:
+    c = 0
+    for s in data:
+        c ^= ord(s)
+    return '{:02X}'.format(c)
+
+
+def sentence(data: str, corrupt: bool) -> bytes:
+    s = '${}*{}\r\n'.format(data, checksum(data))
+    if corrupt:
+        i = random.randrange(7, len(s) - 5)
+        s = s[:i] + random.choice('0123456789') + s[i + 1:]
+    return s.encode()
+
+
+def nmea_second(t: int, lat: float, lon: float, corrupt: float) -> list:
+    hh, mm, ss = (t // 3600) % 24, (t // 60) % 60, t % 60
+    utc = '{:02d}{:02d}{:02d}.000'.format(hh, mm, ss)
+    la = '{:02d}{:07.4f}'.format(int(lat), (lat % 1) * 60)
+    lo = '{:03d}{:07.4f}'.format(int(lon), (lon % 1) * 60)
+    return [sentence(s, random.random() < corrupt) for s in (
+        'GNRMC,{},A,{},N,{},E,0.12,0.00,191026,,,A'.format(utc, la, lo),
+        'GNGGA,{},{},N,{},E,1,08,1.02,35.2,M,47.9,M,,'.format(utc, la, lo),
+        'GNGSA,A,3,05,07,13,15,20,24,28,30,,,,,1.80,1.02,1.48',
+        'GNGLL,{},N,{},E,{},A,A'.format(la, lo, utc),
+    )]
+
+
+def reads(stream: bytes, size: int) -> list:
+    """Split the output into I2C reads, the L76 pads each second with newlines when it has no data."""
+    chunks = []
+    for i in range(0, len(stream), size):
+        chunk = stream[i:i + size]
+        chunks.append(chunk + b'\n' * (size - len(chunk)))
+    return chunks
+
+
+def legacy(chunks: list, lat: float, lon: float) -> tuple:
+    positions, wrong = 0, 0
+    nmea = b''
+    for chunk in chunks:
+        nmea += chunk.lstrip(b'\n\n').rstrip(b'\n\n')
+        idx = nmea.find(b'GNGLL')
+        if idx >= 0:
+            gll = nmea[idx:]
+            end = gll.find(b'\r\n')
+            if end >= 0:
+                try:
+                    s = gll[:end].decode('ascii').split(',')
+                    la = (float(s[1]) // 100) + ((float(s[1]) % 100) / 60)
+                    lo = (float(s[3]) // 100) + ((float(s[3]) % 100) / 60)
+                    positions += 1
+                    wrong += abs(la - lat) > 1e-4 or abs(lo - lon) > 1e-4
+                except Exception:
+                    pass
+                nmea = nmea[(idx + end):]
+        elif len(nmea) > 410:
+            nmea = nmea[-5:]
+    return positions, wrong
+
+
+def parser(chunks: list, size: int, lat: float, lon: float) -> tuple:
+    positions, wrong = 0, 0
+    nmea = NMEAParser()
+    buf = bytearray(size)
+    updates = 0
+    for chunk in chunks:
+        buf[:] = chunk  # stands in for I2C.readfrom_into
+        nmea.feed(buf)
+        if nmea.position_updates != updates:
+            updates = nmea.position_updates
+            if nmea.position_valid:
+                positions += 1
+                wrong += abs(nmea.latitude - lat) > 1e-4 or abs(nmea.longitude - lon) > 1e-4
+    return positions, wrong
+
+
+def main():
+    parser_ = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser_.add_argument("--seconds", type=int, default=600, help="seconds of receiver output")
+    parser_.add_argument("--corrupt", type=float, default=0.05, help="fraction of corrupted sentences")
+    parser_.add_argument("--read-size", type=int, default=64, help="bytes per I2C read")
+    args = parser_.parse_args()
+
+    lat, lon = 52.52, 13.40
+    stream = b''
+    for t in range(args.seconds):
+        stream += b''.join(nmea_second(43200 + t, lat, lon, args.corrupt))
+        stream += b'\n' * args.read_size  # idle until the next second
+    chunks = reads(stream, args.read_size)
+
+    print("{} s of NMEA output, {} bytes in {} reads of {} bytes, {:.0%} corrupted sentences".format(
+        args.seconds, len(stream), len(chunks), args.read_size, args.corrupt))
+    print("(CPU time is CPython's, on MicroPython the legacy algorithm also ran gc.collect() after every read)")
+    runs = (("legacy", lambda: legacy(chunks, lat, lon)), ("parser", lambda: parser(chunks, args.read_size, lat, lon)))
+    for name, run in runs:
+        t = time.perf_counter()
+        run()
+        cpu = time.perf_counter() - t
+        tracemalloc.start()
+        positions, wrong = run()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print("  {}: {:5.1f} us per read, peak memory {:5d} bytes, {} positions (GLL{}), {} wrong".format(
+            name, cpu / len(chunks) * 1e6, peak, positions, "" if name == "legacy" else " and RMC", wrong))
+
+
+if __name__ == '__main__':
+    main()
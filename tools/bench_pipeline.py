@@ -0,0 +1,103 @@
+"""
+Throughput benchmark of the pipelined multi-UPP upload (host side, CPython).
+
+Runs a local keep-alive stand-in of the ubirch authentication service (niomon) and sends
+a backlog of UPPs once with one API.send_upp call per UPP and once with API.send_upps,
+which pipelines the requests over one connection. Reports UPPs/second, connections and
+the estimated time on a link with the given round trip time. With --drop-after the
+stand-in closes the connection after that many requests to show the per-UPP retry.
+
+usage: python3 tools/bench_pipeline.py [-n 100] [--rtt 1.5] [--drop-after 0]
+"""
+import argparse
+import math
+import os
+import sys
+import threading
+import time
+import uuid as std_uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src", "lib"))
+
+import urequests
+import ubirch
+
+HTTPS_HANDSHAKE_RTTS = 1 + 2  # TCP handshake, TLS handshake
+
+
+class NiomonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    connections = 0
+    requests = 0
+    drop_after = 0
+
+    def setup(self):
+        super().setup()
+        NiomonHandler.connections += 1
+        self.handled = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        NiomonHandler.requests += 1
+        self.handled += 1
+        body = b"\x95\x22" + b"\x00" * 100  # response UPP
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        if self.drop_after and self.handled >= self.drop_after:
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def run(n: int, rtt: float, drop_after: int):
+    NiomonHandler.drop_after = drop_after
+    server = ThreadingHTTPServer(("127.0.0.1", 0), NiomonHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = "http://127.0.0.1:{}".format(server.server_port)
+    api = ubirch.API({
+        'debug': False, 'env': "dev", 'password': "secret", 'transport': "http",
+        'niomon': base + "/", 'data': base + "/v1", 'bootstrap': base + "/bootstrap", 'identity': base + "/csr"
+    })
+    uuid = std_uuid.UUID(bytes=bytes(range(16)))
+    upps = [b"\x96\x23" + os.urandom(185) for _ in range(n)]
+
+    # one request cycle per UPP
+    NiomonHandler.connections = 0
+    t = time.perf_counter()
+    for upp in upps:
+        status, _ = api.send_upp(uuid, upp)
+        assert status == 200
+    t_single = time.perf_counter() - t
+    print("send_upp:  {:8.1f} UPPs/s, {:4d} connections, estimated {:8.1f} s at RTT {} s".format(
+        n / t_single, NiomonHandler.connections, n * (HTTPS_HANDSHAKE_RTTS + 1) * rtt, rtt))
+
+    # pipelined, retrying unanswered UPPs
+    NiomonHandler.connections = 0
+    pending = upps
+    rounds = 0
+    t = time.perf_counter()
+    while pending:
+        results = api.send_upps(uuid, pending)
+        pending = [upp for upp, r in zip(pending, results) if r is None or not 200 <= r[0] < 300]
+        rounds += 1
+    t_pipelined = time.perf_counter() - t
+    depth = urequests.PIPELINE_DEPTH
+    estimate = NiomonHandler.connections * HTTPS_HANDSHAKE_RTTS * rtt + math.ceil(n / depth) * rtt
+    print("send_upps: {:8.1f} UPPs/s, {:4d} connections, estimated {:8.1f} s at RTT {} s ({} rounds)".format(
+        n / t_pipelined, NiomonHandler.connections, estimate, rtt, rounds))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=100, help="number of UPPs")
+    parser.add_argument("--rtt", type=float, default=1.5, help="round trip time of the radio link in seconds")
+    parser.add_argument("--drop-after", type=int, default=0, help="close connections after this many requests")
+    args = parser.parse_args()
+    run(args.n, args.rtt, args.drop_after)
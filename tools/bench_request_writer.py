@@ -0,0 +1,97 @@
+"""
+Benchmark for the request serialization in urequests (host side, CPython).
+
+Counts the socket writes, the bytes of the HTTP request and the resulting bytes on the
+wire (including the TLS record overhead) for the requests the testkit sends every cycle,
+comparing the single-buffer request writer with the former write-per-line serialization.
+
+usage: python3 tools/bench_request_writer.py
+"""
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src", "lib"))
+
+import urequests
+from ubirch.ubirch_api import _encode_headers
+
+# TLS 1.2 AES-GCM: 5 bytes record header + 8 bytes explicit nonce + 16 bytes auth tag
+TLS_RECORD_OVERHEAD = 29
+
+
+class CountingSocket:
+    """Socket stand-in that counts writes and bytes like a TLS socket would send them."""
+
+    def __init__(self):
+        self.writes = 0
+        self.bytes = 0
+
+    def write(self, data):
+        self.writes += 1
+        self.bytes += len(data)
+        return len(data)
+
+    @property
+    def wire_bytes(self):
+        return self.bytes + self.writes * TLS_RECORD_OVERHEAD
+
+
+def legacy_write_request(s, method, host, path, headers, data):
+    """The former serialization: one write per request line, header key, separator and value."""
+    s.write("{} /{} HTTP/1.0\r\n".format(method, path).encode())
+    if not "Host" in headers:
+        s.write("Host: {}\r\n".format(host).encode())
+    for k in headers:
+        s.write(k.encode())
+        s.write(b": ")
+        s.write(headers[k].encode())
+        s.write(b"\r\n")
+    if data:
+        s.write("Content-Length: {}\r\n".format(len(data)).encode())
+    s.write(b"\r\n")
+    if data:
+        s.write(data)
+
+
+HEADERS = {
+    'X-Ubirch-Credential': 'NzI1YzU0ZTgtZDQ2Ny00OGQ2LWI1ZTgtOTRlNTAzNmRmOGJi',
+    'X-Ubirch-Auth-Type': 'ubirch',
+    'X-Ubirch-Hardware-Id': '05122551-2131-4020-9225-000013adf293',
+}
+
+REQUESTS = [
+    ("data message", "data.prod.ubirch.com", "v1/json", b"x" * 270),
+    ("UPP", "niomon.prod.ubirch.com", "", b"\x96" * 187),
+    ("large body", "data.prod.ubirch.com", "v1/json", b"x" * 4000),
+]
+
+
+def run(iterations: int = 10000):
+    raw_headers = _encode_headers(HEADERS)
+    print("{:14s} {:>8s} {:>8s} {:>8s} {:>10s}".format("request", "method", "writes", "bytes", "wire bytes"))
+    for name, host, path, body in REQUESTS:
+        legacy = CountingSocket()
+        legacy_write_request(legacy, "POST", host, path, HEADERS, body)
+        buffered = CountingSocket()
+        urequests.write_request(buffered, "POST", host, path, {}, body, raw_headers)
+        for label, s in (("legacy", legacy), ("buffered", buffered)):
+            print("{:14s} {:>8s} {:8d} {:8d} {:10d}".format(name, label, s.writes, s.bytes, s.wire_bytes))
+
+    # serialization time per request (CPU side)
+    _, host, path, body = REQUESTS[1]
+    s = CountingSocket()
+    t = time.perf_counter()
+    for _ in range(iterations):
+        legacy_write_request(s, "POST", host, path, HEADERS, body)
+    t_legacy = time.perf_counter() - t
+    t = time.perf_counter()
+    for _ in range(iterations):
+        urequests.write_request(s, "POST", host, path, {}, body, raw_headers)
+    t_buffered = time.perf_counter() - t
+    print("\nserialization time per UPP request: legacy {:.2f} us, buffered {:.2f} us".format(
+        t_legacy / iterations * 1e6, t_buffered / iterations * 1e6))
+
+
+if __name__ == '__main__':
+    run()
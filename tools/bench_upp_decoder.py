@@ -0,0 +1,110 @@
+"""
+Benchmark of the UPP decoder (host side, CPython).
+
+Decodes a large batch of UPPs with ubirch.decode_upp and with the previous fixed offset
+implementation of helpers.get_upp_payload, checks the decoded fields against the UPP parser
+of the mock backend and reports the decoding rate. The UPPs are either read from a file with
+one hex encoded UPP per line (e.g. recorded from the "UPP: ..." console output of the testkit)
+or generated: signed and chained UPPs with hash payloads and with larger payloads, which need
+the 16 and 32 bit bin length formats.
+
+usage: python3 tools/bench_upp_decoder.py [-n 100000] [--file upps.txt]
+"""
+import argparse
+import binascii
+import os
+import random
+import sys
+import time
+import uuid as std_uuid
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src", "lib"))
+
+from mock_backend import parse_upp
+from ubirch import decode_upp
+
+
+def get_upp_payload_legacy(upp: bytes) -> bytes:
+    """The previous implementation of helpers.get_upp_payload."""
+    if upp[0] == 0x95 and upp[1] == 0x22:  # signed UPP
+        payload_start_idx = 23
+    elif upp[0] == 0x96 and upp[1] == 0x23:  # chained UPP
+        payload_start_idx = 89
+    else:
+        raise Exception("not a UPP")
+    if upp[payload_start_idx - 2] != 0xC4:
+        raise Exception("unexpected payload type: {:X}".format(upp[payload_start_idx - 2]))
+    payload_len = upp[payload_start_idx - 1]
+    return upp[payload_start_idx:payload_start_idx + payload_len]
+
+
+def encode_bin(data: bytes) -> bytes:
+    if len(data) <= 0xFF:
+        return bytes([0xC4, len(data)]) + data
+    if len(data) <= 0xFFFF:
+        return b"\xc5" + len(data).to_bytes(2, "big") + data
+    return b"\xc6" + len(data).to_bytes(4, "big") + data
+
+
+def make_upp(chained: bool, payload_size: int) -> bytes:
+    uuid = std_uuid.uuid4().bytes
+    payload = os.urandom(payload_size)
+    if chained:
+        head = b"\x96\x23" + encode_bin(uuid) + encode_bin(os.urandom(64))
+    else:
+        head = b"\x95\x22" + encode_bin(uuid)
+    return head + b"\x00" + encode_bin(payload) + encode_bin(os.urandom(64))
+
+
+def generate(n: int) -> list:
+    sizes = [32] * 90 + [200] * 5 + [300] * 4 + [70000]
+    return [make_upp(random.random() < 0.8, random.choice(sizes)) for _ in range(n)]
+
+
+def measure(function, upps: list) -> float:
+    t = time.perf_counter()
+    for upp in upps:
+        try:
+            function(upp)
+        except Exception:
+            pass  # the previous implementation fails for larger payloads
+    return time.perf_counter() - t
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", type=int, default=100000, help="number of generated UPPs")
+    parser.add_argument("--file", help="file with one hex encoded UPP per line")
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file) as f:
+            upps = [binascii.unhexlify(line.strip().split()[-1]) for line in f if line.strip()]
+    else:
+        upps = generate(args.n)
+    total = sum(len(upp) for upp in upps)
+    print("{} UPPs, {:.1f} MB".format(len(upps), total / 1e6))
+
+    legacy_wrong = 0
+    for upp in upps:
+        expected = parse_upp(upp)
+        decoded = decode_upp(upp)
+        assert decoded.uuid == expected['uuid'].bytes and decoded.payload == expected['payload']
+        assert decoded.prev_signature == expected['prev_signature'] and decoded.signature == expected['signature']
+        assert decoded.type == expected['type'] and decoded.signed == expected['signed']
+        try:
+            legacy_wrong += get_upp_payload_legacy(upp) != expected['payload']
+        except Exception:
+            legacy_wrong += 1
+    print("previous implementation: wrong payload for {} UPPs".format(legacy_wrong))
+
+    print("\n{:32s} {:>10s} {:>12s}".format("decoder", "time [s]", "UPPs/s"))
+    for name, function in (("get_upp_payload (previous)", get_upp_payload_legacy),
+                           ("decode_upp", decode_upp),
+                           ("decode_upp + copy of payload", lambda upp: bytes(decode_upp(upp).payload))):
+        t = measure(function, upps)
+        print("{:32s} {:10.3f} {:12.0f}".format(name, t, len(upps) / t))
+
+
+if __name__ == '__main__':
+    main()
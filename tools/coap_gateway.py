@@ -0,0 +1,253 @@
+"""
+CoAP gateway for the ubirch testkit (host side, CPython).
+
+Receives the CoAP requests of testkits using the "coap" transport and forwards them
+via HTTPS to the ubirch backend services (or to local stand-ins of them), then returns
+the backend responses as CoAP responses. Handles confirmable messages with duplicate
+detection, separate responses for slow upstream requests and block-wise transfers.
+
+usage: python3 tools/coap_gateway.py [--port 5683] [--env prod]
+                                     [--niomon URL] [--data URL] [--data-msgpack URL] [--bootstrap URL]
+                                     [--identity URL]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import urllib.error
+import urllib.request
+import uuid as std_uuid
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src", "lib"))
+
+import coap
+from ubirch.ubirch_api import COAP_PATHS, COAP_OPTION_HARDWARE_ID, COAP_OPTION_CREDENTIAL, COAP_OPTION_IMSI, \
+    SERVICE_NIOMON, SERVICE_DATA, SERVICE_DATA_MSGPACK, SERVICE_BOOTSTRAP, SERVICE_IDENTITY
+
+NIOMON_SERVICE = "https://niomon.{}.ubirch.com"
+DATA_SERVICE = "https://data.{}.ubirch.com/v1/json"
+DATA_MSGPACK_SERVICE = "https://data.{}.ubirch.com/v1/msgPack"
+BOOTSTRAP_SERVICE = "https://api.console.{}.ubirch.com/ubirch-web-ui/api/v1/devices/bootstrap"
+IDENTITY_SERVICE = "https://identity.{}.ubirch.com/api/certs/v1/csr/register"
+
+CONTENT_TYPES = {
+    coap.FORMAT_JSON: "application/json",
+    coap.FORMAT_OCTET_STREAM: "application/octet-stream"
+}
+
+SEPARATE_RESPONSE_DELAY = 1.0  # send an empty ACK if the upstream takes longer than this
+EXCHANGE_LIFETIME = 247  # seconds to remember responses for duplicate detection (RFC 7252, 4.8.2)
+UPSTREAM_TIMEOUT = 30
+
+
+def http_to_coap_code(status: int, method: int) -> int:
+    """
+    Map a HTTP status code to the equivalent CoAP response code.
+    """
+    if 200 <= status < 300:
+        if status == 201:
+            return (2 << 5) | 1  # 2.01 Created
+        return (2 << 5) | (5 if method == coap.CODE_GET else 4)  # 2.05 Content / 2.04 Changed
+    code_class, detail = status // 100, status % 100
+    if code_class in (4, 5):
+        return (code_class << 5) | (detail if detail < 32 else 0)
+    return (5 << 5) | 2  # 5.02 Bad Gateway
+
+
+class CoAPGateway(asyncio.DatagramProtocol):
+
+    def __init__(self, upstream: dict, block_size: int = coap.DEFAULT_BLOCK_SIZE):
+        """
+        :param upstream: the upstream URL for each ubirch service (SERVICE_*)
+        :param block_size: the block size for block-wise responses
+        """
+        self.upstream = upstream
+        self.block_size = block_size
+        self.services = {path: service for service, path in COAP_PATHS.items()}
+        self.transport = None
+        self.message_id = 0
+        self.responses = {}  # (addr, mid) -> (time, encoded response), for duplicate detection
+        self.pending = {}  # (addr, mid) -> whether an empty ACK was sent
+        self.uploads = {}  # (addr, token) -> received Block1 payload
+        self.downloads = {}  # (addr, token) -> response code, complete Block2 payload
+
+        # statistics
+        self.requests_received = 0
+        self.requests_forwarded = 0
+        self.duplicates = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def _next_message_id(self) -> int:
+        self.message_id = (self.message_id + 1) & 0xFFFF
+        return self.message_id
+
+    def datagram_received(self, data, addr):
+        try:
+            msg_type, code, mid, token, options, payload = coap.decode_message(data)
+        except ValueError:
+            return
+        if msg_type not in (coap.TYPE_CON, coap.TYPE_NON) or not 1 <= code < 32:
+            return  # ACKs/RSTs for separate responses and non-request messages
+        self.requests_received += 1
+
+        key = (addr, mid)
+        if key in self.responses:
+            self.duplicates += 1
+            self.transport.sendto(self.responses[key][1], addr)
+            return
+        if key in self.pending:
+            self.duplicates += 1
+            if not self.pending[key]:
+                self.pending[key] = True
+                self.transport.sendto(coap.encode_message(coap.TYPE_ACK, coap.CODE_EMPTY, mid), addr)
+            return
+        self.pending[key] = False
+        asyncio.ensure_future(self._handle(addr, msg_type, code, mid, token, options, payload))
+
+    async def _handle(self, addr, msg_type, code, mid, token, options, payload):
+        loop = asyncio.get_event_loop()
+        key = (addr, mid)
+        resp_options = []
+        path = "/".join(value.decode() for number, value in options if number == coap.OPTION_URI_PATH)
+        service = self.services.get(path)
+
+        block1 = coap.get_option(options, coap.OPTION_BLOCK1)
+        block2 = coap.get_option(options, coap.OPTION_BLOCK2)
+        if service is None:
+            resp_code, body = (4 << 5) | 4, b""  # 4.04 Not Found
+        elif block2 is not None and coap.decode_block(block2)[0] > 0 and (addr, token) in self.downloads:
+            # follow-up request for the next block of a block-wise response
+            num, _, size = coap.decode_block(block2)
+            resp_code, content = self.downloads[(addr, token)]
+            body = content[num * size:(num + 1) * size]
+            more = (num + 1) * size < len(content)
+            resp_options.append((coap.OPTION_BLOCK2, coap.encode_block(num, more, size)))
+            if not more:
+                del self.downloads[(addr, token)]
+        elif block1 is not None and self._collect_block(addr, token, block1, payload):
+            # intermediate block of a block-wise request
+            resp_code, body = coap.CODE_CONTINUE, b""
+            resp_options.append((coap.OPTION_BLOCK1, block1))
+        else:
+            if block1 is not None:
+                payload = bytes(self.uploads.pop((addr, token)))
+                resp_options.append((coap.OPTION_BLOCK1, block1))
+            self.requests_forwarded += 1
+            forward = loop.run_in_executor(None, self.forward, code, service, options, payload)
+            try:
+                status, body = await asyncio.wait_for(asyncio.shield(forward), SEPARATE_RESPONSE_DELAY)
+            except asyncio.TimeoutError:
+                if msg_type == coap.TYPE_CON and not self.pending.get(key):
+                    self.pending[key] = True
+                    self.transport.sendto(coap.encode_message(coap.TYPE_ACK, coap.CODE_EMPTY, mid), addr)
+                status, body = await forward
+            resp_code = http_to_coap_code(status, code)
+            size = self.block_size
+            if block2 is not None:
+                size = min(size, coap.decode_block(block2)[2])
+            if len(body) > size:
+                self.downloads[(addr, token)] = (resp_code, body)
+                resp_options.append((coap.OPTION_BLOCK2, coap.encode_block(0, True, size)))
+                body = body[:size]
+
+        if self.pending.pop(key, False) or msg_type == coap.TYPE_NON:
+            # separate response (the request was already acknowledged)
+            response = coap.encode_message(coap.TYPE_NON, resp_code, self._next_message_id(), token,
+                                           resp_options, body)
+        else:
+            response = coap.encode_message(coap.TYPE_ACK, resp_code, mid, token, resp_options, body)
+            self.responses[key] = (time.time(), response)
+        self.transport.sendto(response, addr)
+        self._expire()
+
+    def _collect_block(self, addr, token, block1: bytes, payload: bytes) -> bool:
+        """
+        Collect a block of a block-wise request.
+        :return: whether more blocks are expected
+        """
+        num, more, size = coap.decode_block(block1)
+        buf = self.uploads.setdefault((addr, token), bytearray())
+        del buf[num * size:]
+        buf.extend(payload)
+        return more
+
+    def _expire(self):
+        now = time.time()
+        for key in [k for k, (t, _) in self.responses.items() if now - t > EXCHANGE_LIFETIME]:
+            del self.responses[key]
+
+    def forward(self, code: int, service: str, options: list, payload: bytes) -> (int, bytes):
+        """
+        Forward a request to the upstream ubirch service (blocking, runs in the executor).
+        :return: the HTTP status code, the response body
+        """
+        headers = {}
+        for number, value in options:
+            if number == COAP_OPTION_HARDWARE_ID:
+                headers['X-Ubirch-Hardware-Id'] = str(std_uuid.UUID(bytes=value))
+            elif number == COAP_OPTION_CREDENTIAL:
+                headers['X-Ubirch-Credential'] = value.decode()
+                headers['X-Ubirch-Auth-Type'] = 'ubirch'
+            elif number == COAP_OPTION_IMSI:
+                headers['X-Ubirch-IMSI'] = value.decode()
+            elif number == coap.OPTION_CONTENT_FORMAT:
+                headers['Content-Type'] = CONTENT_TYPES.get(coap.decode_uint(value), "application/octet-stream")
+
+        method = "GET" if code == coap.CODE_GET else "POST"
+        req = urllib.request.Request(self.upstream[service], data=payload if method == "POST" else None,
+                                     headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(req, timeout=UPSTREAM_TIMEOUT) as r:
+                return r.status, r.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+        except Exception as e:
+            print("!! forwarding to {} failed: {}".format(self.upstream[service], e))
+            return 502, b""
+
+
+def get_upstream(env: str = "prod", niomon: str = None, data: str = None, bootstrap: str = None,
+                 identity: str = None, data_msgpack: str = None) -> dict:
+    return {
+        SERVICE_NIOMON: niomon or NIOMON_SERVICE.format(env),
+        SERVICE_DATA: data or DATA_SERVICE.format(env),
+        SERVICE_DATA_MSGPACK: data_msgpack or DATA_MSGPACK_SERVICE.format(env),
+        SERVICE_BOOTSTRAP: bootstrap or BOOTSTRAP_SERVICE.format(env),
+        SERVICE_IDENTITY: identity or IDENTITY_SERVICE.format(env)
+    }
+
+
+async def start_gateway(upstream: dict, host: str = "0.0.0.0", port: int = coap.DEFAULT_PORT,
+                        block_size: int = coap.DEFAULT_BLOCK_SIZE) -> (asyncio.DatagramTransport, CoAPGateway):
+    loop = asyncio.get_event_loop()
+    return await loop.create_datagram_endpoint(lambda: CoAPGateway(upstream, block_size), local_addr=(host, port))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CoAP gateway forwarding testkit requests to the ubirch backend")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=coap.DEFAULT_PORT)
+    parser.add_argument("--env", default="prod", help="ubirch backend environment (dev, demo, prod)")
+    parser.add_argument("--niomon", help="authentication service URL")
+    parser.add_argument("--data", help="data service URL (JSON endpoint)")
+    parser.add_argument("--data-msgpack", help="data service URL (msgpack endpoint)")
+    parser.add_argument("--bootstrap", help="bootstrap service URL")
+    parser.add_argument("--identity", help="identity service URL")
+    parser.add_argument("--block-size", type=int, default=coap.DEFAULT_BLOCK_SIZE)
+    args = parser.parse_args()
+
+    upstream = get_upstream(args.env, args.niomon, args.data, args.bootstrap, args.identity, args.data_msgpack)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(start_gateway(upstream, args.host, args.port, args.block_size))
+    print("CoAP gateway listening on {}:{}".format(args.host, args.port))
+    for service, url in upstream.items():
+        print("\t{:10s} -> {}".format(COAP_PATHS[service], url))
+    loop.run_forever()
+
+
+if __name__ == '__main__':
+    main()
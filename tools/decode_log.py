@@ -0,0 +1,86 @@
+"""
+Decoder for the binary ring log of the testkit (host side, CPython).
+
+Reads the log segments log0.bin ... log3.bin written by error_handling.FileLogger, orders them
+by their sequence number and prints the records as text, oldest first.
+
+usage: python3 tools/decode_log.py [directory or segment files ...] [--utc]
+"""
+import argparse
+import os
+import struct
+import sys
+import time
+
+LOG_SEGMENTS = 4
+LOG_MAGIC = b"ULG1"
+LOG_HEADER_SIZE = 8
+LOG_RECORD_HEADER = ">IBHB"
+LOG_RECORD_HEADER_SIZE = struct.calcsize(LOG_RECORD_HEADER)
+
+SEVERITIES = {1: "INFO", 2: "WARNING", 3: "ERROR", 4: "FATAL"}
+
+
+def read_segments(paths: list) -> list:
+    """
+    Read the log segments.
+    :return: a list of (sequence number, path, content) tuples, ordered by the sequence number
+    """
+    segments = []
+    for path in paths:
+        with open(path, "rb") as f:
+            content = f.read()
+        if len(content) < LOG_HEADER_SIZE or content[:4] != LOG_MAGIC:
+            print("!! {} is not a log segment, skipping it".format(path), file=sys.stderr)
+            continue
+        segments.append((struct.unpack(">I", content[4:8])[0], path, content))
+    return sorted(segments)
+
+
+def decode_records(content: bytes):
+    """
+    Decode the records of a segment.
+    :return: a generator of (timestamp, severity, code, payload) tuples
+    """
+    idx = LOG_HEADER_SIZE
+    while idx + LOG_RECORD_HEADER_SIZE <= len(content):
+        timestamp, severity, code, length = struct.unpack_from(LOG_RECORD_HEADER, content, idx)
+        idx += LOG_RECORD_HEADER_SIZE
+        if idx + length > len(content):
+            raise ValueError("truncated record at offset {}".format(idx - LOG_RECORD_HEADER_SIZE))
+        yield timestamp, severity, code, content[idx:idx + length]
+        idx += length
+
+
+def format_record(timestamp: int, severity: int, code: int, payload: bytes, utc: bool) -> str:
+    t = time.gmtime(timestamp) if utc else time.localtime(timestamp)
+    text = payload.decode(errors="replace").rstrip("\n")
+    return "({:04d}.{:02d}.{:02d} {:02d}:{:02d}:{:02d}) {:7s} {}{}".format(
+        t[0], t[1], t[2], t[3], t[4], t[5], SEVERITIES.get(severity, str(severity)),
+        "[{}] ".format(code) if code else "", text.replace("\n", "\n" + " " * 30))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", default=["."], help="directory with the log segments or segment files")
+    parser.add_argument("--utc", action="store_true", help="print the timestamps in UTC instead of local time")
+    args = parser.parse_args()
+
+    paths = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            paths.extend(os.path.join(path, "log{}.bin".format(i)) for i in range(LOG_SEGMENTS)
+                         if os.path.exists(os.path.join(path, "log{}.bin".format(i))))
+        else:
+            paths.append(path)
+
+    for sequence, path, content in read_segments(paths):
+        try:
+            for record in decode_records(content):
+                print(format_record(*record, utc=args.utc))
+        except ValueError as e:
+            print("!! {}: {}".format(path, e), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
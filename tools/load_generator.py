@@ -0,0 +1,206 @@
+"""
+Fleet load generator (host side, CPython).
+
+Runs N simulated testkits against a ubirch backend (by default an in-process instance of
+mock_backend.py). Every device executes the cycle of main.py with the testkit client code:
+sensor data -> pack_data_json -> emulated SIM signing (chained UPP) -> API.send_data and
+API.send_upp, waking up every `interval` seconds. Wake-ups can be synchronized at the
+interval boundaries or spread with a random phase and jitter, and a network outage can be
+simulated, after which all devices upload their backlog of UPPs at once (thundering herd).
+
+Reports latency percentiles, status codes and error rates per request type and the request rate.
+
+usage: python3 tools/load_generator.py [-n 50] [--interval 60] [--jitter 5] [--duration 300]
+                                       [--phase sync|random] [--outage-at 60 --outage-for 120]
+                                       [--backend-url URL --password PW]
+                                       [--mock-latency 0.2] [--mock-rate 20] [--mock-unavailable 0.01]
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import random
+import sys
+import threading
+import time
+import uuid as std_uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src", "lib"))
+
+import ubirch
+from mock_backend import MockBackend
+from serialize import serialize_json
+
+MSG_TYPE = 1
+
+
+def pack_data_json(uuid: std_uuid.UUID, data: dict) -> bytes:
+    """Same message as helpers.pack_data_json (the helpers module needs the pycom firmware)."""
+    return serialize_json({'uuid': str(uuid), 'msg_type': MSG_TYPE, 'timestamp': int(time.time()), 'data': data})
+
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+class Stats:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}  # request type -> list of latencies
+        self.statuses = {}  # request type -> {status or error: count}
+        self.requests = 0
+        self.suppressed = 0  # requests not sent because of the simulated outage
+
+    def record(self, kind: str, latency: float, status, request: bool = True):
+        with self.lock:
+            if request:
+                self.requests += 1
+            self.latencies.setdefault(kind, []).append(latency)
+            counts = self.statuses.setdefault(kind, {})
+            counts[status] = counts.get(status, 0) + 1
+
+    def report(self, elapsed: float):
+        print("\n{:10s} {:>7s} {:>8s} {:>8s} {:>8s} {:>8s} {:>7s}  {}".format(
+            "request", "count", "p50 [s]", "p90 [s]", "p99 [s]", "max [s]", "errors", "status codes"))
+        for kind in sorted(self.latencies):
+            lat = self.latencies[kind]
+            counts = self.statuses[kind]
+            errors = sum(c for s, c in counts.items() if not (isinstance(s, int) and 200 <= s < 300))
+            print("{:10s} {:7d} {:8.3f} {:8.3f} {:8.3f} {:8.3f} {:6.1f}%  {}".format(
+                kind, len(lat), percentile(lat, 50), percentile(lat, 90), percentile(lat, 99), max(lat),
+                100.0 * errors / len(lat), counts))
+        print("\n{} requests in {:.1f} s: {:.2f} requests/s, {} requests suppressed by the outage".format(
+            self.requests, elapsed, self.requests / elapsed, self.suppressed))
+
+
+class SimulatedDevice:
+
+    def __init__(self, index: int, api: ubirch.API, sign_time: float):
+        self.index = index
+        self.api = api
+        self.sign_time = sign_time
+        self.uuid = std_uuid.UUID(int=(0x5122 << 112) | index)
+        self.prev_signature = bytes(64)
+        self.backlog = []  # UPPs which still need to be sent
+        self.temperature = random.uniform(15, 25)
+
+    def measure(self) -> dict:
+        self.temperature += random.gauss(0, 0.1)
+        return {
+            "AccX": random.gauss(0, 0.01), "AccY": random.gauss(0, 0.01), "AccZ": random.gauss(1, 0.01),
+            "AccRoll": random.gauss(0, 1), "AccPitch": random.gauss(0, 1),
+            "V": random.uniform(4.0, 4.2), "L_blue": random.randint(0, 500), "L_red": random.randint(0, 500),
+            "T": self.temperature, "P": random.gauss(101325, 50), "H": random.uniform(30, 60)
+        }
+
+    def sign(self, message: bytes) -> bytes:
+        """Emulate SIM signing: a chained UPP with the hash of the message and a random signature."""
+        if self.sign_time > 0:
+            time.sleep(self.sign_time)
+        signature = os.urandom(64)
+        upp = b"\x96\x23\xc4\x10" + self.uuid.bytes + b"\xc4\x40" + self.prev_signature + b"\x00\xc4\x20" \
+              + hashlib.sha256(message).digest() + b"\xc4\x40" + signature
+        self.prev_signature = signature
+        return upp
+
+    def _send(self, stats: Stats, kind: str, function, *args):
+        t = time.perf_counter()
+        try:
+            result = function(*args)
+        except Exception as e:
+            stats.record(kind, time.perf_counter() - t, type(e).__name__)
+            return None
+        stats.record(kind, time.perf_counter() - t, result[0] if kind != "upps" else 200)
+        return result
+
+    def cycle(self, stats: Stats, network_up: bool):
+        """One wake-up cycle of main.py (blocking, runs in the thread pool)."""
+        message = pack_data_json(self.uuid, self.measure())
+        self.backlog.append(self.sign(message))
+        if not network_up:
+            with stats.lock:
+                stats.suppressed += 2
+            return
+
+        self._send(stats, "data", self.api.send_data, self.uuid, message)
+        if len(self.backlog) == 1:
+            result = self._send(stats, "upp", self.api.send_upp, self.uuid, self.backlog[0])
+            if result is not None and 200 <= result[0] < 300:
+                self.backlog = []
+        else:
+            results = self._send(stats, "upps", self.api.send_upps, self.uuid, self.backlog)
+            if results is not None:
+                for status in [r[0] if r is not None else "unanswered" for r in results]:
+                    stats.record("upps/item", 0.0, status, request=False)
+                self.backlog = [upp for upp, r in zip(self.backlog, results) if r is None or not 200 <= r[0] < 300]
+
+
+async def run_device(device: SimulatedDevice, stats: Stats, executor, start: float, args):
+    loop = asyncio.get_running_loop()
+    phase = 0.0 if args.phase == "sync" else random.uniform(0, args.interval)
+    cycle = 0
+    while True:
+        wake = start + phase + cycle * args.interval + random.uniform(0, args.jitter)
+        if wake - start >= args.duration:
+            return
+        await asyncio.sleep(max(0.0, wake - time.time()))
+        network_up = not (args.outage_at <= time.time() - start < args.outage_at + args.outage_for)
+        await loop.run_in_executor(executor, device.cycle, stats, network_up)
+        cycle += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--devices", type=int, default=50, help="number of simulated devices")
+    parser.add_argument("--interval", type=float, default=60, help="measure interval in seconds")
+    parser.add_argument("--jitter", type=float, default=0, help="random wake-up delay in seconds")
+    parser.add_argument("--phase", choices=["sync", "random"], default="sync",
+                        help="wake up at the interval boundaries (sync) or with a random phase")
+    parser.add_argument("--duration", type=float, default=300, help="test duration in seconds")
+    parser.add_argument("--sign-time", type=float, default=0, help="emulated SIM signing time in seconds")
+    parser.add_argument("--outage-at", type=float, default=float("inf"), help="start of a network outage")
+    parser.add_argument("--outage-for", type=float, default=0, help="duration of the network outage")
+    parser.add_argument("--workers", type=int, default=0, help="size of the thread pool (default: devices)")
+    parser.add_argument("--backend-url", help="base URL of a running mock backend (default: in-process mock)")
+    parser.add_argument("--password", default="secret", help="auth token for the backend")
+    parser.add_argument("--mock-latency", type=float, default=0.1, help="latency of the in-process mock")
+    parser.add_argument("--mock-jitter", type=float, default=0.05, help="latency jitter of the in-process mock")
+    parser.add_argument("--mock-rate", type=float, default=0, help="request rate limit of the in-process mock")
+    parser.add_argument("--mock-unavailable", type=float, default=0, help="503 probability of the in-process mock")
+    args = parser.parse_args()
+
+    backend = None
+    if args.backend_url is None:
+        backend = MockBackend(password=args.password, latency=args.mock_latency, latency_jitter=args.mock_jitter,
+                              rate=args.mock_rate, unavailable=args.mock_unavailable)
+        backend.start()
+        cfg = backend.config()
+    else:
+        url = args.backend_url.rstrip("/")
+        cfg = {'debug': False, 'env': "dev", 'password': args.password, 'transport': "http",
+               'niomon': url + "/niomon", 'data': url + "/data/v1", 'bootstrap': url + "/bootstrap",
+               'identity': url + "/identity"}
+
+    stats = Stats()
+    devices = [SimulatedDevice(i, ubirch.API(cfg), args.sign_time) for i in range(args.devices)]
+    executor = ThreadPoolExecutor(max_workers=args.workers or args.devices)
+    print("running {} devices for {} s against {}".format(args.devices, args.duration, cfg['niomon']))
+
+    async def run_fleet():
+        await asyncio.gather(*[run_device(d, stats, executor, start, args) for d in devices])
+
+    start = time.time()
+    asyncio.run(run_fleet())
+    stats.report(time.time() - start)
+    executor.shutdown()
+    if backend is not None:
+        backend.stop()
+
+
+if __name__ == '__main__':
+    main()
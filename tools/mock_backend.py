@@ -0,0 +1,495 @@
+"""
+Local stand-in of the ubirch backend services for end-to-end and performance tests (host side, CPython).
+
+Implements the endpoints used by the testkit:
+    GET  /bootstrap     SIM bootstrapping, returns the PIN for the IMSI (X-Ubirch-IMSI)
+    POST /identity      X.509 CSR registration (DER)
+    POST /data/v1/json  JSON data messages
+    POST /data/v1/msgPack  msgpack data messages
+    POST /niomon        UPPs, checks the structure, the chain and (with the `cryptography`
+                        package and a registered CSR) the signature
+
+with the auth token check, configurable latencies, throttling (429) and random
+unavailability (503) and optional TLS. All requests are captured for assertions.
+
+Used as a library:
+
+    backend = MockBackend(password="secret", latency=0.2)
+    backend.start()
+    api = ubirch.API(backend.config())
+    ...
+    assert backend.captured[-1].status == 200
+    backend.stop()
+
+or from the command line:
+
+usage: python3 tools/mock_backend.py [--port 8080] [--password secret] [--latency 0.2]
+                                     [--rate 10] [--unavailable 0.01] [--tls-cert cert.pem --tls-key key.pem]
+"""
+import argparse
+import base64
+import hashlib
+import json
+import random
+import ssl
+import struct
+import threading
+import time
+import uuid as std_uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SERVICE_NIOMON = "niomon"
+SERVICE_DATA = "data"
+SERVICE_DATA_MSGPACK = "data_msgpack"
+SERVICE_BOOTSTRAP = "bootstrap"
+SERVICE_IDENTITY = "identity"
+
+PATHS = {
+    "/niomon": SERVICE_NIOMON,
+    "/data/v1/json": SERVICE_DATA,
+    "/data/v1/msgPack": SERVICE_DATA_MSGPACK,
+    "/bootstrap": SERVICE_BOOTSTRAP,
+    "/identity": SERVICE_IDENTITY,
+}
+
+UPP_SIGNED = 0x22
+UPP_CHAINED = 0x23
+
+
+class CapturedRequest:
+
+    def __init__(self, service: str, method: str, path: str, headers, body: bytes):
+        self.time = time.time()
+        self.service = service
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+        self.status = None
+        self.response = b""
+        self.latency = 0.0  # time to respond in seconds, including the simulated latency
+
+    def __repr__(self):
+        return "<{} {} {} -> {}>".format(self.method, self.path, len(self.body), self.status)
+
+
+class TokenBucket:
+    """Throttles to `rate` requests per second with bursts of up to `burst` requests."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+def _read_bin(data: bytes, idx: int) -> (bytes, int):
+    """Read a msgpack bin (or str) field."""
+    t = data[idx]
+    if t in (0xC4, 0xD9):
+        length, idx = data[idx + 1], idx + 2
+    elif t in (0xC5, 0xDA):
+        length, idx = int.from_bytes(data[idx + 1:idx + 3], "big"), idx + 3
+    elif t in (0xC6, 0xDB):
+        length, idx = int.from_bytes(data[idx + 1:idx + 5], "big"), idx + 5
+    elif 0xA0 <= t <= 0xBF:
+        length, idx = t & 0x1F, idx + 1
+    else:
+        raise ValueError("expected bin at {}, got 0x{:02X}".format(idx, t))
+    if idx + length > len(data):
+        raise ValueError("truncated bin at {}".format(idx))
+    return data[idx:idx + length], idx + length
+
+
+def _read_int(data: bytes, idx: int) -> (int, int):
+    t = data[idx]
+    if t <= 0x7F:
+        return t, idx + 1
+    if t == 0xCC:
+        return data[idx + 1], idx + 2
+    if t == 0xCD:
+        return int.from_bytes(data[idx + 1:idx + 3], "big"), idx + 3
+    raise ValueError("expected int at {}, got 0x{:02X}".format(idx, t))
+
+
+def unpack_msgpack(data: bytes, idx: int = 0):
+    """
+    Decode a msgpack value (without extension types).
+    Throws ValueError if the data is malformed.
+    :return: the value, the index after the value
+    """
+    if idx >= len(data):
+        raise ValueError("truncated msgpack at {}".format(idx))
+    t = data[idx]
+    if t <= 0x7F or t >= 0xE0:
+        return t - 0x100 if t >= 0xE0 else t, idx + 1
+    if 0x80 <= t <= 0x8F or t in (0xDE, 0xDF):
+        length, idx = _read_length(data, idx, 0x8F, 0xDE)
+        value = {}
+        for _ in range(length):
+            key, idx = unpack_msgpack(data, idx)
+            value[key], idx = unpack_msgpack(data, idx)
+        return value, idx
+    if 0x90 <= t <= 0x9F or t in (0xDC, 0xDD):
+        length, idx = _read_length(data, idx, 0x9F, 0xDC)
+        value = []
+        for _ in range(length):
+            item, idx = unpack_msgpack(data, idx)
+            value.append(item)
+        return value, idx
+    if 0xA0 <= t <= 0xBF or t in (0xD9, 0xDA, 0xDB):
+        value, idx = _read_bin(data, idx)
+        return value.decode(), idx
+    if t in (0xC4, 0xC5, 0xC6):
+        return _read_bin(data, idx)
+    if t in (0xC0, 0xC2, 0xC3):
+        return {0xC0: None, 0xC2: False, 0xC3: True}[t], idx + 1
+    formats = {0xCA: ">f", 0xCB: ">d", 0xCC: ">B", 0xCD: ">H", 0xCE: ">I", 0xCF: ">Q",
+               0xD0: ">b", 0xD1: ">h", 0xD2: ">i", 0xD3: ">q"}
+    if t not in formats:
+        raise ValueError("unsupported msgpack type 0x{:02X} at {}".format(t, idx))
+    size = struct.calcsize(formats[t])
+    if idx + 1 + size > len(data):
+        raise ValueError("truncated msgpack at {}".format(idx))
+    return struct.unpack_from(formats[t], data, idx + 1)[0], idx + 1 + size
+
+
+def _read_length(data: bytes, idx: int, fix_max: int, type16: int) -> (int, int):
+    t = data[idx]
+    if t <= fix_max:
+        return t & 0x0F, idx + 1
+    if t == type16:
+        return int.from_bytes(data[idx + 1:idx + 3], "big"), idx + 3
+    return int.from_bytes(data[idx + 1:idx + 5], "big"), idx + 5
+
+
+def parse_upp(upp: bytes) -> dict:
+    """
+    Parse a signed or chained UPP.
+    Throws ValueError if the UPP is malformed.
+    :return: dict with version, uuid, prev_signature, type, payload, signature and the signed part
+    """
+    if len(upp) < 2:
+        raise ValueError("UPP too short")
+    if upp[0] == 0x95 and upp[1] == UPP_SIGNED:
+        chained = False
+    elif upp[0] == 0x96 and upp[1] == UPP_CHAINED:
+        chained = True
+    else:
+        raise ValueError("not a UPP")
+    uuid, idx = _read_bin(upp, 2)
+    if len(uuid) != 16:
+        raise ValueError("invalid UUID length {}".format(len(uuid)))
+    prev_signature = None
+    if chained:
+        prev_signature, idx = _read_bin(upp, idx)
+    payload_type, idx = _read_int(upp, idx)
+    payload, idx = _read_bin(upp, idx)
+    signed = upp[:idx]
+    signature, idx = _read_bin(upp, idx)
+    if idx != len(upp):
+        raise ValueError("trailing bytes after signature")
+    if len(signature) != 64:
+        raise ValueError("invalid signature length {}".format(len(signature)))
+    return {
+        'version': upp[1],
+        'uuid': std_uuid.UUID(bytes=uuid),
+        'prev_signature': prev_signature,
+        'type': payload_type,
+        'payload': payload,
+        'signature': signature,
+        'signed': signed
+    }
+
+
+class MockBackend:
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, password: str = "secret", pin: str = "1234",
+                 latency: float = 0.0, latency_jitter: float = 0.0, rate: float = 0, burst: int = 10,
+                 unavailable: float = 0.0, strict_chain: bool = True, tls_cert: str = None, tls_key: str = None):
+        """
+        :param password: the auth token the devices have to send
+        :param pin: the SIM PIN returned by the bootstrap service
+        :param latency: mean response latency in seconds
+        :param latency_jitter: standard deviation of the response latency in seconds
+        :param rate: maximal accepted requests per second (0: unlimited), excess requests get 429
+        :param burst: number of requests accepted in a burst above the rate
+        :param unavailable: probability of a 503 response
+        :param strict_chain: reject chained UPPs whose previous signature does not match with 409
+        :param tls_cert: certificate file (PEM) to serve HTTPS
+        :param tls_key: private key file (PEM) for the certificate
+        """
+        self.host = host
+        self.port = port
+        self.credential = base64.b64encode(password.encode()).decode()
+        self.pin = pin
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.throttle = TokenBucket(rate, burst) if rate > 0 else None
+        self.unavailable = unavailable
+        self.strict_chain = strict_chain
+        self.tls_cert = tls_cert
+        self.tls_key = tls_key
+
+        self.captured = []
+        self.lock = threading.Lock()
+        self.public_keys = {}  # UUID -> public key, from registered CSRs
+        self.last_signatures = {}  # UUID -> signature of the last accepted UPP
+        self.data_hashes = set()  # SHA-256 hashes of the received data messages
+        self.upp_hashes = set()  # hashes (payloads) of the accepted UPPs
+        self.server = None
+
+    @property
+    def url(self) -> str:
+        return "{}://{}:{}".format("https" if self.tls_cert else "http", self.host, self.server.server_port)
+
+    def config(self) -> dict:
+        """
+        Get a testkit configuration pointing to this backend, for ubirch.API.
+        """
+        return {
+            'debug': False,
+            'env': "dev",
+            'password': base64.b64decode(self.credential).decode(),
+            'transport': "http",
+            'niomon': self.url + "/niomon",
+            'data': self.url + "/data/v1",
+            'bootstrap': self.url + "/bootstrap",
+            'identity': self.url + "/identity"
+        }
+
+    def start(self):
+        backend = self
+
+        class Handler(MockBackendHandler):
+            pass
+
+        Handler.backend = backend
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        if self.tls_cert:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(self.tls_cert, self.tls_key)
+            self.server.socket = context.wrap_socket(self.server.socket, server_side=True)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def reset(self):
+        with self.lock:
+            self.captured = []
+
+    def requests_for(self, service: str) -> list:
+        return [r for r in self.captured if r.service == service]
+
+    def _delay(self):
+        if self.latency > 0 or self.latency_jitter > 0:
+            time.sleep(max(0.0, random.gauss(self.latency, self.latency_jitter)))
+
+    def handle(self, req: CapturedRequest) -> (int, bytes, dict):
+        """
+        Handle a request.
+        :return: the status code, the response body, additional response headers
+        """
+        if self.throttle is not None and not self.throttle.take():
+            return 429, b"Too Many Requests", {"Retry-After": "1"}
+        if self.unavailable > 0 and random.random() < self.unavailable:
+            return 503, b"Service Unavailable", {"Retry-After": "5"}
+
+        if req.service == SERVICE_IDENTITY:
+            return self._handle_csr(req)
+        if req.headers.get("X-Ubirch-Credential") != self.credential \
+                or req.headers.get("X-Ubirch-Auth-Type") != "ubirch":
+            return 401, b"Unauthorized", {}
+        if req.service == SERVICE_BOOTSTRAP:
+            return self._handle_bootstrap(req)
+        if req.service == SERVICE_DATA:
+            return self._handle_data(req)
+        if req.service == SERVICE_DATA_MSGPACK:
+            return self._handle_data_msgpack(req)
+        return self._handle_upp(req)
+
+    def _handle_bootstrap(self, req: CapturedRequest) -> (int, bytes, dict):
+        imsi = req.headers.get("X-Ubirch-IMSI")
+        if imsi is None or len(imsi) != 15 or not imsi.isdigit():
+            return 400, b"missing or invalid X-Ubirch-IMSI header", {}
+        return 200, json.dumps({"encrypted": False, "pin": self.pin}).encode(), {"Content-Type": "application/json"}
+
+    def _handle_csr(self, req: CapturedRequest) -> (int, bytes, dict):
+        if req.method != "POST" or len(req.body) < 2 or req.body[0] != 0x30:
+            return 400, b"invalid CSR", {}
+        try:
+            from cryptography import x509
+            from cryptography.x509.oid import NameOID
+            csr = x509.load_der_x509_csr(req.body)
+            if not csr.is_signature_valid:
+                return 400, b"invalid CSR signature", {}
+            cn = csr.subject.get_attributes_for_oid(NameOID.COMMON_NAME)[0].value
+            with self.lock:
+                self.public_keys[std_uuid.UUID(cn)] = csr.public_key()
+        except ImportError:
+            pass  # without the cryptography package CSRs are accepted unchecked
+        except ValueError as e:
+            return 400, "invalid CSR: {}".format(e).encode(), {}
+        return 200, b"", {}
+
+    def _handle_data(self, req: CapturedRequest) -> (int, bytes, dict):
+        try:
+            msg = json.loads(req.body)
+        except ValueError as e:
+            return 400, "invalid JSON: {}".format(e).encode(), {}
+        for key in ("uuid", "msg_type", "timestamp", "data"):
+            if key not in msg:
+                return 400, "missing key {}".format(key).encode(), {}
+        if msg["uuid"] != req.headers.get("X-Ubirch-Hardware-Id"):
+            return 400, b"UUID does not match X-Ubirch-Hardware-Id", {}
+        with self.lock:
+            self.data_hashes.add(hashlib.sha256(req.body).digest())
+        return 200, b"", {}
+
+    def _handle_data_msgpack(self, req: CapturedRequest) -> (int, bytes, dict):
+        try:
+            msg, idx = unpack_msgpack(req.body)
+            if idx != len(req.body):
+                raise ValueError("trailing bytes")
+        except (ValueError, UnicodeDecodeError) as e:
+            return 400, "invalid msgpack: {}".format(e).encode(), {}
+        if not isinstance(msg, dict):
+            return 400, b"message is not a map", {}
+        for key in ("uuid", "msg_type", "timestamp", "data"):
+            if key not in msg:
+                return 400, "missing key {}".format(key).encode(), {}
+        if not isinstance(msg["uuid"], bytes) or len(msg["uuid"]) != 16 \
+                or str(std_uuid.UUID(bytes=msg["uuid"])) != req.headers.get("X-Ubirch-Hardware-Id"):
+            return 400, b"UUID does not match X-Ubirch-Hardware-Id", {}
+        with self.lock:
+            self.data_hashes.add(hashlib.sha256(req.body).digest())
+        return 200, b"", {}
+
+    def _handle_upp(self, req: CapturedRequest) -> (int, bytes, dict):
+        try:
+            upp = parse_upp(req.body)
+        except (ValueError, IndexError) as e:
+            return 400, "invalid UPP: {}".format(e).encode(), {}
+        if str(upp['uuid']) != req.headers.get("X-Ubirch-Hardware-Id"):
+            return 400, b"UUID does not match X-Ubirch-Hardware-Id", {}
+
+        public_key = self.public_keys.get(upp['uuid'])
+        if public_key is not None:
+            from cryptography.exceptions import InvalidSignature
+            from cryptography.hazmat.primitives import hashes
+            from cryptography.hazmat.primitives.asymmetric import ec, utils
+            r = int.from_bytes(upp['signature'][:32], "big")
+            s = int.from_bytes(upp['signature'][32:], "big")
+            try:
+                public_key.verify(utils.encode_dss_signature(r, s), upp['signed'], ec.ECDSA(hashes.SHA256()))
+            except InvalidSignature:
+                return 400, b"invalid signature", {}
+
+        with self.lock:
+            if upp['payload'] in self.upp_hashes:
+                return 409, b"duplicate hash", {}
+            last = self.last_signatures.get(upp['uuid'])
+            if upp['prev_signature'] is not None and last is not None and upp['prev_signature'] != last \
+                    and self.strict_chain:
+                return 409, b"chain broken: previous signature does not match", {}
+            self.last_signatures[upp['uuid']] = upp['signature']
+            self.upp_hashes.add(upp['payload'])
+
+        # respond with a (dummy signed) UPP like niomon, referencing the request hash
+        response = b"\x96\x23\xc4\x10" + bytes(16) + b"\xc4\x40" + upp['signature'] + b"\x00\xc4\x10" \
+                   + hashlib.sha256(req.body).digest()[:16] + b"\xc4\x40" + bytes(64)
+        return 200, response, {"Content-Type": "application/octet-stream"}
+
+
+class MockBackendHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    backend = None
+
+    def _handle(self, method: str):
+        t = time.perf_counter()
+        backend = self.backend
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        path = self.path.split("?", 1)[0].rstrip("/")
+        req = CapturedRequest(PATHS.get(path), method, self.path, self.headers, body)
+        with backend.lock:
+            backend.captured.append(req)
+
+        backend._delay()
+        if req.service is None:
+            status, response, headers = 404, b"Not Found", {}
+        elif method == "GET" and req.service != SERVICE_BOOTSTRAP:
+            status, response, headers = 405, b"Method Not Allowed", {}
+        else:
+            status, response, headers = backend.handle(req)
+
+        req.status, req.response = status, response
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+        req.latency = time.perf_counter() - t
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="local stand-in of the ubirch backend services")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--password", default="secret", help="auth token the devices have to send")
+    parser.add_argument("--pin", default="1234", help="SIM PIN returned by the bootstrap service")
+    parser.add_argument("--latency", type=float, default=0.0, help="mean response latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="standard deviation of the latency")
+    parser.add_argument("--rate", type=float, default=0, help="accepted requests per second, 0: unlimited")
+    parser.add_argument("--burst", type=int, default=10, help="accepted burst size above the rate")
+    parser.add_argument("--unavailable", type=float, default=0.0, help="probability of a 503 response")
+    parser.add_argument("--lenient-chain", action="store_true", help="accept chained UPPs with chain gaps")
+    parser.add_argument("--tls-cert", help="certificate (PEM) to serve HTTPS")
+    parser.add_argument("--tls-key", help="private key (PEM) of the certificate")
+    args = parser.parse_args()
+
+    backend = MockBackend(args.host, args.port, args.password, args.pin, args.latency, args.jitter, args.rate,
+                          args.burst, args.unavailable, not args.lenient_chain, args.tls_cert, args.tls_key)
+    backend.start()
+    print("mock ubirch backend listening on {}".format(backend.url))
+    for path, service in PATHS.items():
+        print("\t{:10s} {}{}".format(service, backend.url, path))
+    try:
+        while True:
+            time.sleep(10)
+            statuses = {}
+            for r in backend.captured:
+                statuses[r.status] = statuses.get(r.status, 0) + 1
+            print("{} requests, status codes: {}".format(len(backend.captured), statuses))
+    except KeyboardInterrupt:
+        backend.stop()
+
+
+if __name__ == '__main__':
+    main()